@@ -0,0 +1,53 @@
+"""
+Benchmark decoding of a JSON-lines input stream.
+
+Compares ast.literal_eval (the old --jsonlines path) with LineDecoder
+on a synthetic stream from trials/Normal.py.  With --bins N, every line
+also gets t_low and t_bins lists of N bins (which LineDecoder turns
+into arrays).
+
+Run from the root directory of the package, e.g.,
+  python -m snewpdag.benchmarks.Decode -n 100000
+"""
+import sys, os, ast, json, argparse, subprocess, time
+
+import numpy as np
+
+from snewpdag.dag import LineDecoder
+
+def make_stream(number, bins):
+  script = os.path.join(os.path.dirname(__file__), '..', 'trials', 'Normal.py')
+  out = subprocess.run([ sys.executable, script, 'Control', '-n', str(number) ],
+                       stdout=subprocess.PIPE, check=True, text=True).stdout
+  lines = out.splitlines()
+  if bins > 0:
+    rng = np.random.default_rng(0)
+    t_low = [ 0.001 * i for i in range(bins) ]
+    for i in range(len(lines)):
+      d = json.loads(lines[i])
+      d['t_low'] = t_low
+      d['t_bins'] = rng.poisson(10.0, bins).tolist()
+      lines[i] = json.dumps(d)
+  return lines
+
+def measure(lines, decode):
+  t0 = time.perf_counter()
+  for line in lines:
+    decode(line)
+  t1 = time.perf_counter()
+  return len(lines) / (t1 - t0)
+
+def run():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--number', default=100000, help='number of lines')
+  parser.add_argument('--bins', default=0, help='number of t_bins per line')
+  args = parser.parse_args()
+
+  lines = make_stream(int(args.number), int(args.bins))
+  before = measure(lines, ast.literal_eval)
+  after = measure(lines, LineDecoder())
+  print('{0} lines: literal_eval {1:.0f} lines/s, LineDecoder {2:.0f} lines/s'.format(
+        len(lines), before, after))
+
+if __name__ == '__main__':
+  run()
@@ -0,0 +1,61 @@
+"""
+Benchmark alert dispatch through a configured DAG.
+
+Compares the recursive notify/update dispatch of plain Node dictionaries
+with the flat loop of a compiled Plan.  The input is the same stream of
+alert/reset pairs which trials/Simple.py generates.
+
+Run from the root directory of the package, e.g.,
+  python -m snewpdag.benchmarks.Dispatch -n 20 snewpdag/data/test-gen-config.py
+With --chain N, a chain of N pass-through nodes is used instead of a
+configuration file, which isolates the dispatch overhead.
+"""
+import sys, os, argparse, contextlib, time
+import logging
+
+from snewpdag.dag.app import read_config, configure
+
+def chain_specs(n):
+  specs = [ { 'name': 'Control', 'class': 'Pass', 'kwargs': { 'line': 0 } } ]
+  for i in range(n):
+    specs.append({ 'name': 'Pass{}'.format(i), 'class': 'Pass',
+                   'observe': [ specs[-1]['name'] ],
+                   'kwargs': { 'line': 0 } })
+  return specs
+
+def measure(nodespecs, name, number, plan):
+  dag = configure(nodespecs, plan=plan)
+  with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+    t0 = time.perf_counter()
+    for i in range(number):
+      for action in ('alert', 'reset'):
+        data = { 'action': action, 'id': i, 'name': name }
+        if plan:
+          dag.inject(data)
+        else:
+          dag[name].update(data)
+    t1 = time.perf_counter()
+  return number / (t1 - t0)
+
+def run():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('config', nargs='*', help='configuration py/json/csv files')
+  parser.add_argument('--name', default='Control', help='injection name')
+  parser.add_argument('-n', '--number', default=100, help='number of trials')
+  parser.add_argument('--chain', default=0, help='length of pass-through chain')
+  args = parser.parse_args()
+
+  number = int(args.number)
+  logging.disable(logging.CRITICAL) # don't time the error messages
+  configs = [ (c, read_config(c)) for c in args.config ]
+  if int(args.chain) > 0:
+    configs.append(('chain of {}'.format(args.chain),
+                    chain_specs(int(args.chain))))
+  for label, nodespecs in configs:
+    before = measure(nodespecs, args.name, number, False)
+    after = measure(nodespecs, args.name, number, True)
+    print('{0}: recursive {1:.1f} alerts/s, plan {2:.1f} alerts/s'.format(
+          label, before, after))
+
+if __name__ == '__main__':
+  run()
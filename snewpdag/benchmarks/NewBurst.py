@@ -0,0 +1,41 @@
+"""
+Benchmark the latency of making the DAG for a new burst.
+
+The first DAG is made with no shared resources loaded (so it pays for
+reading the template files), and the following ones share them.
+
+Run from the root directory of the package, e.g.,
+  python -m snewpdag.benchmarks.NewBurst -n 20 snewpdag/data/test-gen-config.py
+"""
+import argparse, time
+import logging
+
+from snewpdag.dag import Shared
+from snewpdag.dag.app import read_config, configure, find_class
+
+def measure(nodespecs, number):
+  for spec in nodespecs:
+    find_class(spec['class']) # don't time the imports
+  Shared.clear()
+  t0 = time.perf_counter()
+  configure(nodespecs, plan=True)
+  t1 = time.perf_counter()
+  for i in range(number):
+    configure(nodespecs, plan=True)
+  t2 = time.perf_counter()
+  return t1 - t0, (t2 - t1) / number
+
+def run():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('config', nargs='+', help='configuration py/json/csv files')
+  parser.add_argument('-n', '--number', default=20, help='number of new bursts')
+  args = parser.parse_args()
+
+  logging.disable(logging.CRITICAL)
+  for c in args.config:
+    first, rest = measure(read_config(c), int(args.number))
+    print('{0}: first burst {1:.2f} ms, later bursts {2:.2f} ms'.format(
+          c, first * 1000, rest * 1000))
+
+if __name__ == '__main__':
+  run()
@@ -0,0 +1,77 @@
+"""
+Benchmark the shape comparison histogram functions.
+
+Compares the numpy implementations in ShapeHistFunctions (fill_hist,
+diff_hist, minimise) with the original python ones, on normally
+distributed times, and a scan over --steps time offsets with one
+fill_hist per offset against scan_metric.
+
+Run from the root directory of the package, e.g.,
+  python -m snewpdag.benchmarks.ShapeHist -n 100000 --bins 1000
+"""
+import argparse, time
+
+import numpy as np
+
+from snewpdag.plugins import ShapeHistFunctions as SHF
+
+def measure(f, *args, trials=1):
+  t0 = time.perf_counter()
+  for i in range(trials):
+    r = f(*args)
+  t1 = time.perf_counter()
+  return r, (t1 - t0) / trials
+
+def run():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--number', default=100000, help='number of events')
+  parser.add_argument('--bins', default=1000, help='number of histogram bins')
+  parser.add_argument('--steps', default=2000, help='number of offsets in the scan')
+  args = parser.parse_args()
+  n = int(args.number)
+  bins = int(args.bins)
+
+  rng = np.random.default_rng(0)
+  values1 = rng.normal(0.02, 0.1, n).tolist()
+  values2 = rng.normal(0.0, 0.1, n).tolist()
+  h_low, h_up = -0.2, 0.3
+
+  h1, before = measure(SHF.fill_hist_py, bins, h_low, h_up, values1, 0.0)
+  h1np, after = measure(SHF.fill_hist, bins, h_low, h_up, values1, 0.0,
+                        trials=10)
+  assert h1np.tolist() == h1
+  print('fill_hist {0} events x {1} bins: python {2:.3f} s, numpy {3:.5f} s'.format(
+        n, bins, before, after))
+
+  h2 = SHF.fill_hist(bins, h_low, h_up, values2, 0.0).tolist()
+  m, before = measure(SHF.diff_hist_py, h1, h2, 5.0, trials=10)
+  mnp, after = measure(SHF.diff_hist, h1, h2, 5.0, trials=10)
+  assert m == mnp
+  print('diff_hist {0} bins: python {1:.6f} s, numpy {2:.6f} s'.format(
+        bins, before, after))
+
+  mlist = [ SHF.diff_hist(SHF.fill_hist(bins, h_low, h_up, values1,
+                                        -0.04 + i*0.0005)[1:-1],
+                          h2[1:-1], 5.0) for i in range(160) ]
+  dt, before = measure(SHF.minimise_py, mlist, -0.04, 0.0005, 160, 4, 0.01,
+                       trials=100)
+  dtnp, after = measure(SHF.minimise, mlist, -0.04, 0.0005, 160, 4, 0.01,
+                        trials=100)
+  assert dt == dtnp
+  print('minimise 160 steps: python {0:.6f} s, numpy {1:.6f} s'.format(
+        before, after))
+
+  steps = int(args.steps)
+  offsets = -0.04 + np.arange(steps) * (0.08 / steps)
+  def loop():
+    return [ SHF.diff_hist(SHF.fill_hist(bins, h_low, h_up, values1, dt)[1:-1],
+                           h2[1:-1], 5.0) for dt in offsets ]
+  m, before = measure(loop)
+  mnp, after = measure(SHF.scan_metric, bins, h_low, h_up, values1, h2[1:-1],
+                       offsets, 5.0)
+  assert mnp.tolist() == m
+  print('scan {0} offsets: fill_hist per offset {1:.3f} s, scan_metric {2:.3f} s'.format(
+        steps, before, after))
+
+if __name__ == '__main__':
+  run()
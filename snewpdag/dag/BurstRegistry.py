@@ -0,0 +1,138 @@
+"""
+BurstRegistry - a bounded pool of DAGs, one per burst identifier.
+
+The registry behaves like the dictionary of burst_id -> DAG used by
+app.inject(), but it can limit the number of live DAGs (least recently
+used ones are evicted first) and expire DAGs which haven't been used
+for a given time.
+
+An evicted DAG is either disposed (Node.dispose on every node), or, if
+there is room in the spare pool, recycled:  a 'reset' action is sent
+from each input node and the retained payloads are dropped, and the DAG
+is then handed out for the next new burst instead of constructing one.
+Note that this relies on the plugins' reset() clearing their state;
+plugins which deliberately accumulate over resets (e.g., for MC trials)
+will carry that over, so recycling is off by default.
+
+Counters:
+  hits - lookups of a live burst
+  constructions - DAGs built by the factory
+  recycles - DAGs reused from the spare pool
+  evictions - DAGs evicted (by size or age)
+"""
+import time
+import logging
+from collections import OrderedDict
+from collections.abc import Mapping
+
+class BurstRegistry(Mapping):
+
+  def __init__(self, factory, max_bursts=None, ttl=None, max_spares=0,
+               clock=time.monotonic):
+    """
+    factory:  function returning a new DAG (e.g., a configured Plan)
+    max_bursts:  maximum number of live DAGs, None for no limit
+    ttl:  seconds after its last use at which a DAG is evicted,
+          None for no limit
+    max_spares:  maximum number of evicted DAGs kept for reuse
+    clock:  function returning the current time in seconds
+    """
+    self.factory = factory
+    self.max_bursts = max_bursts
+    self.ttl = ttl
+    self.max_spares = max_spares
+    self.clock = clock
+    self.dags = OrderedDict() # burst_id -> DAG, least recently used first
+    self.last_used = {} # burst_id -> time
+    self.spares = []
+    self.hits = 0
+    self.constructions = 0
+    self.recycles = 0
+    self.evictions = 0
+
+  def __getitem__(self, burst_id):
+    return self.dags[burst_id]
+
+  def __iter__(self):
+    return iter(self.dags)
+
+  def __len__(self):
+    return len(self.dags)
+
+  def stats(self):
+    return {
+             'live': len(self.dags),
+             'spares': len(self.spares),
+             'hits': self.hits,
+             'constructions': self.constructions,
+             'recycles': self.recycles,
+             'evictions': self.evictions,
+           }
+
+  def acquire(self, burst_id):
+    """
+    Return the DAG for burst_id, making (or recycling) one if needed.
+    """
+    now = self.clock()
+    self.expire(now)
+    if burst_id in self.dags:
+      self.hits += 1
+      self.dags.move_to_end(burst_id)
+      self.last_used[burst_id] = now
+      return self.dags[burst_id]
+
+    if self.spares:
+      dag = self.spares.pop()
+      self.recycles += 1
+    else:
+      dag = self.factory()
+      self.constructions += 1
+    self.dags[burst_id] = dag
+    self.last_used[burst_id] = now
+    if self.max_bursts is not None:
+      while len(self.dags) > self.max_bursts:
+        self.evict(next(iter(self.dags)))
+    return dag
+
+  def expire(self, now=None):
+    """
+    Evict DAGs which haven't been used for longer than ttl.
+    """
+    if self.ttl is None:
+      return
+    if now is None:
+      now = self.clock()
+    while self.dags:
+      burst_id = next(iter(self.dags))
+      if now - self.last_used[burst_id] <= self.ttl:
+        break
+      self.evict(burst_id)
+
+  def evict(self, burst_id):
+    """
+    Remove the DAG for burst_id, and recycle or dispose of it.
+    """
+    dag = self.dags.pop(burst_id)
+    del self.last_used[burst_id]
+    self.evictions += 1
+    logging.debug('BurstRegistry: evicting burst %s', burst_id)
+    if len(self.spares) < self.max_spares:
+      self.recycle(dag)
+      self.spares.append(dag)
+    else:
+      for name in dag:
+        dag[name].dispose()
+
+  def recycle(self, dag):
+    """
+    Reset a DAG so it can be used for another burst.
+    """
+    for name in dag:
+      if len(dag[name].watch_list) == 0:
+        data = { 'name': name, 'action': 'reset' }
+        if hasattr(dag, 'inject'):
+          dag.inject(data)
+        else:
+          dag[name].update(data)
+    for name in dag:
+      dag[name].release()
@@ -0,0 +1,87 @@
+"""
+Executor - run independent calculations of a node concurrently.
+
+get_executor(kind, workers) gives a concurrent.futures executor for
+kind 'thread' or 'process' (None for 'serial', i.e., call directly).
+Executors are made once per process (see Shared), so all the nodes and
+burst DAGs asking for the same kind and number of workers use one pool.
+They are shut down by shutdown(), which is registered with atexit.
+
+Arrays for worker processes can be put in shared memory with SharedArray
+and passed by descriptor (name, shape, dtype) instead of being pickled.
+A worker gets the array back with attached(descriptor).
+"""
+import atexit
+import logging
+import contextlib
+import concurrent.futures
+from multiprocessing import shared_memory
+import numpy as np
+
+from snewpdag.dag.Shared import shared
+
+kinds = ('serial', 'thread', 'process')
+executors = [] # executors made by get_executor, to be shut down
+
+def get_executor(kind='serial', workers=None):
+  """
+  Executor for kind 'thread' or 'process' with up to workers workers
+  (None for the number of processors), or None for 'serial'.
+  """
+  if kind not in kinds:
+    logging.error('Unrecognized executor {}, using serial'.format(kind))
+    kind = 'serial'
+  if kind == 'serial':
+    return None
+  if kind == 'thread':
+    cls = concurrent.futures.ThreadPoolExecutor
+  else:
+    cls = concurrent.futures.ProcessPoolExecutor
+  def make():
+    ex = cls(max_workers=workers)
+    executors.append(ex)
+    return ex
+  return shared(('Executor', kind, workers), make)
+
+@atexit.register
+def shutdown():
+  """
+  Shut down all the executors made by get_executor.
+  """
+  while executors:
+    executors.pop().shutdown(wait=True)
+
+class SharedArray:
+  """
+  Copy of a numpy array in shared memory.  The owner calls release()
+  when it's no longer needed.
+  """
+  def __init__(self, a):
+    a = np.asarray(a)
+    self.shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+    self.array = np.ndarray(a.shape, dtype=a.dtype, buffer=self.shm.buf)
+    self.array[...] = a
+    self.desc = (self.shm.name, a.shape, a.dtype.str)
+
+  def release(self):
+    if self.shm is not None:
+      self.array = None
+      self.shm.close()
+      self.shm.unlink()
+      self.shm = None
+
+@contextlib.contextmanager
+def attached(desc):
+  """
+  Context in which the array described by desc (SharedArray.desc)
+  is attached from shared memory, read-only.
+  """
+  name, shape, dtype = desc
+  shm = shared_memory.SharedMemory(name=name)
+  try:
+    a = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    a.flags.writeable = False
+    yield a
+    del a
+  finally:
+    shm.close()
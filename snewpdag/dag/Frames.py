@@ -0,0 +1,128 @@
+"""
+Frames - binary transport format for input payloads.
+
+A stream of frames, one per payload.  Each frame is
+  b'SNPF'                 magic
+  header length, body length   (two little-endian uint32)
+  header                  JSON dictionary (utf-8)
+  body                    raw little-endian array data
+The header holds the non-array fields of the payload under 'fields', and
+the name, dtype, shape and body offset of each numpy array under 'arrays'.
+Each array starts on an 8-byte boundary of the body.
+
+Decoded arrays are read-only views into the frame (np.frombuffer),
+so reading a frame copies nothing beyond the read itself.
+
+Single payloads can also be stored in .npz files (read_npz, write_npz).
+Scalars (and strings) are stored there as 0-d arrays, and come back as
+python values.
+"""
+import json
+import struct
+import logging
+import numpy as np
+
+MAGIC = b'SNPF'
+_prefix = struct.Struct('<4sII')
+
+def _align(n):
+  return (n + 7) & ~7
+
+def _default(v):
+  # numpy scalars in the non-array fields
+  if isinstance(v, np.generic):
+    return v.item()
+  raise TypeError('Cannot encode {} in frame header'.format(type(v)))
+
+def encode_frame(data):
+  """
+  Encode a payload dictionary as a frame (bytes).
+  """
+  fields = {}
+  arrays = {}
+  chunks = []
+  offset = 0
+  for k, v in data.items():
+    if isinstance(v, np.ndarray):
+      if v.dtype.kind not in 'biufc':
+        logging.error('Frames: cannot encode array {} of dtype {}'.format(
+                      k, v.dtype))
+        continue
+      a = np.ascontiguousarray(v, dtype=v.dtype.newbyteorder('<'))
+      arrays[k] = [ a.dtype.str, list(a.shape), offset ]
+      b = a.tobytes()
+      pad = _align(len(b)) - len(b)
+      chunks.append(b)
+      chunks.append(b'\0' * pad)
+      offset += len(b) + pad
+    else:
+      fields[k] = v
+  header = json.dumps({ 'fields': fields, 'arrays': arrays },
+                      default=_default).encode('utf-8')
+  return _prefix.pack(MAGIC, len(header), offset) + header + b''.join(chunks)
+
+def decode_frame(header, body):
+  """
+  Decode the header (bytes) and body (bytes-like) of a frame.
+  """
+  h = json.loads(header)
+  data = h['fields']
+  for k, (dtype, shape, offset) in h['arrays'].items():
+    count = 1
+    for n in shape:
+      count *= n
+    a = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+    a = a.reshape(shape)
+    a.flags.writeable = False # (already, if body is bytes)
+    data[k] = a
+  return data
+
+def write_frame(f, data):
+  """
+  Write a payload as a frame to binary file f.
+  """
+  f.write(encode_frame(data))
+
+def read_frames(f):
+  """
+  Generator of the payloads in a stream of frames from binary file f.
+  """
+  while True:
+    prefix = f.read(_prefix.size)
+    if len(prefix) == 0:
+      return
+    if len(prefix) < _prefix.size:
+      logging.error('Frames: truncated frame')
+      return
+    magic, nheader, nbody = _prefix.unpack(prefix)
+    if magic != MAGIC:
+      logging.error('Frames: not a frame stream')
+      return
+    header = f.read(nheader)
+    body = f.read(nbody)
+    if len(header) < nheader or len(body) < nbody:
+      logging.error('Frames: truncated frame')
+      return
+    yield decode_frame(header, body)
+
+def write_npz(filename, data):
+  """
+  Write a payload to an .npz file.
+  """
+  np.savez(filename, **data)
+
+def read_npz(filename):
+  """
+  Read a payload from an .npz file.
+  0-d arrays are returned as python scalars, others are made read-only.
+  """
+  data = {}
+  with np.load(filename) as z:
+    for k in z.files:
+      a = z[k]
+      if a.ndim == 0:
+        data[k] = a.item()
+      else:
+        a.flags.writeable = False
+        data[k] = a
+  return data
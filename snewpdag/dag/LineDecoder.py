@@ -0,0 +1,69 @@
+"""
+LineDecoder - decode input data (e.g., one object per line).
+
+Strict JSON is decoded with the json module, which is much faster than
+ast.literal_eval.  Anything else (e.g., python literals with single quotes
+or tuples) falls back to ast.literal_eval.  In 'auto' mode, the decoder
+remembers which of the two worked last, and tries that one first.
+
+Numeric list fields named in array_fields (e.g., t_low and t_bins)
+are converted to read-only numpy arrays, so plugins don't each have to
+convert them.  Lists which aren't numeric (or are ragged) are left alone.
+"""
+import ast
+import json
+import logging
+import numpy as np
+
+class LineDecoder:
+  array_fields = ('t_low', 't_bins') # default numeric fields to convert
+
+  def __init__(self, mode='auto', array_fields=None):
+    """
+    mode:  'auto', 'json' (strict JSON only) or 'literal' (literal_eval only)
+    array_fields:  names of fields to convert to arrays
+                   (None for the default, () for none)
+    """
+    if mode not in ('auto', 'json', 'literal'):
+      logging.error('Unrecognized decoding mode {}, using auto'.format(mode))
+      mode = 'auto'
+    self.mode = mode
+    self.strict = mode != 'literal' # try json first?
+    if array_fields is not None:
+      self.array_fields = tuple(array_fields)
+
+  def __call__(self, s):
+    """
+    Decode string s, which holds a dictionary or a list of dictionaries.
+    """
+    if self.mode == 'auto':
+      try:
+        data = json.loads(s) if self.strict else ast.literal_eval(s)
+      except (ValueError, SyntaxError):
+        self.strict = not self.strict
+        data = json.loads(s) if self.strict else ast.literal_eval(s)
+    elif self.mode == 'json':
+      data = json.loads(s)
+    else:
+      data = ast.literal_eval(s)
+
+    if self.array_fields:
+      if type(data) is dict:
+        self.convert(data)
+      elif type(data) is list:
+        for d in data:
+          if type(d) is dict:
+            self.convert(d)
+    return data
+
+  def convert(self, data):
+    for f in self.array_fields:
+      v = data.get(f)
+      if type(v) is list:
+        try:
+          a = np.array(v)
+        except ValueError: # ragged
+          continue
+        if a.dtype.kind in 'biuf':
+          a.flags.writeable = False
+          data[f] = a
@@ -5,31 +5,108 @@ Implemented on observer-observable pattern.
 Plugins should subclass Node and override alert, revoke, reset, report.
 """
 import logging
+from collections import deque
+from collections.abc import Mapping
 
-from snewpdag.values import History
+from snewpdag.values import History, Payload
+from snewpdag.values.Payload import payload_nbytes
 
 class Node:
+  payload = Payload # type for local copies of payloads (or dict)
 
   def __init__(self, name, **kwargs):
     """
     Initialize the node.
     OVERRIDE this method to initialize more instance data.
     At the end call super().__init__(**kwargs) to continue initialization.
+
+    Optional keyword arguments:
+      retain:  retention policy for notified payloads (see set_retention)
+      retain_bytes:  byte budget for the 'last-N' policy
     """
     self.name = name     # name of the Node
     self.observers = []  # observers of this Node
     self.watch_list = [] # nodes this Node is observing
     self.last_data = {}  # data after last update
     self.last_source = None # source of last update
+    self.plan = None     # compiled Plan this Node belongs to, if any
+    self.set_retention(kwargs.pop('retain', 'last'),
+                       kwargs.pop('retain_bytes', None))
+
+  def set_retention(self, policy, max_bytes=None):
+    """
+    Set which notified payloads this Node keeps:
+      'none'   - none (last_data stays empty)
+      'last'   - the last one, as last_data (default)
+      'last-N' - the last N, oldest first, in self.retained.
+                 The oldest are dropped if they hold more than max_bytes
+                 (but the last one is always kept as last_data).
+    """
+    if policy == 'none':
+      n = 0
+    elif policy == 'last':
+      n = 1
+    elif isinstance(policy, str) and policy.startswith('last-') and \
+        policy[5:].isdigit() and int(policy[5:]) > 0:
+      n = int(policy[5:])
+    else:
+      logging.error('[{}] Unrecognized retention policy {}, using last'.format(
+                    self.name, policy))
+      n = 1
+    self.retain = n
+    self.retain_bytes = max_bytes
+    self.retained = deque() # (nbytes, payload) for 'last-N'
+    self.retained_bytes = 0
+    if n == 0:
+      self.last_data = {}
+
+  def keep(self, payload):
+    """
+    Retain the payload according to the retention policy.
+    """
+    if self.retain == 0:
+      return
+    self.last_data = payload
+    if self.retain == 1:
+      return
+    n = payload_nbytes(payload)
+    self.retained.append((n, payload))
+    self.retained_bytes += n
+    while len(self.retained) > self.retain or \
+        (self.retain_bytes is not None and len(self.retained) > 1 and
+         self.retained_bytes > self.retain_bytes):
+      n, p = self.retained.popleft()
+      self.retained_bytes -= n
+
+  def release(self):
+    """
+    Drop all retained payloads.
+    """
+    self.last_data = {}
+    self.retained.clear()
+    self.retained_bytes = 0
+
+  def retained_nbytes(self, seen=None):
+    """
+    Estimate the memory held by the payloads this Node retains.
+    seen: set of ids of objects already counted (e.g., held by other
+          nodes), which is updated, so shared arrays are counted once.
+    """
+    if seen is None:
+      seen = set()
+    total = payload_nbytes(self.last_data, seen)
+    for n, p in self.retained:
+      total += payload_nbytes(p, seen)
+    return total
 
   def dispose(self):
     """
     Clear the last data, and detach from all observers and observables.
     """
-    self.last_data.clear()
-    for n in self.observers:
+    self.release()
+    for n in list(self.observers):
       self.detach(n)
-    for n in self.watch_list:
+    for n in list(self.watch_list):
       n.detach(self)
 
   def attach(self, observer):
@@ -41,6 +118,8 @@ class Node:
     if observer not in self.observers:
       self.observers.append(observer)
       observer.watch_list.append(self)
+      if self.plan is not None:
+        self.plan.compile()
 
   def detach(self, observer):
     """
@@ -50,34 +129,42 @@ class Node:
     if observer in self.observers:
       self.observers.remove(observer)
       observer.watch_list.remove(self)
+      if self.plan is not None:
+        self.plan.compile()
 
   def notify(self, action, data):
     """
     Notify all observers that they need to update.
     Update history by appending name of current node.
+    If this Node belongs to a compiled Plan, the observers are queued
+    on the plan instead of being updated recursively.
+    """
+    payload = self.payload(data) # new layer (shares refs of objects)
+    if 'history' in payload:
+      payload['history'] = payload['history'].copy() # leave upstream alone
+    self.publish(action, payload)
+
+  def publish(self, action, payload):
+    """
+    Like notify(), but payload is a layer (or copy) owned by this node,
+    with its own copy of the history, e.g., the one made in update().
+    It is updated in place and kept as self.last_data
+    (depending on the retention policy).
     """
-    self.last_data = data.copy() # shallow copy (copies refs of objects)
     # record action
-    self.last_data['action'] = action
-    # append to history (tuple, so remember that tuples are immutable)
-    #if history == None:
-    #  if 'history' in data:
-    #    h1 = self.last_data['history']
-    #  else:
-    #    #h1 = ()
-    #    h1 = History()
-    #else:
-    #  h1 = history
-
-    if 'history' not in data:
-      self.last_data['history'] = History()
-    self.last_data['history'].append(self.name)
-    #h2 = (self.name,)
-    #self.last_data['history'] = h1 + h2
+    payload['action'] = action
+    # append to history
+    if 'history' not in payload:
+      payload['history'] = History()
+    payload['history'].append(self.name)
+    self.keep(payload)
     # notify all observers
+    if self.plan is not None:
+      self.plan.forward(self, payload)
+      return
     for obs in self.observers:
-      logging.debug('DEBUG:{0}: notify {1}'.format(self.name, obs.name))
-      obs.update(self.last_data)
+      logging.debug('DEBUG:%s: notify %s', self.name, obs.name)
+      obs.update(payload)
 
 #
 # entry points
@@ -93,9 +180,9 @@ class Node:
 # so if you need to update the payload history,
 # just record the past history, i.e., before this node.
 #
-# These methods are called by update() with their own local shallow
-# copy of the payload.  They can therefore modify the contents of the
-# payload itself, though underlying mutable objects shouldn't be modified
+# These methods are called by update() with their own local
+# copy-on-write layer over the payload (see values.Payload).
+# They can therefore modify the contents of the payload itself, though underlying mutable objects shouldn't be modified
 # (as the modifications will be seen by any plugins executing
 # after this one).
 #
@@ -140,6 +227,45 @@ class Node:
                   self.name, data['action']))
     return False
 
+  def alert_batch(self, datas):
+    """
+    Alert action for a list of payloads (local copies, as for alert()),
+    all from the same source.  Returns a list of the values alert()
+    would have returned for each.
+    Override this method to vectorize calculations over a batch
+    (see Plan.inject_batch).  By default, calls alert() for each one.
+    An override should return the values rather than calling notify(),
+    so each output keeps its place in the order of the batch.
+    """
+    return [ self.alert(data) for data in datas ]
+
+  def receive(self, data):
+    """
+    Make the local copy-on-write layer over an incoming payload,
+    with its own copy of the history, and record its source.
+    """
+    cdata = self.payload(data) # local copy-on-write layer
+    h = cdata.get('history')
+    if h is not None:
+      h = cdata['history'] = h.copy() # local copy of history
+      self.last_source = h.last()
+    return cdata
+
+  def respond(self, action, cdata, v):
+    """
+    Act on the value v returned by an action method for payload cdata.
+    """
+    if v is cdata:
+      self.publish(cdata['action'], cdata)
+    elif v == True:
+      self.publish(action, cdata) # publish() will update history
+    elif v == False:
+      return
+    elif isinstance(v, Mapping):
+      self.notify(v['action'] if 'action' in v else action, v)
+    else:
+      logging.error('{0}: empty action response'.format(self.name))
+
   def update(self, data):
     """
     Update this object with provided data.
@@ -149,17 +275,13 @@ class Node:
       A nontrivial calculation is likely to notify with different data.
     It is preferred to override alert/revoke/report/reset methods.
 
-    This method makes a local shallow copy of the payload before
-    calling the action methods.  So it should be all right for an
+    This method makes a local copy-on-write layer over the payload
+    before calling the action methods.  So it should be all right for an
     action to add to the payload and return it for notification
-    (which will make another shallow copy as self.last_data).
+    (the same layer is then kept as self.last_data).
     """
-    logging.debug('{0}: update({1})'.format(self.name,
-                  data['action'] if 'action' in data else 'None'))
-    cdata = data.copy() # local shallow copy
-    if 'history' in cdata:
-      cdata['history'] = data['history'].copy() # local copy of history
-      self.last_source = cdata['history'].last()
+    logging.debug('%s: update(%s)', self.name, data.get('action'))
+    cdata = self.receive(data)
 
     if 'action' in cdata:
       action = cdata['action']
@@ -174,19 +296,54 @@ class Node:
         v = self.reset(cdata)
       else:
         v = self.other(cdata)
-
-      if v == True:
-        self.notify(action, cdata) # notify() will update history
-      elif v == False:
-        return
-      elif type(v) is dict:
-        self.notify(v['action'] if 'action' in v else action, v)
-      else:
-        logging.error('{0}: empty action response'.format(self.name))
-        return
+      self.respond(action, cdata, v)
     else:
       logging.error('[{}] Action not specified'.format(self.name))
 
+  def update_batch(self, items):
+    """
+    Update this object with a list of (key, payload) pairs, in order,
+    during Plan.inject_batch.  Runs of consecutive alerts from the same
+    source go to alert_batch() (if this class overrides it), and the rest
+    to update().  Before each response, the plan's key is set to the key of
+    the payload, so notifications are delivered in order downstream.
+    Notifications made by alert_batch() itself (rather than returned) are
+    delivered under the key of the first payload of the run, i.e., before
+    anything from the later payloads.
+    """
+    plan = self.plan
+    if type(self).alert_batch is Node.alert_batch or \
+        type(self).update is not Node.update:
+      for key, data in items:
+        plan.set_key(key)
+        self.update(data)
+      return
+    i = 0
+    n = len(items)
+    while i < n:
+      data = items[i][1]
+      j = i + 1
+      if data.get('action') == 'alert':
+        h = data.get('history')
+        src = h.last() if h is not None else None
+        while j < n and items[j][1].get('action') == 'alert':
+          h = items[j][1].get('history')
+          if (h.last() if h is not None else None) != src:
+            break
+          j += 1
+      if j - i == 1:
+        plan.set_key(items[i][0])
+        self.update(data)
+      else:
+        cdatas = [ self.receive(d) for k, d in items[i:j] ]
+        plan.set_key(items[i][0]) # for notify() calls within alert_batch
+        vs = self.alert_batch(cdatas)
+        for k in range(i, j):
+          if k > i:
+            plan.set_key(items[k][0])
+          self.respond('alert', cdatas[k-i], vs[k-i])
+      i = j
+
 #
 # utility functions
 #
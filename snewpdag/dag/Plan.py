@@ -0,0 +1,155 @@
+"""
+Plan - a compiled execution plan for a configured DAG.
+
+The plan holds the nodes of one DAG in topological order, together with
+a dispatch table giving the observers of each node.  An injection is run
+as a flat loop over an explicit stack of (node, payload) pairs rather than
+through recursive notify/update calls.  Observers are pushed in reverse
+order, so the nodes are visited in the same depth-first order as the
+recursive dispatch, and the histories come out the same.
+
+A batch of payloads can be injected together with inject_batch().
+Then each node is run once, in topological order, over all the payloads
+it receives (its inbox), so nodes can vectorize over a batch of alerts
+(Node.alert_batch).  Every payload carries a key, the path by which it was
+delivered:  (index in batch, emission, observer index, emission, ...).
+Sorting an inbox by key gives the order in which the node would have
+received the payloads one injection at a time, so each node sees the same
+sequence of inputs either way (only the order of the side effects of
+different nodes, e.g., printouts, changes).
+
+A plan behaves like the dictionary of nodes returned by configure(),
+so plan[name] gives the node with that name.
+"""
+from operator import itemgetter
+import logging
+from collections.abc import Mapping
+
+class Plan(Mapping):
+
+  def __init__(self, nodes):
+    """
+    nodes: dictionary of name -> Node, as built by configure().
+    """
+    self.nodes = nodes
+    self.order = []     # node names in topological order
+    self.dispatch = {}  # node name -> tuple of observers (reversed)
+    self.stack = []     # pending (node, payload) pairs
+    self.running = False
+    self.inbox = None   # node name -> [ (key, payload) ] during a batch
+    self.key = ()       # key of the payload being processed in a batch
+    self.emitted = 0    # number of notifications for that payload
+    for node in self.nodes.values():
+      node.plan = self
+    self.compile()
+
+  def __getitem__(self, name):
+    return self.nodes[name]
+
+  def __iter__(self):
+    return iter(self.nodes)
+
+  def __len__(self):
+    return len(self.nodes)
+
+  def compile(self):
+    """
+    (Re)build the topological order and dispatch tables.
+    Called again by Node.attach/detach if the topology changes.
+    """
+    indegree = { name: 0 for name in self.nodes }
+    for node in self.nodes.values():
+      for obs in node.observers:
+        if obs.name in indegree:
+          indegree[obs.name] += 1
+    ready = [ name for name in self.nodes if indegree[name] == 0 ]
+    order = []
+    while ready:
+      name = ready.pop(0)
+      order.append(name)
+      for obs in self.nodes[name].observers:
+        if obs.name in indegree:
+          indegree[obs.name] -= 1
+          if indegree[obs.name] == 0:
+            ready.append(obs.name)
+    if len(order) != len(self.nodes):
+      logging.error('Plan: cycle detected among nodes {}'.format(
+                    [ name for name in self.nodes if name not in order ]))
+    self.order = order
+    self.dispatch = { name: tuple(reversed(node.observers))
+                      for name, node in self.nodes.items() }
+
+  def forward(self, node, payload):
+    """
+    Queue the payload for all observers of node.
+    Called by Node.notify when the node belongs to this plan.
+    If the plan isn't already running (e.g., node.update() was called
+    directly rather than through inject()), run it now.
+    """
+    if self.inbox is not None:
+      key = self.key + (self.emitted,)
+      self.emitted += 1
+      for i, obs in enumerate(node.observers):
+        self.inbox.setdefault(obs.name, []).append((key + (i,), payload))
+      return
+    for obs in self.dispatch[node.name]:
+      self.stack.append((obs, payload))
+    if not self.running:
+      self.run()
+
+  def set_key(self, key):
+    """
+    Set the key of the payload being processed in a batch.
+    """
+    self.key = key
+    self.emitted = 0
+
+  def inject_batch(self, datas):
+    """
+    Send a list of payloads into the nodes named by their 'name' fields,
+    as if they were injected one at a time (see above).
+    """
+    if self.running or self.inbox is not None:
+      for data in datas:
+        self.inject(data)
+      return
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    self.inbox = {}
+    for i, data in enumerate(datas):
+      self.inbox.setdefault(data['name'], []).append(((i,), data))
+    try:
+      for name in self.order:
+        items = self.inbox.pop(name, None)
+        if items:
+          items.sort(key=itemgetter(0))
+          if debug:
+            logging.debug('DEBUG:%s: batch of %d', name, len(items))
+          self.nodes[name].update_batch(items)
+    finally:
+      self.inbox = None
+      self.set_key(())
+
+  def inject(self, data):
+    """
+    Send data into the node named by data['name'] and run the plan
+    until all downstream nodes have been updated.
+    """
+    self.stack.append((self.nodes[data['name']], data))
+    self.run()
+
+  def run(self):
+    if self.running:
+      return
+    self.running = True
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    stack = self.stack
+    try:
+      while stack:
+        node, payload = stack.pop()
+        if debug and 'history' in payload:
+          logging.debug('DEBUG:%s: notify %s',
+                        payload['history'].last(), node.name)
+        node.update(payload)
+    finally:
+      self.running = False
+      stack.clear()
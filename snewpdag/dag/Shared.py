@@ -0,0 +1,123 @@
+"""
+Shared - read-only resources shared by all the DAGs in a process.
+
+Plugins which load heavy read-only state in their constructors
+(template histograms, skymaps, and arrays derived from them) can get it
+through shared(), so it is loaded once per process and every burst DAG
+refers to the same objects.  Only the mutable state of a plugin is then
+made per burst.
+
+Shared objects must not be modified.  Set numpy arrays read-only
+(e.g., with readonly()) before returning them from the loader.
+
+The key for a resource read from a file should include file_stamp(),
+so the file is read again if it changes.
+
+Arrays parsed from text files are shared with npy_cache(), which can also
+keep them between processes:  it stores them as .npy files in an on-disk
+cache and memory-maps them (read-only) on later runs, so processes reading
+the same file share its pages.  The cache is off unless a directory is given,
+in cache_dir (e.g., by the --cache option of the app) or else in
+$SNEWPDAG_CACHE.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import numpy as np
+
+_resources = {}
+hits = 0
+loads = 0
+cache_dir = None # directory of the on-disk cache (None for $SNEWPDAG_CACHE)
+
+def shared(key, loader):
+  """
+  Return the resource for key (a hashable), calling loader() to make it
+  the first time it is asked for.
+  """
+  global hits, loads
+  if key in _resources:
+    hits += 1
+    return _resources[key]
+  logging.debug('shared: loading %s', key)
+  loads += 1
+  r = loader()
+  _resources[key] = r
+  return r
+
+def readonly(a):
+  """
+  Make numpy array a read-only, and return it.
+  """
+  a.flags.writeable = False
+  return a
+
+def file_stamp(filename):
+  """
+  Key identifying the current version of a file:
+  absolute path, modification time and size.
+  """
+  st = os.stat(filename)
+  return (os.path.abspath(filename), st.st_mtime_ns, st.st_size)
+
+def clear():
+  """
+  Forget all shared resources (they're freed once no node refers to them).
+  """
+  global hits, loads
+  _resources.clear()
+  hits = 0
+  loads = 0
+
+def get_cache_dir():
+  """
+  Directory of the on-disk array cache, or None if it's turned off.
+  """
+  if cache_dir is not None:
+    return cache_dir or None
+  return os.environ.get('SNEWPDAG_CACHE') or None
+
+def npy_cache(filename, tag, loader):
+  """
+  Arrays parsed from a file, shared within the process (see shared()),
+  and cached on disk if the cache is turned on.
+  tag:  name of the parsing method (part of the key, with file_stamp())
+  loader:  function of filename returning a dictionary of name -> array
+  Returns a dictionary of name -> read-only array (memory-mapped from the
+  cache, except when it is first made, or if the cache can't be used).
+  """
+  stamp = file_stamp(filename)
+  d = get_cache_dir()
+  return shared(('npy_cache', tag, d) + stamp,
+                lambda: _npy_load(filename, stamp, tag, loader, d))
+
+def _npy_load(filename, stamp, tag, loader, d):
+  if d is None:
+    return { k: readonly(np.asarray(v)) for k, v in loader(filename).items() }
+  h = hashlib.sha1(repr((tag,) + stamp).encode('utf-8')).hexdigest()
+  entry = os.path.join(d, h)
+  if os.path.isdir(entry):
+    try:
+      return { os.path.splitext(fn)[0]:
+                 np.asarray(np.load(os.path.join(entry, fn), mmap_mode='r'))
+               for fn in os.listdir(entry) }
+    except (OSError, ValueError):
+      logging.warning('shared: ignoring bad cache entry {}'.format(entry))
+  arrays = { k: readonly(np.asarray(v)) for k, v in loader(filename).items() }
+  # write to a temporary directory, then rename it into place,
+  # so other processes never see a partial entry
+  try:
+    os.makedirs(d, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=d)
+    for k, v in arrays.items():
+      np.save(os.path.join(tmp, k + '.npy'), v)
+    try:
+      os.rename(tmp, entry)
+    except OSError: # made by another process in the meantime
+      for fn in os.listdir(tmp):
+        os.remove(os.path.join(tmp, fn))
+      os.rmdir(tmp)
+  except OSError as e:
+    logging.debug('shared: cannot write cache entry %s: %s', entry, e)
+  return arrays
@@ -1 +1,7 @@
 from .Node import Node
+from .Plan import Plan
+from .BurstRegistry import BurstRegistry
+from .Shared import shared, file_stamp, readonly, npy_cache
+from .LineDecoder import LineDecoder
+from . import Frames
+from . import Executor
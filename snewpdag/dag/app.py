@@ -10,6 +10,8 @@ import logging
 import ast
 import csv
 
+from snewpdag.dag import Plan, BurstRegistry, LineDecoder, Frames, Shared
+
 def run():
   """
   Entrypoint for main application program.
@@ -18,15 +20,40 @@ def run():
     input  - name of JSON input file
 
   With the --jsonlines option, read from stdin assuming one json object/line.
-  I know, this kind of sucks, but the alternative is importing another
-  third-party module which provides more functionality than is needed here.
+  Input is decoded as strict JSON if possible, or else as python literals
+  (see LineDecoder; --decode selects one or the other).
+  With the --binary option, the input is a stream of binary frames
+  (see Frames), and an --input file ending in .npz holds a single payload.
   """
   parser = argparse.ArgumentParser()
   parser.add_argument('config', help='configuration py/json/csv file')
-  parser.add_argument('--input', help='input data py/json file')
+  parser.add_argument('--input', help='input data py/json/npz file')
   parser.add_argument('--jsonlines', action='store_true',
                       help='each input line contains one JSON object to inject')
+  parser.add_argument('--binary', action='store_true',
+                      help='input is a stream of binary frames')
   parser.add_argument('--log', help='logging level')
+  parser.add_argument('--decode', default='auto',
+                      choices=['auto', 'json', 'literal'],
+                      help='input decoding: strict json, python literals, or auto')
+  parser.add_argument('--array-fields',
+                      help='comma-separated numeric list fields to read as arrays')
+  parser.add_argument('--retain',
+                      help='default payload retention: none, last, last-N')
+  parser.add_argument('--retain-bytes', type=float,
+                      help='byte budget for last-N payload retention')
+  parser.add_argument('--memory', action='store_true',
+                      help='report memory held by retained payloads at exit')
+  parser.add_argument('--max-bursts', type=int,
+                      help='maximum number of live burst DAGs')
+  parser.add_argument('--burst-ttl', type=float,
+                      help='seconds after which an unused burst DAG is evicted')
+  parser.add_argument('--recycle', type=int, default=0,
+                      help='number of evicted burst DAGs kept for reuse')
+  parser.add_argument('--batch', type=int, default=1,
+                      help='inject up to this many consecutive payloads with the same name and action together')
+  parser.add_argument('--cache',
+                      help='directory of the on-disk template cache (default $SNEWPDAG_CACHE, else none)')
   args = parser.parse_args()
 
   if args.log:
@@ -35,11 +62,80 @@ def run():
       raise ValueError('Invalid log level {}'.format(args.log))
     logging.basicConfig(level=numeric_level)
 
-  cfn, cfx = os.path.splitext(args.config)
+  if args.cache:
+    Shared.cache_dir = args.cache
+
+  nodespecs = read_config(args.config)
+  options = {}
+  if args.retain:
+    options['retain'] = args.retain
+  if args.retain_bytes:
+    options['retain_bytes'] = args.retain_bytes
+
+  dags = BurstRegistry(lambda: configure(nodespecs, plan=True, **options),
+                       max_bursts=args.max_bursts, ttl=args.burst_ttl,
+                       max_spares=args.recycle)
+
+  array_fields = None
+  if args.array_fields is not None:
+    array_fields = [ f.strip() for f in args.array_fields.split(',')
+                     if f.strip() ]
+  decode = LineDecoder(args.decode, array_fields)
+
+  stream = read_input(args, decode)
+  if args.batch > 1:
+    inject_batches(dags, stream, args.batch, nodespecs, **options)
+  else:
+    for data in stream:
+      inject(dags, data, nodespecs, **options)
+
+  if args.memory:
+    nb = retained_nbytes(dags)
+    for burst_id in nb:
+      print('burst {}: {} bytes retained'.format(burst_id, nb[burst_id]),
+            file=sys.stderr)
+    print('total: {} bytes retained'.format(sum(nb.values())),
+          file=sys.stderr)
+  logging.info('Burst DAGs: {}'.format(dags.stats()))
+
+def read_input(args, decode):
+  """
+  Generator of the input data (dictionaries or lists of dictionaries)
+  selected by the command-line arguments.
+  """
+  if args.input and os.path.splitext(args.input)[1] == '.npz':
+    yield Frames.read_npz(args.input)
+  elif args.binary:
+    if args.input:
+      with open(args.input, 'rb') as f:
+        yield from Frames.read_frames(f)
+    else:
+      yield from Frames.read_frames(sys.stdin.buffer)
+  elif args.input:
+    with open(args.input) as f:
+      if args.jsonlines:
+        for jsonline in f:
+          if jsonline.strip():
+            yield decode(jsonline)
+      else:
+        yield decode(f.read())
+  else:
+    if args.jsonlines:
+      for jsonline in sys.stdin:
+        if jsonline.strip():
+          yield decode(jsonline)
+    else:
+      yield decode(sys.stdin.read())
+
+def read_config(filename):
+  """
+  Read a list of node specifications from a csv, python or json file.
+  """
+  cfn, cfx = os.path.splitext(filename)
   if cfx == '.csv':
     # name, class, observe
     nodespecs = []
-    with open(args.config, 'r') as f:
+    with open(filename, 'r') as f:
       reader = csv.reader(f, quotechar='"')
       for row in reader:
         #print('New row:  {}'.format(row))
@@ -71,29 +167,9 @@ def run():
     #print(nodespecs)
 
   else: # try python/json parsing if not csv
-    with open(args.config, 'r') as f:
+    with open(filename, 'r') as f:
       nodespecs = ast.literal_eval(f.read())
-    #nodes = configure(nodespecs)
-
-  dags = {}
-
-  if args.input:
-    with open(args.input) as f:
-      if args.jsonlines:
-        for jsonline in f:
-          data = ast.literal_eval(jsonline)
-          inject(dags, data, nodespecs)
-      else:
-        data = ast.literal_eval(f.read())
-        inject(dags, data, nodespecs)
-  else:
-    if args.jsonlines:
-      for jsonline in sys.stdin:
-        data = ast.literal_eval(jsonline)
-        inject(dags, data, nodespecs)
-    else:
-      data = ast.literal_eval(sys.stdin.read())
-      inject(dags, data, nodespecs)
+  return nodespecs
 
 def find_class(name):
   s = name.split('.')
@@ -107,9 +183,14 @@ def find_class(name):
     logging.error('Unknown class {} in {}'.format(cl, path))
     sys.exit(2)
 
-def configure(nodespecs):
+def configure(nodespecs, plan=False, **options):
   """
   Build DAG from configuration dictionary.
+  Returns a dictionary of nodes, or a compiled Plan (which also behaves
+  like the dictionary of nodes) if plan is True.
+  options are default keyword arguments for every node, e.g.,
+  retain and retain_bytes for the payload retention policy.
+  The kwargs of a node specification take precedence.
   """
   nodes = {}
 
@@ -130,7 +211,9 @@ def configure(nodespecs):
       logging.error('Duplicate node name {}'.format(name))
       sys.exit(2)
 
-    kwargs = spec['kwargs'] if 'kwargs' in spec else {}
+    kwargs = dict(options)
+    if 'kwargs' in spec:
+      kwargs.update(spec['kwargs'])
     kwargs['name'] = spec['name']
     try:
       nodes[name] = c(**kwargs)
@@ -146,29 +229,83 @@ def configure(nodespecs):
           logging.error('{0} observing unknown node {1}'.format(name, obs))
           sys.exit(2)
 
-  return nodes
+  return Plan(nodes) if plan else nodes
 
-def inject(dags, data, nodespecs):
+def inject(dags, data, nodespecs, **options):
   """
   Send data through DAG.
   If there is no burst identifier, assume it's 0.
-  If the DAG doesn't exist for this burst, create a new one.
+  If the DAG doesn't exist for this burst, create a new one
+  (as a compiled Plan), passing options to configure().
+  dags is either a dictionary of burst_id -> DAG or a BurstRegistry
+  (which makes its own DAGs, so nodespecs and options are ignored).
   """
   if type(data) is dict:
-    inject_one(dags, data, nodespecs)
+    inject_one(dags, data, nodespecs, **options)
   elif type(data) is list:
     for d in data:
-      inject_one(dags, d, nodespecs)
+      inject_one(dags, d, nodespecs, **options)
   else:
     logging.error('What is this input data?')
     sys.exit(2)
 
-def inject_one(dags, data, nodespecs):
+def get_dag(dags, burst_id, nodespecs, **options):
+  if isinstance(dags, BurstRegistry):
+    return dags.acquire(burst_id)
+  if burst_id not in dags:
+    dags[burst_id] = configure(nodespecs, plan=True, **options)
+  return dags[burst_id]
+
+def inject_one(dags, data, nodespecs, **options):
   burst_id = 0
   if 'burst_id' in data:
     burst_id = data['burst_id']
-  if burst_id not in dags:
-    dags[burst_id] = configure(nodespecs)
-  dag = dags[burst_id]
-  dag[data['name']].update(data)
+  dag = get_dag(dags, burst_id, nodespecs, **options)
+  if isinstance(dag, Plan):
+    dag.inject(data)
+  else:
+    dag[data['name']].update(data)
 
+def inject_batches(dags, stream, size, nodespecs, **options):
+  """
+  Send a stream of data through the DAGs, in batches of up to size
+  consecutive payloads with the same burst identifier, name and action
+  (see Plan.inject_batch).  The results are the same as for inject().
+  """
+  batch = []
+  group = None
+  for data in stream:
+    if type(data) is dict:
+      data = [ data ]
+    elif type(data) is not list:
+      logging.error('What is this input data?')
+      sys.exit(2)
+    for d in data:
+      g = (d.get('burst_id', 0), d.get('name'), d.get('action'))
+      if batch and (g != group or len(batch) >= size):
+        inject_batch(dags, batch, nodespecs, **options)
+        batch = []
+      group = g
+      batch.append(d)
+  if batch:
+    inject_batch(dags, batch, nodespecs, **options)
+
+def inject_batch(dags, batch, nodespecs, **options):
+  dag = get_dag(dags, batch[0].get('burst_id', 0), nodespecs, **options)
+  if isinstance(dag, Plan):
+    dag.inject_batch(batch)
+  else:
+    for data in batch:
+      dag[data['name']].update(data)
+
+def retained_nbytes(dags):
+  """
+  Estimate the memory held by the payloads retained in each DAG.
+  Returns a dictionary of burst_id -> bytes.
+  Objects shared between nodes or bursts are only counted once.
+  """
+  seen = set()
+  nb = {}
+  for burst_id, dag in dags.items():
+    nb[burst_id] = sum( dag[name].retained_nbytes(seen) for name in dag )
+  return nb
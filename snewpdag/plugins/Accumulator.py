@@ -4,39 +4,125 @@ Accumulator:  a plugin which simply accumulates a list of numbers
 
 In general, assumes only a single source, so revoke and reset are
 the same.
+
+Constructor arguments:
+  title:  title of the series
+  in_field:  name of field to extract from alert data
+  in_index:  optional, index into the field, e.g., 2, or [1, 2] for an
+             element of a matrix.  A [start, stop] (or [start, stop, step])
+             list within it is a slice, to store a vector as a row,
+             e.g., [[1, 3]] for elements 1 and 2, or [0, [1, 3]] for
+             elements 1 and 2 of row 0.
+  out_field:  optional, name of field for dictionary output
+  dtype:  numpy dtype of the stored values (default float64)
+  capacity:  initial number of entries in the buffer (default 1024)
+  ring:  if True, keep only the last capacity entries (default False)
+
+The values are stored in a numpy buffer, which is doubled in size when
+full.  In ring mode, the buffer has a fixed capacity, and the oldest entry
+is overwritten by each new one.  (Each entry is written twice, to slots
+i and i + capacity, so that the entries are always contiguous in order.)
+
+The report's 'series' is a read-only view of the buffer, not a copy.
+It stays valid as more values are accumulated, except in ring mode,
+where it's only valid until the next alert.
 """
 import logging
+import numpy as np
 
 from snewpdag.dag import Node
 
+def index_key(index):
+  """
+  numpy index for in_index, with [start, stop(, step)] lists as slices.
+  """
+  if isinstance(index, tuple):
+    return tuple(slice(*i) if isinstance(i, list) else i for i in index)
+  return index
+
 class Accumulator(Node):
   def __init__(self, title, in_field, **kwargs):
     self.title = title
-    self.in_field = in_field
+    self.field = in_field
     self.out_field = kwargs.pop('out_field', None)
-    self.index = kwargs.pop('in_index', None)
+    v = kwargs.pop('in_index', None)
+    self.index = tuple(v) if isinstance(v, list) else v
+    self.key = index_key(self.index)
+    self.dtype = np.dtype(kwargs.pop('dtype', np.float64))
+    self.capacity = kwargs.pop('capacity', 1024)
+    self.ring = kwargs.pop('ring', False)
     super().__init__(**kwargs)
-    self.series = []
+    self.clear()
 
-  def alert(self, data):
-    if self.index:
-      x = data[self.field][self.index]
+  def clear(self):
+    self.buf = None # allocated with the first entry, which sets its shape
+    self.start = 0 # index of oldest entry (ring mode)
+    self.n = 0 # number of entries
+
+  def append(self, x):
+    x = np.asarray(x, dtype=self.dtype)
+    if self.buf is None:
+      size = 2 * self.capacity if self.ring else self.capacity
+      self.buf = np.empty((size,) + x.shape, dtype=self.dtype)
+    if self.ring:
+      c = self.capacity
+      if self.n == c: # full, so replace the oldest
+        i = self.start
+        self.start = (self.start + 1) % c
+      else:
+        i = (self.start + self.n) % c
+        self.n += 1
+      self.buf[i] = x
+      self.buf[i + c] = x
+    else:
+      if self.n == len(self.buf):
+        buf = np.empty((2 * len(self.buf),) + self.buf.shape[1:],
+                       dtype=self.dtype)
+        buf[:self.n] = self.buf
+        self.buf = buf
+      self.buf[self.n] = x
+      self.n += 1
+
+  def series(self):
+    """
+    Read-only view of the accumulated entries, in order.
+    """
+    if self.buf is None:
+      a = np.empty(0, dtype=self.dtype)
     else:
-      x = data[self.field]
+      a = self.buf[self.start:self.start+self.n]
+    a.flags.writeable = False
+    return a
+
+  def summary(self):
+    return {
+             'name': self.name,
+             'title': self.title,
+             'in_field': self.field,
+             'in_index': self.index,
+             'series': self.series(),
+           }
+
+  def alert(self, data):
+    x = data[self.field]
+    if self.key is not None:
+      x = np.asarray(x)[self.key]
+    try:
+      x = np.asarray(x, dtype=self.dtype)
+    except (TypeError, ValueError):
+      logging.error('[{}] Cannot convert entry {!r} to {}'.format(
+                    self.name, x, self.dtype))
+      return False
     # append
-    self.series.append(x)
+    try:
+      self.append(x)
+    except ValueError:
+      logging.error('[{}] Entry of shape {} does not match series'.format(
+                    self.name, np.shape(x)))
     return False # consume - only emit on report
 
   def report(self, data):
-    a = np.array(self.series)
-    a.flags.writeable = False
-    d = {
-          'name': self.name,
-          'title': self.title,
-          'in_field': self.field,
-          'in_index': self.index,
-          'series': a,
-        }
+    d = self.summary()
     if self.out_field == None:
       data.update(d)
     else:
@@ -44,10 +130,9 @@ class Accumulator(Node):
     return True
 
   def revoke(self, data):
-    self.series = []
+    self.clear()
     return True
 
   def reset(self, data):
-    self.series = []
+    self.clear()
     return True
-
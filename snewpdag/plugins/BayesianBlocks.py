@@ -1,8 +1,13 @@
 """
 Bayes: Bayesian block method.  It's now set to always run in hybrid mode.  To run a pure Bayesian block, set division to be lower than h_low
+
+The partition of each input is computed once (and memoised by content),
+and the histograms for all the offsets of the dt scan are made from it
+at once.
 """
 import logging
 import math
+import hashlib
 from snewpdag.dag import Node
 from snewpdag.plugins import ShapeHistFunctions as SHF
 import numpy as np
@@ -25,6 +30,7 @@ class BayesianBlocks(Node):
     self.h = [ (), () ] # histories from each source
     self.history_data = []
     self.hybrid_bin_value = []
+    self.partitions = {} # memoised partitions (see partition())
     super().__init__(**kwargs)
 
     if self.dt0 > 0:
@@ -68,162 +74,116 @@ class BayesianBlocks(Node):
 
 
   def metric_list(self, values1, values2):
-    mlist = [0] * self.dt_N
+    hist2 = self.block_hists(self.partition(values2), [ 0.0 ])[0]
+    offsets = self.dt0 + np.arange(self.dt_N) * self.dt_step
+    hists1 = self.block_hists(self.partition(values1), offsets)
+    mlist = SHF.diff_hists(hists1, hist2, self.scale)
+
+    return mlist.tolist()
+
+
+  def partition(self, values):
+    """
+    Partition of values for the hybrid histogram:  block edges and contents
+    (see bayesian_block), the sorted values below the division (to be binned
+    uniformly), and the number of values within range.
+    Partitions of the last two inputs are memoised by content, since the same
+    data is compared again when the other source sends a new alert.
+    """
+    v = np.asarray(values, dtype=float)
+    key = hashlib.sha1(v.tobytes()).hexdigest()
+    if key in self.partitions:
+      return self.partitions[key]
 
-    block2 = self.bayesian_block(values2)
-    hist2 = self.block_hist(block2[0], block2[1], 0)
-    for i in range(self.dt_N):
-      block1 = self.bayesian_block(values1)
-      hist1 = self.block_hist(block1[0], block1[1], self.dt0 + i*self.dt_step)
-      metric = SHF.diff_hist(hist1, hist2, self.scale)
-      mlist[i] = metric
+    self.hybrid_bin_value.clear()
+    block = self.bayesian_block(v)
+    hv = np.array(self.hybrid_bin_value)
+    self.hybrid_bin_value.clear()
+    p = (np.asarray(block[0]), np.asarray(block[1]),
+         np.sort(hv[hv <= self.division]), len(hv))
 
-    return mlist
+    self.partitions[key] = p
+    if len(self.partitions) > 2:
+      del self.partitions[next(iter(self.partitions))] # oldest
+    return p
 
 
   def bayesian_block(self, values):
+    """
+    Bayesian block partition of the values within [h_low, h_up) and above
+    the division (values below the division go to hybrid_bin_value,
+    to be binned uniformly).  values may be a list or an array
+    (which isn't modified).
+    Returns [ block edges, block contents ], with the contents normalised
+    to the number of values within range.
+
+    The best partition is found with the usual dynamic program over the
+    sorted values:  best[n] is the likelihood of the best partition of the
+    first n values, maximised over the start j of the last block, whose
+    width is a difference of cell edges.  Candidates j which can't start
+    the last block of any later best partition are pruned (as in PELT,
+    Killick et al. 2012), so the inner step is a vectorised pass over
+    the remaining candidates only.
+    """
     log_prior = math.log(self.gamma)
 
-    svalues = []
-    for iv in range(len(values)):
-      if float(values[iv]) >= self.h_low and float(values[iv]) < self.h_up:
-        self.hybrid_bin_value.append(float(values[iv]))           
-        if float(values[iv]) > self.division:
-          svalues.append(float(values[iv]))
-      else:
-        values.remove(values[iv])
-    svalues.sort()
-
-    edge = [(svalues[i] + svalues[i-1])/2 for i in range(len(svalues)) if i > 0]
-    edge.insert(0, 1.5*svalues[0] - 0.5*svalues[1]) #lower edge of the first cell
-    edge.append(1.5*svalues[-1] - 0.5*svalues[-2]) #upper edge of the last cell
-
-    width = [(edge[ii] - edge[ii-1]) for ii in range(len(edge)) if ii > 0]
-
-    best = [] #best[N] = the likelihood of the best combination when there are N+1 data points
-    best_count = [] #best_count[N] = the number of data points in the last block when there are N+1 data points
-
-    for n in range(1, len(svalues) + 1): #start from 1 data point and add one point a time
-      last_n = n #number of data points in the last block 
-
-      if n == 1: #for only one data point the best partition is certainly one block
-        block_width = width[0]
-        max_like = 1 * (math.log(1/block_width)) + log_prior
-        best.append(max_like)
-        best_count.append(1)
-      else:
-        block_width = 0
-        for nn in range(0, last_n):
-          block_width += width[nn]
-        max_like = last_n * (math.log(last_n/block_width)) + log_prior
-        best_n = last_n
-        last_n -= 1
-        while last_n > 0:
-          block_width = 0
-          for nn in range(0, last_n):
-            block_width += width[n-1-nn]
-          like = last_n * (math.log(last_n/block_width)) #likelihood for the last block
-          like += best[n-last_n-1] #likelihood of the best partition for the data points not in the last block
-          like += log_prior #suppresion prior for creating a new block
-          if like > max_like:
-            max_like = like
-            best_n = last_n
-          last_n -= 1
-        best.append(max_like)
-        best_count.append(best_n)
-
-    best_edge = []
+    v = np.asarray(values, dtype=float)
+    v = v[(v >= self.h_low) & (v < self.h_up)]
+    self.hybrid_bin_value.extend(v.tolist())
+    svalues = np.sort(v[v > self.division])
+    N = len(svalues)
+
+    edge = np.empty(N + 1)
+    edge[1:-1] = (svalues[1:] + svalues[:-1])/2
+    edge[0] = 1.5*svalues[0] - 0.5*svalues[1] #lower edge of the first cell
+    edge[-1] = 1.5*svalues[-1] - 0.5*svalues[-2] #upper edge of the last cell
+
+    best = np.zeros(N + 1) #best[n] = the likelihood of the best partition of the first n data points
+    best_count = np.zeros(N + 1, dtype=int) #best_count[n] = the number of data points in its last block
+    cand = np.zeros(1, dtype=int) #candidate first points of the last block
+    with np.errstate(divide='ignore'):
+      for n in range(1, N + 1): #add one point a time
+        count = n - cand
+        like = best[cand] + count * np.log(count / (edge[n] - edge[cand]))
+        i = np.argmax(like) #first maximum, i.e., the largest last block
+        best[n] = like[i] + log_prior
+        best_count[n] = count[i]
+        # a candidate which is worse than best[n] here stays worse
+        cand = np.append(cand[like >= best[n]], n)
+
+    best_edge = [ edge[-1] ]
     best_content = []
-    bayes_block = []
-
-    best_edge.append(edge[-1])
-    dataN = len(svalues)
-    edge_index = -1
+    dataN = N
     while dataN > 0:
-      best_content.append(best_count[dataN-1])
-      edge_index -= best_count[dataN-1]
-      best_edge.append(edge[edge_index])
-      dataN -= best_count[dataN-1]
+      best_content.append(best_count[dataN])
+      dataN -= best_count[dataN]
+      best_edge.append(edge[dataN])
 
     best_content.reverse()
     best_edge.reverse()
 
-    best_content = [x/float(len(values)) for x in best_content]
-
-    bayes_block.append(best_edge)
-    bayes_block.append(best_content)
+    best_content = [x/float(len(v)) for x in best_content]
 
-    return bayes_block
+    return [ best_edge, best_content ]
 
 
-  def block_hist(self, block_edge, block_content, dt_offset):
+  def block_hists(self, partition, offsets):
+    """
+    Hybrid histograms of a partition shifted by each of the offsets,
+    as the rows of a 2D array (len(offsets) x h_bins).
+    Each block spreads its content uniformly over its width, so a bin gets
+    the difference of the cumulative content at its edges (interpolated
+    within blocks).  Each value below the division adds 1/(number in range)
+    to the bin with low edge < value + offset <= upper edge.
+    """
+    block_edge, block_content, hv, n = partition
     bin_width = (float(self.h_up) - float(self.h_low)) / float(self.h_bins)
-    hist = [0] * (self.h_bins)
-
-    block_width = [block_edge[ie] - block_edge[ie-1] for ie in range(len(block_edge)) if ie > 0]
-
-    edge_index = 0
-    for i in range(self.h_bins): #fill in the bins of the histogram
-      bin_edge = self.h_low + (i+1) * bin_width #upper edge of the bin
-
-      if edge_index == 0 and bin_edge <= block_edge[edge_index]+dt_offset: #if the bin is below the lower end of the blocks
-        hist[i] = 0
-        continue
-
-      reach_end = False
-      while block_edge[edge_index]+dt_offset < bin_edge: #loop until there's a block whose upper edge covers the bin
-        edge_index += 1
-
-        if edge_index == len(block_edge): #flag when the upper bin edge exceeds the upper end of the blocks
-          reach_end = True
-          break
-
-      if reach_end == True: #when the upper bin edge exceeds the upper end of the blocks
-        if bin_edge - bin_width >= block_edge[-2]+dt_offset: #if the bin doesn't include any full blocks
-          hist[i] += (block_content[-1]/block_width[-1]) * ( (block_edge[-1]+dt_offset) - bin_edge + bin_width)
-          break
-        else: #if the bin includes full blocks
-          ib = 1 #number of block edges included in the bin
-          while bin_edge - bin_width < block_edge[-1-ib]+dt_offset:
-            ib += 1
-
-          hist[i] += (block_content[-ib]/block_width[-ib]) * ( (block_edge[-ib]+dt_offset) - bin_edge + bin_width)
-          for iib in range(ib-1):
-            hist[i] += (block_content[-1-iib]/block_width[-1-iib]) * (block_edge[-1-iib] - block_edge[-2-iib])
-          break
-
-      if block_edge[edge_index]+dt_offset >= bin_edge:
-        if edge_index == 1: #if the bin is completely or partially in the first block
-          if bin_edge - bin_width < block_edge[edge_index-1]+dt_offset: #if the bin is partially in the first block
-            hist[i] += (block_content[edge_index-1]/block_width[edge_index-1]) * (bin_edge - (block_edge[edge_index-1]+dt_offset) )
-            continue
-          else: #if the bin is completely in the first block
-            hist[i] += (block_content[edge_index-1]/block_width[edge_index-1]) * bin_width
-            continue
-        elif bin_edge - bin_width >= block_edge[edge_index-1]+dt_offset: #if the bin is completely within one single block
-          hist[i] += (block_content[edge_index-1]/block_width[edge_index-1]) * bin_width
-          continue
-        else: #if the bin is only partially in a block or even contains several blocks
-          ib = 1 #number of block edges included in the bin
-          while bin_edge - bin_width < block_edge[edge_index-1-ib]+dt_offset:
-            ib += 1
-
-          hist[i] += (block_content[edge_index-1]/block_width[edge_index-1]) * (bin_edge - (block_edge[edge_index-1]+dt_offset))
-          for iib in range(ib-1):
-            hist[i] += (block_content[edge_index-2-iib]/block_width[edge_index-2-iib]) * (block_edge[edge_index-1-iib] - block_edge[edge_index-2-iib])
-          hist[i] += (block_content[edge_index-1-ib]/block_width[edge_index-1-ib]) * ( (block_edge[edge_index-ib]+dt_offset) - bin_edge + bin_width)
-          continue
-
-    for i in range(self.h_bins):
-      bin_up_edge = self.h_low + (i+1) * bin_width #upper edge of the bin
-      bin_low_edge = self.h_low + i * bin_width #lower edge of the bin
-
-      for ii in range(len(self.hybrid_bin_value)):
-        if self.hybrid_bin_value[ii]+dt_offset > bin_low_edge and self.hybrid_bin_value[ii]+dt_offset <= bin_up_edge and self.hybrid_bin_value[ii] <= self.division:
-          hist[i] += 1/float(len(self.hybrid_bin_value))
-    self.hybrid_bin_value.clear()
-
-    return hist
-
+    bin_edge = np.arange(self.h_bins + 1) * bin_width + self.h_low
+    x = bin_edge[np.newaxis, :] - np.asarray(offsets, dtype=float)[:, np.newaxis]
 
+    cumulative = np.concatenate(([ 0.0 ], np.cumsum(block_content)))
+    hist = np.diff(np.interp(x, block_edge, cumulative), axis=1)
+    if len(hv) > 0:
+      hist += np.diff(hv.searchsorted(x, side='right'), axis=1) / float(n)
 
+    return hist
@@ -27,12 +27,20 @@ Output dictionary:
     forward unmodified data
   revoke:
     forward unmodified data
+
+The bin edges are computed once, and each series is binned (with its
+underflow and overflow) by a single np.bincount added into the
+accumulated bins in place.
+A batch of alerts (see Node.alert_batch) with short series is binned
+in one pass.
 """
 import logging
 import math
 import numpy as np
 
 from snewpdag.dag import Node
+from snewpdag.values.Hist1D import uniform_edges, histogram_counts, \
+                                   chunk_ranges
 
 class BinnedAccumulator(Node):
   def __init__(self, in_field, nbins, xlow, xhigh,
@@ -47,12 +55,12 @@ class BinnedAccumulator(Node):
     flags = kwargs.pop('flags', [])
     self.calc_overflow = 'overflow' in flags
     self.calc_stats = 'stats' in flags
+    self.edges = uniform_edges(self.nbins, self.xlow, self.xhigh)
     self.clear()
     super().__init__(**kwargs)
 
   def clear(self):
     self.bins = np.zeros(self.nbins)
-    self.edges = np.zeros(self.nbins+1)
     self.overflow = 0.0
     self.underflow = 0.0
     self.sum = 0.0
@@ -61,22 +69,46 @@ class BinnedAccumulator(Node):
     self.changed = True
 
   def alert(self, data):
-    vs = data[self.field]
-    h, edges = np.histogram(vs, self.nbins, (self.xlow, self.xhigh))
-    # note edges will have len(h)+1, since last element is top edge.
+    self.fill(np.asarray(data[self.field]))
+    return False
+
+  def alert_batch(self, datas):
+    vss = [ np.asarray(data[self.field]) for data in datas ]
+    for i, j in chunk_ranges([ len(vs) for vs in vss ]):
+      if j - i == 1:
+        self.fill(vss[i])
+      else:
+        self.bin_batch(vss[i:j])
+    return [ False ] * len(datas)
+
+  def fill(self, vs):
+    # note edges has len(bins)+1, since last element is top edge.
     # also note (?) that top edge is inclusive,
     # but lower bins' right edge is exclusive.
-    self.edges = edges
-    self.bins = self.bins + h
+    h, underflow, overflow = histogram_counts(vs, self.nbins,
+        self.xlow, self.xhigh, self.edges, out=self.bins)
     self.count += len(vs)
     if self.calc_overflow:
-      self.overflow += np.count_nonzero(vs > self.xhigh)
-      self.underflow += np.count_nonzero(vs < self.xlow)
+      self.overflow += overflow
+      self.underflow += underflow
     if self.calc_stats:
       self.sum += np.sum(vs)
       self.sum2 += np.sum(vs*vs)
     self.changed = True
-    return False
+
+  def bin_batch(self, vss):
+    x = np.concatenate(vss)
+    h, underflow, overflow = histogram_counts(x, self.nbins,
+        self.xlow, self.xhigh, self.edges, out=self.bins)
+    self.count += len(x)
+    if self.calc_overflow:
+      self.overflow += overflow
+      self.underflow += underflow
+    if self.calc_stats:
+      for vs in vss: # in order, so the sums are the same as for alert()
+        self.sum += np.sum(vs)
+        self.sum2 += np.sum(vs*vs)
+    self.changed = True
 
   def reset(self, data):
     return False
@@ -96,14 +128,14 @@ class BinnedAccumulator(Node):
             'count': self.count,
           }
       d[self.xname] = self.edges[:-1]
-      d[self.yname] = self.bins
+      d[self.yname] = self.bins.copy() # self.bins is filled in place
       if self.calc_overflow:
         d['overflow'] = self.overflow
         d['underflow'] = self.underflow
       if self.calc_stats:
         mean = self.sum / self.count
         d['mean'] = mean
-        d['rms'] = sqrt(self.sum2 / self.count - mean*mean)
+        d['rms'] = math.sqrt(self.sum2 / self.count - mean*mean)
       self.changed = False
       if self.out_field == None:
         data.update(d)
@@ -9,11 +9,23 @@ Input JSON: (choose either cl or chi2)
 If cl or chi2 are lists rather than numpy arrays, they're converted.
 
 Output JSON: same fields.
+  With log=True, instead (and without cl, chi2 or ndof)
+  'logcl': log of the combined confidence levels (np.ndarray of float32)
 
 The finest-grained healpix pixellation is chosen.
 We use the healpy.ud_grade() function to upgrade.
 The map is always assumed to be in nested order.
 
+The converted map of each source (ud_grade'd to the current nside,
+and transformed to CL if need be) is cached, and only recomputed when
+that source sends a new map or the target nside changes.
+
+With log=True, each map is converted to log CL (float32, floored at
+LOG_FLOOR so that revoking a map of zeros can be undone), and the running
+sum is updated on each alert or revoke by adding the new map and
+subtracting the old one, rather than combining all the maps again.
+The sum is rebuilt when the target nside changes.
+
 May also add a function to input.
 """
 import logging
@@ -22,11 +34,18 @@ import healpy as hp
 from scipy.stats import chi2
 
 from snewpdag.dag import Node
+from snewpdag.values import LMap
+
+LOG_FLOOR = np.log(np.finfo(np.float32).tiny) # log CL of CL=0
 
 class CombineMaps(Node):
-  def __init__(self, force_cl, **kwargs):
+  def __init__(self, force_cl, log=False, **kwargs):
     self.force_cl = force_cl # force output in CL
+    self.log = log # accumulate log CL
     self.map = {}
+    self.converted = {} # source -> (form, nside, converted map)
+    self.total = None # LMap of summed log CL (log mode)
+    self.added = {} # source -> log CL map included in total
     super().__init__(**kwargs)
 
   def alert(self, data):
@@ -38,7 +57,9 @@ class CombineMaps(Node):
       self.map[source] = data.copy()
       self.map[source]['history'] = data['history'].copy() # keep local copy
       self.map[source]['valid'] = True
-      return self.reevaluate(data)
+      self.converted.pop(source, None) # new map, so convert again
+      return self.update_log(data, source) if self.log else \
+             self.reevaluate(data)
     else:
       logging.error('[{}] Expected either CL or chi2 in map'.format(self.name))
       return False
@@ -47,7 +68,8 @@ class CombineMaps(Node):
     source = self.last_source
     if source in self.map:
       self.map[source]['valid'] = False
-      return self.reevaluate(data)
+      return self.update_log(data, source) if self.log else \
+             self.reevaluate(data)
     else:
       logging.error('[{}] Revocation received for unknown source {}'.format(
                     self.name, source))
@@ -59,8 +81,71 @@ class CombineMaps(Node):
       if self.map[k]['valid']:
         newrevoke = True
         self.map[k]['valid'] = False
+    self.total = None
+    self.added = {}
     return newrevoke
 
+  def convert(self, k, form, nside):
+    """
+    Map of source k at the given nside, in the given form
+    ('chi2', 'cl' or 'logcl'). Cached until the map of k or nside changes.
+    """
+    if k in self.converted:
+      f, ns, ma = self.converted[k]
+      if f == form and ns == nside:
+        return ma
+
+    v = self.map[k]
+    if form == 'chi2':
+      mp = np.array(v['chi2'])
+    elif form == 'cl':
+      mp = np.array(v['cl']) if 'cl' in v else \
+           chi2(v['ndof']).cdf(np.array(v['chi2']))
+    else:
+      with np.errstate(divide='ignore'):
+        mp = np.log(np.array(v['cl'])) if 'cl' in v else \
+             chi2(v['ndof']).logcdf(np.array(v['chi2']))
+      mp = np.maximum(mp, LOG_FLOOR).astype(np.float32)
+    if len(mp) != hp.nside2npix(nside):
+      ma = hp.ud_grade(mp, nside, order_in='NESTED', order_out='NESTED')
+      if form == 'logcl':
+        ma = ma.astype(np.float32)
+    else:
+      ma = mp
+    self.converted[k] = (form, nside, ma)
+    return ma
+
+  def nside(self):
+    # find finest binning.
+    # for nested ordering, nside values can only be powers of 2,
+    # so just take largest value
+    npixs = [ len(self.map[k]['chi2']) if 'chi2' in self.map[k]
+              else len(self.map[k]['cl'])
+              for k in self.map ]
+    return hp.npix2nside(max(npixs))
+
+  def update_log(self, data, source):
+    nside = self.nside()
+    if self.total is None or self.total.nside() != nside:
+      # (re)build the sum from all the valid maps
+      self.total = LMap(nside, log=True)
+      self.added = {}
+      for k in self.map:
+        if self.map[k]['valid']:
+          self.added[k] = self.convert(k, 'logcl', nside)
+          self.total.combine(self.added[k])
+    else:
+      # take out the old map of the source, and put in the new one
+      if source in self.added:
+        self.total.uncombine(self.added.pop(source))
+      if self.map[source]['valid']:
+        self.added[source] = self.convert(source, 'logcl', nside)
+        self.total.combine(self.added[source])
+    for k in ('cl', 'chi2', 'ndof'): # the triggering source's own map
+      data.pop(k, None)
+    data['logcl'] = self.total.map.copy() # total is updated in place
+    return self.notify_maps(data)
+
   def reevaluate(self, data):
     # if all maps are chi2, then can output chi2
     use_chi2 = not self.force_cl
@@ -70,14 +155,8 @@ class CombineMaps(Node):
           use_chi2 = False
           break
 
-    # find finest binning.
-    # for nested ordering, nside values can only be powers of 2,
-    # so just take largest value
-    npixs = [ len(self.map[k]['chi2']) if 'chi2' in self.map[k]
-              else len(self.map[k]['cl'])
-              for k in self.map ]
-    maxnpix = max(npixs)
-    nside = hp.npix2nside(maxnpix)
+    nside = self.nside()
+    maxnpix = hp.nside2npix(nside)
 
     # do the calculation
     if use_chi2:
@@ -86,12 +165,7 @@ class CombineMaps(Node):
       for k in self.map:
         v = self.map[k]
         if v['valid']:
-          if len(v['chi2']) != len(m):
-            ma = hp.ud_grade(np.array(v['chi2']), nside,
-                             order_in='NESTED', order_out='NESTED')
-          else:
-            ma = np.array(v['chi2'])
-          m += ma
+          m += self.convert(k, 'chi2', nside)
           df += v['ndof']
       data['chi2'] = m
       data['ndof'] = df
@@ -99,26 +173,13 @@ class CombineMaps(Node):
     else:
       m = np.ones(maxnpix)
       for k in self.map:
-        v = self.map[k]
-        if v['valid']:
-          if 'chi2' in v:
-            rv = chi2(v['ndof'])
-            mp = rv.cdf(np.array(v['chi2']))
-            if len(v['chi2']) != len(m):
-              ma = hp.ud_grade(mp, nside,
-                               order_in='NESTED', order_out='NESTED')
-            else:
-              ma = mp
-          else:
-            if len(v['cl']) != len(m):
-              ma = hp.ud_grade(np.array(v['cl']), nside,
-                               order_in='NESTED', order_out='NESTED')
-            else:
-              ma = np.array(v['cl'])
-          m *= ma
+        if self.map[k]['valid']:
+          m *= self.convert(k, 'cl', nside)
       data['cl'] = m
 
-    # notify
+    return self.notify_maps(data)
+
+  def notify_maps(self, data):
     hlist = []
     for k in self.map:
       if self.map[k]['valid']:
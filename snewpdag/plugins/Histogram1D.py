@@ -12,6 +12,13 @@ Constructor arguments:
   out_field: string, name of field for dictionary with histogram summary
   flags: list of strings. Default is off for all flags.
     accumulate - accumulate over alerts, clear after report
+  buffer: number of scalar values to collect before binning them
+    in one vectorized pass (default 1, to bin each one on its alert,
+    or the scalars of a batch of alerts together).
+    The results are the same either way, but with a buffer the bins,
+    count, sums and flows only include the pending values once they're
+    flushed (on report, or by summary(), mean() or variance()).
+  If the extracted value is an array, all its elements are filled.
 
 Output json:
   alert:  no output
@@ -30,9 +37,11 @@ Output json:
 """
 import sys
 import logging
+import numbers
 import numpy as np
 
 from snewpdag.dag import Node
+from snewpdag.values.Hist1D import fill_array
 
 class Histogram1D(Node):
   def __init__(self, nbins, xlow, xhigh, in_field, **kwargs):
@@ -47,6 +56,7 @@ class Histogram1D(Node):
     self.index2 = tuple(v) if isinstance(v, list) else v
     f = kwargs.pop('flags', [])
     self.accumulate = 'accumulate' in f
+    self.buffer = kwargs.pop('buffer', 1)
     super().__init__(**kwargs)
     self.clear()
 
@@ -58,8 +68,32 @@ class Histogram1D(Node):
     self.sum2 = 0.0
     self.count = 0
     self.changed = True
+    self.pending = [] # scalar values not binned yet
+
+  def flush(self):
+    """
+    Bin the pending values.
+    """
+    if self.pending:
+      x = self.pending
+      self.pending = []
+      self.fill_array(x)
+
+  def fill_array(self, x):
+    w = fill_array(self, x)
+    if len(w) > 0:
+      self.count += len(w)
+      self.changed = True
 
   def fill(self, data):
+    x = self.extract(data)
+    if x is not None:
+      self.fill_value(x)
+
+  def extract(self, data):
+    """
+    Value to fill from the payload, or None if it's not there.
+    """
     if self.field in data:
       if self.index != None:
         if isinstance(self.index, int) or self.index in data[self.field]:
@@ -70,19 +104,37 @@ class Histogram1D(Node):
               logging.info('{0}: index2 {1} not found in data'.format(
                            self.name, self.index2))
               logging.info('data = {}'.format(data[self.field][self.index]))
-              return
+              return None
           else:
             x = data[self.field][self.index]
         else:
           logging.info('{0}: index {1} not found in data'.format(
                        self.name, self.index))
-          return
+          return None
       else:
         x = data[self.field]
     else:
       # field not in data
       logging.info('{0}: field {1} not found in data'.format(self.name, self.field))
+      return None
+    return x
+
+  def fill_value(self, x):
+    if type(x) is float or isinstance(x, numbers.Real):
+      if self.buffer > 1:
+        self.pending.append(x)
+        if len(self.pending) >= self.buffer:
+          self.flush()
+        return
+    elif isinstance(x, (np.ndarray, list, tuple)):
+      self.flush() # keep the order of the sums
+      try:
+        self.fill_array(x)
+      except (TypeError, ValueError):
+        logging.info('Calculation error in {0}: {1}'.format(self.name, sys.exc_info()))
       return
+    else:
+      self.flush()
 
     try:
       # need to protect against invalid values
@@ -105,6 +157,7 @@ class Histogram1D(Node):
     self.changed = True
 
   def summary(self):
+    self.flush()
     return {
              'name': self.name,
              'nbins': self.nbins,
@@ -122,9 +175,11 @@ class Histogram1D(Node):
            }
 
   def mean(self):
+    self.flush()
     return self.sum / self.count
 
   def variance(self):
+    self.flush()
     x = self.sum / self.count
     xx = self.sum2 / self.count
     return xx - x*x
@@ -133,6 +188,19 @@ class Histogram1D(Node):
     self.fill(data)
     return False # don't forward an alert
 
+  def alert_batch(self, datas):
+    # scalar values of the whole batch are binned together,
+    # unless the buffer holds them for later batches
+    xs = [ x for x in map(self.extract, datas) if x is not None ]
+    if all(type(x) is float or isinstance(x, numbers.Real) for x in xs):
+      self.pending.extend(xs)
+      if len(self.pending) >= self.buffer:
+        self.flush()
+    else:
+      for x in xs:
+        self.fill_value(x)
+    return [ False ] * len(datas)
+
   def reset(self, data):
     return False
 
@@ -140,6 +208,7 @@ class Histogram1D(Node):
     return False
 
   def report(self, data):
+    self.flush()
     if self.changed:
       if self.out_field == None:
         data.update(self.summary())
@@ -5,15 +5,25 @@ NthTimeDiff:  plugin which takes two time series
 Note that nth=1 means taking the first event in time.
 
 Configuration json:
-  nth:  which event to choose
+  nth:  which event to choose, or a list of them (e.g., [1, 3, 10]),
+        which are all found in one pass
 
 Output json:
   alert:
     t0, t1:  times used to calculate dt
     dt:  time differences (t0 - t1)
+    (arrays, one entry per nth, if nth is a list)
   revoke, reset, report:  input json unmodified
+
+A source is valid when it has at least max(nth) times.
+The nth times are selected with np.partition.
+
+Streamed time series (see TimeSeriesInput) are handled incrementally:
+the max(nth) lowest times seen so far from each source are kept, and only
+the new times[chunk_start:] are merged in.
 """
 import logging
+import numpy as np
 
 from snewpdag.dag import Node
 
@@ -23,11 +33,19 @@ class NthTimeDiff(Node):
     self.valid = [ False, False ] # flags indicating valid data from sources
     self.t = [ 0.0, 0.0 ] # nth times for each source
     self.h = [ (), () ] # histories from each source
+    self.low = [ np.empty(0), np.empty(0) ] # nth lowest times (streaming)
+    self.seen = [ 0, 0 ] # number of streamed times seen from each source
     super().__init__(**kwargs)
-    if self.nth < 1:
-      logging.error('[{}] Invalid event index {}, changed to 1'.format(
-                    self.name, self.nth))
-      self.nth = 1
+    self.multi = not np.isscalar(self.nth)
+    nths = list(self.nth) if self.multi else [ self.nth ]
+    for i in range(len(nths)):
+      if nths[i] < 1:
+        logging.error('[{}] Invalid event index {}, changed to 1'.format(
+                      self.name, nths[i]))
+        nths[i] = 1
+    self.nth = nths if self.multi else nths[0]
+    self.kth = np.array(nths) - 1 # indices of the nth values when sorted
+    self.kmax = max(nths) # number of lowest values needed
 
   def alert(self, data):
     index = self.last_watch_index()
@@ -41,8 +59,12 @@ class NthTimeDiff(Node):
       return False
 
     newrevoke = False
-    self.t[index] = self.get_nth(data['times'])
-    if self.t[index] == None:
+    if 'chunk_start' in data:
+      self.t[index] = self.stream_nth(index, data['times'],
+                                      data['chunk_start'])
+    else:
+      self.t[index] = self.get_nth(data['times'])
+    if self.t[index] is None:
       if self.valid[index]:
         self.valid[index] = False
         newrevoke = True
@@ -74,12 +96,14 @@ class NthTimeDiff(Node):
     index = self.last_watch_index()
     newrevoke = self.valid[index]
     self.valid[index] = False
+    self.seen[index] = 0
     return newrevoke
 
   def reset(self, data):
     newrevoke = self.valid[0] or self.valid[1]
     self.valid[0] = False
     self.valid[1] = False
+    self.seen = [ 0, 0 ]
     return newrevoke
 
   def report(self, data):
@@ -87,18 +111,33 @@ class NthTimeDiff(Node):
 
   def get_nth(self, values):
     """
-    get nth smallest value in the list of values.
+    get nth smallest value in the list of values
+    (or an array of them, if nth is a list).
     note that smallest is nth=1
     """
-    if len(values) < self.nth:
+    if len(values) < self.kmax:
       return None
-    lowest = [ values[i] for i in range(self.nth) ]
-    current = max(lowest)
-    for i in range(self.nth, len(values)):
-      v = values[i]
-      if v < current:
-        lowest.remove(current)
-        lowest.append(v)
-        current = max(lowest)
-    return current
+    return self.select(np.asarray(values, dtype=float))
+
+  def select(self, a):
+    """
+    nth smallest value(s) of an array with at least max(nth) values.
+    """
+    v = np.partition(a, self.kth)[self.kth]
+    return v if self.multi else v[0]
 
+  def stream_nth(self, index, times, start):
+    """
+    get nth smallest value of a streamed series, merging the new values
+    times[start:] into the lowest ones seen so far from this source.
+    Starts over if start is 0, or if chunks have been missed.
+    """
+    if start != self.seen[index]:
+      start = 0
+    low = self.low[index] if start > 0 else np.empty(0)
+    low = np.concatenate((low, times[start:]))
+    if len(low) > self.kmax:
+      low = np.partition(low, self.kmax - 1)[:self.kmax]
+    self.low[index] = low
+    self.seen[index] = len(times)
+    return self.select(low) if len(low) == self.kmax else None
@@ -18,17 +18,31 @@ Constructor arguments:
   flags: list of strings. Default is off for all flags.
     overflow - calculate overflow/underflow
     stats - calculate statistics
+    reuse - bin each alert into the same output array, rather than
+            a new one (so downstream nodes mustn't keep it)
 
 Output json:
   alert:
     add count
         overflow, underflow (if 'overflow' flag)
         mean, rms (if 'stats' flag)
+
+The bin edges are computed once.  A series is binned, along with its
+underflow and overflow, with a single np.bincount.
+A batch of alerts (see Node.alert_batch) with short series is binned
+in one pass.
+
+For a streamed series (see TimeSeriesInput), only the new values
+in_field[chunk_start:] are binned, into a histogram kept since the start
+of the burst, and the histogram of the whole series so far is forwarded.
 """
 import logging
+import math
 import numpy as np
 
 from snewpdag.dag import Node
+from snewpdag.values.Hist1D import uniform_edges, histogram_index, \
+                                   histogram_counts, chunk_ranges
 
 class SeriesBinner(Node):
   def __init__(self, in_field, nbins, xlow, xhigh,
@@ -43,19 +57,25 @@ class SeriesBinner(Node):
     flags = kwargs.pop('flags', [])
     self.calc_overflow = 'overflow' in flags
     self.calc_stats = 'stats' in flags
+    self.reuse = 'reuse' in flags
     super().__init__(**kwargs)
+    self.edges = uniform_edges(self.nbins, self.xlow, self.xhigh)
+    self.out = np.zeros(self.nbins, dtype=np.int64) # output, if reuse
     self.clear()
 
   def clear(self):
-    self.bins = np.zeros(self.nbins)
-    self.edges = np.zeros(self.nbins+1)
-    self.overflow = 0.0
-    self.underflow = 0.0
+    # stream mode state, with the same types as a single alert's output
+    self.bins = np.zeros(self.nbins, dtype=np.int64)
+    self.overflow = 0
+    self.underflow = 0
     self.sum = 0.0
     self.sum2 = 0.0
     self.count = 0
 
-  def alert(self, data):
+  def summary(self, data, h, n, underflow, overflow, s, s2):
+    """
+    Add the histogram h of n values (with sums s and s2) to the payload.
+    """
     d = {
           'nbins': self.nbins,
           'xlow': self.xlow,
@@ -63,29 +83,88 @@ class SeriesBinner(Node):
           'in_field': self.field,
           'out_xfield': self.xname,
           'out_yfield': self.yname,
-          'count': self.count,
+          'count': n,
         }
-    vs = data[self.field]
-    h, edges = np.histogram(vs, self.nbins, (self.xlow, self.xhigh))
-    # note edges will have len(h)+1, since last element is top edge.
+    # note edges has len(h)+1, since last element is top edge.
     # also note (?) that top edge is inclusive,
     # but lower bins' right edge is exclusive.
-    d[self.xname] = edges[:-1]
+    d[self.xname] = self.edges[:-1]
     d[self.yname] = h
-    n = len(vs)
-    d['count'] = n
     if self.calc_overflow:
-      d['overflow'] = np.count_nonzero(vs > self.xhigh)
-      d['underflow'] = np.count_nonzero(vs < self.xlow)
+      d['overflow'] = overflow
+      d['underflow'] = underflow
     if self.calc_stats:
-      s = np.sum(vs)
-      s2 = np.sum(vs*vs)
       mean = s / n
       d['mean'] = mean
-      d['rms'] = sqrt(s2 / n - mean*mean)
+      d['rms'] = math.sqrt(s2 / n - mean*mean)
     if self.out_field == None:
       data.update(d)
     else:
       data[self.out_field] = d
+
+  def alert(self, data):
+    if 'chunk_start' in data:
+      return self.alert_stream(data)
+    vs = np.asarray(data[self.field])
+    if self.reuse:
+      self.out[:] = 0
+      h, underflow, overflow = histogram_counts(vs, self.nbins,
+          self.xlow, self.xhigh, self.edges, out=self.out)
+    else:
+      h, underflow, overflow = histogram_counts(vs, self.nbins,
+          self.xlow, self.xhigh, self.edges)
+    s, s2 = (np.sum(vs), np.sum(vs*vs)) if self.calc_stats else (0, 0)
+    self.summary(data, h, len(vs), underflow, overflow, s, s2)
     return True
 
+  def alert_stream(self, data):
+    vs = np.asarray(data[self.field])
+    start = data['chunk_start']
+    if start != self.count: # new burst, or missed chunks: start over
+      self.clear()
+      start = 0
+    x = vs[start:]
+    h, underflow, overflow = histogram_counts(x, self.nbins,
+        self.xlow, self.xhigh, self.edges, out=self.bins)
+    self.count = len(vs)
+    self.underflow += underflow
+    self.overflow += overflow
+    if self.calc_stats:
+      self.sum += np.sum(x)
+      self.sum2 += np.sum(x*x)
+    h = self.bins if self.reuse else self.bins.copy() # updated in place
+    self.summary(data, h, self.count, self.underflow, self.overflow,
+                 self.sum, self.sum2)
+    return True
+
+  def alert_batch(self, datas):
+    if any('chunk_start' in data for data in datas):
+      return [ self.alert(data) for data in datas ]
+    vss = [ np.asarray(data[self.field]) for data in datas ]
+    vs = []
+    for i, j in chunk_ranges([ len(vs) for vs in vss ]):
+      if j - i == 1:
+        vs.append(self.alert(datas[i]))
+      else:
+        vs.extend(self.bin_batch(datas[i:j], vss[i:j]))
+    return vs
+
+  def bin_batch(self, datas, vss):
+    n = len(vss)
+    lens = [ len(vs) for vs in vss ]
+    x = np.concatenate(vss)
+    item = np.repeat(np.arange(n), lens)
+    ix = histogram_index(x, self.nbins, self.xlow, self.xhigh, self.edges)
+    ok = ix >= 0
+    hs = np.bincount(item[ok] * self.nbins + ix[ok],
+                     minlength=n * self.nbins).reshape(n, self.nbins)
+    if self.calc_overflow:
+      overflow = np.bincount(item[x > self.xhigh], minlength=n)
+      underflow = np.bincount(item[x < self.xlow], minlength=n)
+    for i in range(n):
+      vs = vss[i]
+      s, s2 = (np.sum(vs), np.sum(vs*vs)) if self.calc_stats else (0, 0)
+      self.summary(datas[i], hs[i], lens[i],
+                   int(underflow[i]) if self.calc_overflow else 0,
+                   int(overflow[i]) if self.calc_overflow else 0, s, s2)
+    return [ True ] * n
@@ -63,15 +63,11 @@ class ShapeComparison(Node):
 
 
   def metric_list(self, values1, values2):
-    mlist = [0.0] * self.dt_N
-
     hist2 = SHF.fill_hist(self.h_bins, self.h_low, self.h_up, values2, 0.0)
     hist2 = SHF.remove_flow(hist2)
-    for i in range(self.dt_N):
-      hist1 = SHF.fill_hist(self.h_bins, self.h_low, self.h_up, values1, self.dt0 + i*self.dt_step)
-      hist1 = SHF.remove_flow(hist1)
-      metric = SHF.diff_hist(hist1, hist2, self.scale)
-
-      mlist[i] = metric
+    # all the shifted histograms of values1 at once (see SHF.scan_hist)
+    offsets = self.dt0 + np.arange(self.dt_N) * self.dt_step
+    mlist = SHF.scan_metric(self.h_bins, self.h_low, self.h_up, values1,
+                            hist2, offsets, self.scale)
 
-    return mlist
+    return mlist.tolist()
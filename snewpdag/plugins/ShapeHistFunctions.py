@@ -1,8 +1,182 @@
+"""
+ShapeHistFunctions:  histogram functions for the shape comparison methods
+(ShapeComparison, BayesianBlocks).
+
+fill_hist, diff_hist and minimise are numpy implementations.  They give
+the same results as the original pure python ones (fill_hist_py,
+diff_hist_py, minimise_py), which are kept for reference and testing:
+bins are found with one searchsorted call, and sums are added in the same
+order as the python loops.
+
+scan_hist and scan_metric compute the histograms and metrics for a whole
+scan over time offsets dt at once, with the same results as calling
+fill_hist and diff_hist for each offset.
+"""
+import sys
 import math
+import logging
 import numpy as np
 
+from snewpdag.values.Hist1D import seq_sum
+
+_pow = np.frompyfunc(pow, 2, 1) # same rounding as python's pow (np.power differs)
 
 def fill_hist(h_bins, h_low, h_up, values, dt_offset):
+  """
+  Histogram of values + dt_offset in h_bins bins from h_low to h_up,
+  with an underflow bin first and an overflow bin last (h_bins+2 in all),
+  normalised to the number of values within range.  Returns an array.
+  """
+  bin_width = (float(h_up) - float(h_low)) / float(h_bins)
+  edges = np.arange(h_bins + 1) * bin_width + h_low
+  v = np.asarray(values, dtype=float) + dt_offset
+  ix = edges.searchsorted(v, side='right') - 1 # edges[ix] <= v < edges[ix+1]
+  inrange = (ix >= 0) & (ix < h_bins)
+  hist = np.zeros(h_bins + 2)
+  hist[1:-1] = np.bincount(ix[inrange], minlength=h_bins)
+  hist[0] = np.count_nonzero(v < h_low)
+  hist[-1] = np.count_nonzero(~inrange & (v >= h_up))
+  return hist / (float(len(v)) - hist[0] - hist[-1]) #normalise excluding flow bins
+
+
+def remove_flow(hist): #remove the flow bins
+  return hist[1:-1]
+
+
+def diff_hist(hist1, hist2, scale):
+  """
+  Metric for the difference between two histograms.
+  """
+  if len(hist1) != len(hist2):
+    logging.error("histograms with different number of bins cannot be merged!")
+    sys.exit(2)
+
+  h1 = np.asarray(hist1, dtype=float)
+  h2 = np.asarray(hist2, dtype=float)
+  h1max = np.max(h1) * scale
+  h2max = np.max(h2) * scale
+  sum_hist = np.where((h1 != 0) & (h2 != 0), h1 + h2, h1max + h2max)
+  return seq_sum(0, sum_hist * np.abs(h2 - h1))
+
+
+def minimise(mlist, dt0, dt_step, dt_N, polyN, fit_range):
+  """
+  dt at the minimum of the metric mlist(dt), where dt = dt0 + i*dt_step:
+  fit a polynomial of order polyN within fit_range of the smallest metric,
+  and return the middle of the first step over which its derivative
+  changes sign (or 0).
+  """
+  dt_list = dt0 + np.arange(dt_N) * dt_step
+
+  #setting fit range
+  i_fit_range = int(fit_range / dt_step) + 1
+  i_min_metric = np.argmin(mlist)
+  i_low = 0
+  i_up = dt_N - 1
+  if (i_min_metric - i_fit_range) > 0:
+    i_low = i_min_metric - i_fit_range
+  if (i_min_metric + i_fit_range) < (dt_N - 1):
+    i_up = i_min_metric + i_fit_range
+  coeff = np.polyfit(dt_list[i_low:i_up], np.asarray(mlist)[i_low:i_up], polyN) #polynomial fit, coeff[0]*x^polyN + coeff[1]*x^(polyN-1) + ...
+
+  # derivative at each dt, with the terms added in order
+  iii = np.arange(polyN)
+  terms = (coeff[:polyN] * (polyN - iii)) * \
+          _pow(dt_list[:, np.newaxis], polyN - 1 - iii).astype(float)
+  func = np.cumsum(terms, axis=1)[:, -1] if polyN > 0 else np.zeros(dt_N)
+
+  ii = np.flatnonzero(func[1:] * func[:-1] <= 0)
+  if len(ii) == 0:
+    return 0
+  ii = ii[0] + 1
+  return (dt_list[ii] + dt_list[ii-1])/2.0
+
+
+def scan_hist(h_bins, h_low, h_up, values, offsets):
+  """
+  fill_hist(h_bins, h_low, h_up, values, dt) for each dt in offsets,
+  as the rows of a 2D array (len(offsets) x h_bins+2).
+  The values are sorted once, and the number of values below each edge
+  for every offset is found with one searchsorted call.
+  """
+  bin_width = (float(h_up) - float(h_low)) / float(h_bins)
+  edges = np.arange(h_bins + 1) * bin_width + h_low
+  s = np.sort(np.asarray(values, dtype=float))
+  nvalid = len(s) - np.count_nonzero(np.isnan(s))
+  dt = np.asarray(offsets, dtype=float)[:, np.newaxis]
+  t = np.append(edges, h_up)[np.newaxis, :]
+
+  # c = number of values v with v + dt < t
+  c = s.searchsorted(t - dt)
+  if len(s) > 0:
+    # v < t - dt and v + dt < t can differ by rounding, so where
+    # s[c-1] + dt < t <= s[c] + dt doesn't hold, find c by bisection
+    # (v + dt < t is monotonic in v, so is true for a prefix of s)
+    n = len(s)
+    bad = ((c > 0) & (s[np.maximum(c - 1, 0)] + dt >= t)) | \
+          ((c < n) & (s[np.minimum(c, n - 1)] + dt < t))
+    if bad.any():
+      d = np.broadcast_to(dt, c.shape)[bad]
+      tt = np.broadcast_to(t, c.shape)[bad]
+      lo = np.zeros(len(d), dtype=c.dtype)
+      hi = np.full(len(d), n, dtype=c.dtype)
+      while True:
+        active = lo < hi
+        if not active.any():
+          break
+        mid = (lo + hi) // 2
+        below = s[np.minimum(mid, n - 1)] + d < tt
+        lo = np.where(active & below, mid + 1, lo)
+        hi = np.where(active & ~below, mid, hi)
+      c[bad] = lo
+
+  hist = np.empty((len(c), h_bins + 2))
+  hist[:, 0] = c[:, 0] # edges[0] == h_low
+  hist[:, 1:-1] = np.diff(c[:, :-1], axis=1)
+  hist[:, -1] = nvalid - np.maximum(c[:, -2], c[:, -1])
+  return hist / (float(len(s)) - hist[:, :1] - hist[:, -1:]) #normalise excluding flow bins
+
+
+def scan_metric(h_bins, h_low, h_up, values1, hist2, offsets, scale, block=1<<20):
+  """
+  diff_hist(remove_flow(fill_hist(h_bins, h_low, h_up, values1, dt)),
+  hist2, scale) for each dt in offsets, as an array.
+  The histograms are made for block/h_bins offsets at a time.
+  """
+  s = np.sort(np.asarray(values1, dtype=float))
+  offsets = np.asarray(offsets, dtype=float)
+  n = max(1, block // (h_bins + 2))
+  metric = np.empty(len(offsets))
+  for i in range(0, len(offsets), n):
+    h1 = scan_hist(h_bins, h_low, h_up, s, offsets[i:i+n])[:, 1:-1]
+    metric[i:i+n] = diff_hists(h1, hist2, scale)
+  return metric
+
+
+def diff_hists(hists1, hist2, scale):
+  """
+  diff_hist(h, hist2, scale) for each row h of the 2D array hists1,
+  as an array.
+  """
+  h1 = np.asarray(hists1, dtype=float)
+  h2 = np.asarray(hist2, dtype=float)
+  if h1.shape[1] != len(h2):
+    logging.error("histograms with different number of bins cannot be merged!")
+    sys.exit(2)
+
+  h1max = np.max(h1, axis=1) * scale
+  h2max = np.max(h2) * scale
+  sum_hist = np.where((h1 != 0) & (h2 != 0), h1 + h2,
+                      (h1max + h2max)[:, np.newaxis])
+  # terms added in order, as in diff_hist
+  return np.cumsum(sum_hist * np.abs(h2 - h1), axis=1)[:, -1]
+
+
+#
+# original pure python implementations
+#
+
+def fill_hist_py(h_bins, h_low, h_up, values, dt_offset):
   bin_width = (float(h_up) - float(h_low)) / float(h_bins)
   hist = [0.0] * (h_bins + 2) #add 2 extra bins for underflow and overflow
 
@@ -28,14 +202,7 @@ def fill_hist(h_bins, h_low, h_up, values, dt_offset):
   return hist
 
 
-def remove_flow(hist): #remove the flow bins
-  hist.remove(hist[-1])
-  hist.remove(hist[0])
-
-  return hist
-
-
-def diff_hist(hist1, hist2, scale):
+def diff_hist_py(hist1, hist2, scale):
   if len(hist1) != len(hist2):
     print("histograms with different number of bins cannot be merged!")
     exit()
@@ -57,7 +224,7 @@ def diff_hist(hist1, hist2, scale):
   return metric
 
 
-def minimise(mlist, dt0, dt_step, dt_N, polyN, fit_range):
+def minimise_py(mlist, dt0, dt_step, dt_N, polyN, fit_range):
   dt_list = [(dt0 + i*dt_step) for i in range(dt_N)]
 
   #setting fit range
@@ -1,18 +1,26 @@
 """
 SkymapInput - read a healpix skymap from a file
+
+The map is read once per process, and shared (read-only) by all instances
+which read the same file.  Each alert gets its own copy.
 """
 import logging
 import numpy as np
 import healpy as hp
 
-from snewpdag.dag import Node
+from snewpdag.dag import Node, shared, file_stamp, readonly
 from snewpdag.values import LMap
 
+def read_map(filename):
+  m = LMap(hp.read_map(filename, nest=True))
+  readonly(m.map) # copy() makes a writeable copy
+  return m
+
 class SkymapInput(Node):
   def __init__(self, filename, out_field, **kwargs):
     self.out_field = out_field
-    m = hp.read_map(filename, nest=True)
-    self.map = LMap(m)
+    self.map = shared(('SkymapInput',) + file_stamp(filename),
+                      lambda: read_map(filename))
     super().__init__(**kwargs)
 
   def alert(self, data):
@@ -10,6 +10,20 @@ JSON input fields:
 
 Output JSON:
     dictionary of input pairs with time difference (TODO - pyhonise the format)
+    'tdelay_curve' (if the curve argument is True):  dictionary of input
+        pairs with the scanned time delays [ms] and their chi2 values
+
+Constructor arguments:
+    curve:  also output the whole chi2 scan for each pair (default False)
+    executor:  'serial' (default), 'thread' or 'process', to compute the
+        pairs one after the other, or concurrently in a pool of threads or
+        processes (see dag.Executor).  Worker processes get the input
+        arrays through shared memory.
+    workers:  number of workers in the pool (default: number of processors)
+
+Only pairs of valid sources are compared.  The result for each pair is
+cached with the versions of its two inputs (counting alerts), so an alert
+only recomputes the pairs which involve its source.
 
 Data assumptions:
     - it is assumed that both data has 0.1 ms binning
@@ -23,11 +37,17 @@ The algorithm is taken from github.com/SNEWS2/lightcurve_match.
 import logging
 import numpy as np
 
-from snewpdag.dag import Node
+from snewpdag.dag import Node, Executor
 
 class TimeDistDiff(Node):
   def __init__(self, **kwargs):
     self.map = {}
+    self.version = {} # source -> number of alerts received
+    self.pairs = {} # (i, j) -> ((version i, version j), gettdelay result)
+    self.curve = kwargs.pop('curve', False)
+    self.executor = kwargs.pop('executor', 'serial')
+    self.workers = kwargs.pop('workers', None)
+    self.shm = {} # source -> (SharedArray t_low, SharedArray t_bins)
     super().__init__(**kwargs)
 
   def update(self, data):
@@ -40,18 +60,24 @@ class TimeDistDiff(Node):
         self.map[source] = data.copy()
         self.map[source]['history'] = data['history'].copy() # keep local copy
         self.map[source]['valid'] = True
+        self.version[source] = self.version.get(source, 0) + 1
+        self.release_arrays(source)
       else:
         logging.error('[{}] Expected t_low and t_bins arrays in time distribution'.format(self.name))
         return
     elif action == 'revoke':
       if source in self.map:
         self.map[source]['valid'] = False
+        self.drop_pairs(source)
+        self.release_arrays(source)
       else:
         logging.error('[{}] Revocation received for unknown source {}'.format(self.name, source))
         return
     elif action == 'reset':
       for source in self.map:
         self.map[source]['valid'] = False
+      self.pairs.clear()
+      self.release_arrays()
       self.notify(action, data)
       return
     elif action == 'report':
@@ -64,19 +90,27 @@ class TimeDistDiff(Node):
 
     # start constructing output data.
     data['tdelay'] = {}
-    # do the calculation
-    count=0
-    #ndata = data.copy()
-    result = 0
-    for i in self.map:
-        for j in self.map:
+    if self.curve:
+      data['tdelay_curve'] = {}
+    # do the calculation (only for pairs with a new input)
+    valid = [ k for k in self.map if self.map[k]['valid'] ]
+    todo = []
+    for i in valid:
+        for j in valid:
+            if i < j:
+                versions = (self.version[i], self.version[j])
+                if not ((i,j) in self.pairs and self.pairs[(i,j)][0] == versions):
+                    todo.append((i, j, versions))
+    #here the main time difference calculation comes
+    for (i, j, versions), result in zip(todo, self.compute(todo)):
+        self.pairs[(i,j)] = (versions, result)
+    for i in valid:
+        for j in valid:
             if i < j:
-                count+=1
-                #here the main time difference calculation comes
-                #print(count, gettdelay(self.map[i]['t'],self.map[i]['n'],self.map[j]['t'],self.map[j]['n']))
-                #result = gettdelay(self.map[i]['t'],self.map[i]['n'],self.map[j]['t'],self.map[j]['n'])
-                data['tdelay'][(i,j)] = gettdelay(self.map[i]['t_low'],self.map[i]['t_bins'],self.map[j]['t_low'],self.map[j]['t_bins'])
-                #print('Hola', i, j, ndata, 'result', result)
+                result = self.pairs[(i,j)][1]
+                data['tdelay'][(i,j)] = result[:2]
+                if self.curve:
+                  data['tdelay_curve'][(i,j)] = result[2:]
     # notify
     # (JCT: notify if have a diff to forward)
     #action_verb = 'revoke' if len(hlist) <= 1 else 'alert'
@@ -89,6 +123,53 @@ class TimeDistDiff(Node):
       data['history'].combine(hlist)
       self.notify(action_verb, data)
     #print('I notify', data, result)
+
+  def compute(self, todo):
+    """
+    gettdelay results for a list of pairs (i, j, versions),
+    computed serially or in the executor's pool.
+    """
+    pool = Executor.get_executor(self.executor, self.workers)
+    if pool is None or len(todo) <= 1:
+      return [ gettdelay(self.map[i]['t_low'],self.map[i]['t_bins'],self.map[j]['t_low'],self.map[j]['t_bins'],curve=self.curve)
+               for i, j, versions in todo ]
+    if self.executor == 'process':
+      futures = [ pool.submit(gettdelay_shared, self.shared_arrays(i),
+                              self.shared_arrays(j), self.curve)
+                  for i, j, versions in todo ]
+    else:
+      futures = [ pool.submit(gettdelay, self.map[i]['t_low'],self.map[i]['t_bins'],self.map[j]['t_low'],self.map[j]['t_bins'],curve=self.curve)
+                  for i, j, versions in todo ]
+    return [ f.result() for f in futures ]
+
+  def shared_arrays(self, source):
+    """
+    Descriptors of the t_low and t_bins arrays of source in shared memory.
+    """
+    if source not in self.shm:
+      self.shm[source] = (Executor.SharedArray(self.map[source]['t_low']),
+                          Executor.SharedArray(self.map[source]['t_bins']))
+    return tuple( a.desc for a in self.shm[source] )
+
+  def release_arrays(self, source=None):
+    """
+    Free the shared memory of source (or of all sources).
+    """
+    for k in ([ source ] if source is not None else list(self.shm)):
+      if k in self.shm:
+        for a in self.shm.pop(k):
+          a.release()
+
+  def dispose(self):
+    self.release_arrays()
+    super().dispose()
+
+  def drop_pairs(self, source):
+    """
+    Forget the cached results of the pairs involving source.
+    """
+    for pair in [ p for p in self.pairs if source in p ]:
+      del self.pairs[pair]
       
 #normalise time series for chi2
 #returns err^2 as a second output
@@ -100,12 +181,125 @@ def normalizeforchi2(n1,t1,windowleft,windowright):
     if mean < 0: print("WARNING: first 1000 bins of data have abnormal event rate")
     return n1/mean, nerr1/mean/mean
 
-def gettdelay(t1,n1,t2,n2):
-    t1 = np.array(t1)
-    n1 = np.array(n1)
+def gettdelay_shared(desc1, desc2, curve=False):
+    """
+    gettdelay on arrays in shared memory, for worker processes:
+    desc1 and desc2 are the descriptors of (t, n) for the two series.
+    """
+    with Executor.attached(desc1[0]) as t1, Executor.attached(desc1[1]) as n1, \
+         Executor.attached(desc2[0]) as t2, Executor.attached(desc2[1]) as n2:
+        return gettdelay(t1,n1,t2,n2,curve=curve)
+
+def gettdelay(t1,n1,t2,n2,curve=False):
+    """
+    Time delay between two time distributions [ms], from a chi2 scan
+    over delays of up to 100 ms in steps of 0.1 ms.
+    Returns (mintdelay, minchi2), or (mintdelay, minchi2, tdelays, chi2s)
+    with the whole scan (delays in ms) if curve is True.
+
+    The chi2 of all the delays is computed at once:  each delay selects a
+    window of the first series, which is a shift of its start index, so
+    the sums over 50 ms bins are taken from a table of bin sums for every
+    start index (modulo the bin size) within the scan.  The results are
+    the same as gettdelay_loop.
+    """
+    t1 = np.asarray(t1)
+    n1 = np.asarray(n1)
+
+    t2 = np.asarray(t2)
+    n2 = np.asarray(n2)
+
+    if np.any(np.diff(t1) <= 0) or np.any(np.diff(t2) <= 0):
+        result = gettdelay_loop(t1,n1,t2,n2)
+        return result + (None, None) if curve else result
+
+    tsstep1 = t1[1]-t1[0] #step of the time series
+    tsstep2 = t2[1]-t2[0] #step of the time series
+
+    scantmax = 100./1e3 #max window scan in [s]
+    scanstep = 0.1/1e3 #scanstep
+    windowmax   = 300./1e3 #window where matching is performed
+    binsize     = 50./1e3 #bin size - should be multiple of 2*windowmax
+    nelements   = int(binsize/tsstep1)
+
+    t1conv = np.convolve(t1, np.ones(nelements+1)/(nelements+1), mode='valid') #running averages - we add +1 to have average in the time series time point
+    n1conv = np.convolve(n1, np.ones(nelements+1)/(nelements+1), mode='valid')
+    maxt1 = np.mean(t1conv[tuple([n1conv == np.amax(n1conv)])])
+    idx = (np.abs(t1 - maxt1)).argmin() #find nearest element to this time
+    maxt1 = t1[idx]
+
+    n1,nerr1 = normalizeforchi2(n1,t1,maxt1-windowmax-tsstep1/2.,maxt1+windowmax+tsstep1/2.)
+    n2,nerr2 = normalizeforchi2(n2,t2,maxt1-windowmax-tsstep2/2.,maxt1+windowmax+tsstep2/2.)
+
+    tdelay = np.linspace(-scantmax, scantmax, num=int(2*scantmax/scanstep)+1)
+
+    # window of the first series for each delay: [start1, stop1)
+    start1 = t1.searchsorted(maxt1 - windowmax + tdelay - tsstep1/2., side='left')
+    stop1 = t1.searchsorted(maxt1 + windowmax + tdelay - tsstep1/2., side='right')
+    # fixed window of the second series
+    start2 = t2.searchsorted(maxt1 - windowmax - tsstep2/2., side='left')
+    stop2 = t2.searchsorted(maxt1 + windowmax - tsstep2/2., side='right')
+
+    #drop excess of the elements:  number of whole bins compared
+    nbins = np.maximum(np.minimum(stop1 - start1, stop2 - start2), 0) // nelements
+    maxbins = np.max(nbins)
+
+    # bin sums of the first series for every start index within the scan
+    # (rows: start index modulo nelements from the lowest start)
+    base = np.min(start1)
+    shift = (start1 - base) % nelements
+    width = max((np.max(stop1) - base) // nelements, 1)
+    sum1 = np.zeros((nelements, width))
+    err1 = np.zeros_like(sum1)
+    for r in np.unique(shift):
+        m = (np.max(stop1) - base - r) // nelements
+        seg = slice(base + r, base + r + m * nelements)
+        sum1[r, :m] = np.sum(n1[seg].reshape(-1, nelements), axis=1)
+        err1[r, :m] = np.sum(nerr1[seg].reshape(-1, nelements), axis=1)
+    seg = slice(start2, start2 + maxbins * nelements)
+    sample2 = np.sum(n2[seg].reshape(-1, nelements), axis=1)
+    serr2 = np.sum(nerr2[seg].reshape(-1, nelements), axis=1)
+
+    # delays x bins
+    # (bins beyond nbins of a delay are ignored below)
+    col = (start1 - base - shift)[:, np.newaxis] // nelements + np.arange(maxbins)
+    col = np.minimum(col, width - 1)
+    sample1 = sum1[shift[:, np.newaxis], col]
+    serr1 = err1[shift[:, np.newaxis], col]
+    errsum = serr1+serr2
+    chi2 = np.divide(np.power(sample1-sample2,2), errsum, out=np.zeros_like(sample1), where=errsum!=0)
+
+    # chi2 is normalized to the number of elements since for each shift this can vary
+    chi2sum = np.empty(len(tdelay))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for k in np.unique(nbins):
+            rows = np.flatnonzero(nbins == k)
+            chi2sum[rows] = np.sum(chi2[rows, :k], axis=1)/k
+
+    # the last of the smallest values (after the last nan, if any),
+    # as for the sequential comparison in gettdelay_loop
+    nan = np.flatnonzero(np.isnan(chi2sum))
+    first = nan[-1] if len(nan) > 0 else 0
+    if first < len(chi2sum) - 1:
+        if len(nan) > 0:
+            first += 1
+        tail = chi2sum[first:]
+        first += len(tail) - 1 - np.argmin(tail[::-1])
+    mintdelay = tdelay[first]*1000.
+    minchi2 = chi2sum[first]
+    logging.debug('This is the deltat: {}'.format(mintdelay))
+    if curve:
+        return (mintdelay, minchi2, tdelay*1000., chi2sum)
+    return (mintdelay,minchi2)
+
+def gettdelay_loop(t1,n1,t2,n2):
+    # original scan, one delay at a time (for reference and for
+    # time series which aren't increasing)
+    t1 = np.asarray(t1)
+    n1 = np.asarray(n1)
 
-    t2 = np.array(t2)
-    n2 = np.array(n2) 
+    t2 = np.asarray(t2)
+    n2 = np.asarray(n2)
 
     tsstep1 = t1[1]-t1[0] #step of the time series
     tsstep2 = t2[1]-t2[0] #step of the time series
@@ -141,11 +335,11 @@ def gettdelay(t1,n1,t2,n2):
         minsize = min(len(sample1),len(sample2))
         minsize = minsize - minsize%nelements
         if len(sample1) != minsize:
-            print("Warning - dropping",len(sample1) - minsize,"last element(s) from the first data")
+            logging.debug('dropping {} last element(s) from the first data'.format(len(sample1) - minsize))
             sample1 = sample1[0:minsize]
             serr1 = serr1[0:minsize]
         if len(sample2) != minsize:
-            print("Warning - dropping",len(sample2) - minsize,"last element(s) from the second data")
+            logging.debug('dropping {} last element(s) from the second data'.format(len(sample2) - minsize))
             sample2 = sample2[0:minsize]
             serr2 = serr2[0:minsize]
 
@@ -160,6 +354,5 @@ def gettdelay(t1,n1,t2,n2):
         if not (minchi2 < chi2sum):
             mintdelay = tdelay*1000.
             minchi2   = chi2sum
-    print('This is the deltat:', mintdelay)
-    #exit()
+    logging.debug('This is the deltat: {}'.format(mintdelay))
     return (mintdelay,minchi2)
@@ -13,12 +13,34 @@ Note that the last value of t_low has to be used as t_high,
 which discards the last entry in t_bins
 
 This should be able to read a file generated by SNEWS/lightcurve_match/simulation/detectorrate
+
+The parsed columns are shared (see dag.Shared.npy_cache), so a file is
+only parsed once, and the output arrays are read-only.  If the on-disk
+cache is turned on, they are views of the memory-mapped cache.
 """
 import logging
 import csv
 import numpy as np
 
-from snewpdag.dag import Node
+from snewpdag.dag import Node, npy_cache
+
+def parse_tn(name):
+  tt = []
+  nn = []
+  with open(name, newline='') as csvfile:
+    reader = csv.reader(csvfile, delimiter='\t')
+    for row in reader:
+      tt.append(float(row[0]))
+      nn.append(float(row[1]))
+  return { 't': np.array(tt), 'n': np.array(nn) }
+
+def read_tn(name):
+  """
+  Read a tab-delimited file of time, number of events.
+  Returns two read-only arrays (times, numbers).
+  """
+  a = npy_cache(name, 'tn', parse_tn)
+  return a['t'], a['n']
 
 class TimeDistFileInput(Node):
   def __init__(self, **kwargs):
@@ -35,23 +57,14 @@ class TimeDistFileInput(Node):
           return False
       else:
         tt, nn = self.read_tn(data['filename'])
-      data['t_low'] = np.array(tt[:-1])
-      data['t_low'].flags.writeable = False
-      data['t_high'] = tt[-1]
-      data['t_bins'] = np.array(nn[:-1])
-      data['t_bins'].flags.writeable = False
+      data['t_low'] = tt[:-1] # read-only
+      data['t_high'] = float(tt[-1])
+      data['t_bins'] = nn[:-1] # read-only
       return True
     else:
       logging.error('[{}] Missing filename'.format(self.name))
       return False
 
   def read_tn(self, name):
-    tt = []
-    nn = []
-    with open(name, newline='') as csvfile:
-      reader = csv.reader(csvfile, delimiter='\t')
-      for row in reader:
-        tt.append(float(row[0]))
-        nn.append(float(row[1]))
-    return tt,nn
+    return read_tn(name)
 
@@ -10,13 +10,33 @@ We might want to check that 'times' contains an array of numbers.
 At this point we don't.
 
 It is not assumed that the time data is sorted.
+
+Constructor arguments (optional):
+  stream:  if True, each alert carries a chunk of the times of a burst,
+           which are appended to those already received from the same
+           source (default False).
+  capacity:  initial size of the buffer of a series, in stream mode.
+
+In stream mode, the chunks are copied into a preallocated buffer, which
+is doubled in size when full.  Each burst has its own DAG (see
+app.inject), so a node only ever sees chunks of one burst; a revocation
+or reset starts a new series.  The output alert has
+  'times':  read-only view of all the times of the series so far
+  'chunk_start':  index in 'times' of the first time of the new chunk
+so downstream nodes (e.g., NthTimeDiff, SeriesBinner) can update
+incrementally from times[chunk_start:], and start over when
+chunk_start is 0.
 """
 import logging
+import numpy as np
 
 from snewpdag.dag import Node
 
 class TimeSeriesInput(Node):
   def __init__(self, **kwargs):
+    self.stream = kwargs.pop('stream', False)
+    self.capacity = kwargs.pop('capacity', 1024)
+    self.series = {} # source -> [ buffer, number of times ]
     super().__init__(**kwargs)
 
   def alert(self, data):
@@ -26,8 +46,40 @@ class TimeSeriesInput(Node):
     - if it's not an alert, just pass it along.
     """
     if 'times' in data:
+      if self.stream:
+        self.append(data)
       return True
     else:
       logging.error('[{}] Expected times field not found'.format(self.name))
       return False
 
+  def revoke(self, data):
+    self.series.pop(self.last_source, None)
+    return True
+
+  def reset(self, data):
+    self.series = {}
+    return True
+
+  def append(self, data):
+    """
+    Append the chunk of times to the buffer of its series,
+    and replace it by a view of the whole series so far.
+    """
+    chunk = np.asarray(data['times'], dtype=float).ravel()
+    b = self.series.get(self.last_source)
+    if b is None:
+      # new series, so new buffer (downstream may still hold views of the old)
+      b = [ np.empty(max(self.capacity, len(chunk))), 0 ]
+      self.series[self.last_source] = b
+    buf, n = b
+    if n + len(chunk) > len(buf):
+      newbuf = np.empty(max(2 * len(buf), n + len(chunk)))
+      newbuf[:n] = buf[:n]
+      buf = b[0] = newbuf
+    buf[n:n+len(chunk)] = chunk
+    b[1] = n + len(chunk)
+    view = buf[:b[1]]
+    view.flags.writeable = False
+    data['times'] = view
+    data['chunk_start'] = n
@@ -7,6 +7,7 @@ from .SkymapInput import SkymapInput
 
 from .NthTimeDiff import NthTimeDiff
 from .CombineMaps import CombineMaps
+from .OutputMap import OutputMap
 from .TimeDistDiff import TimeDistDiff
 from .ShapeComparison import ShapeComparison
 from .BayesianBlocks import BayesianBlocks
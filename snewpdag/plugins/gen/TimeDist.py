@@ -16,6 +16,7 @@ Originally based on Vladimir's TimeDistFileInput
 import logging
 import numpy as np
 
+from snewpdag.dag import readonly
 from . import TimeDistSource
 
 class TimeDist(TimeDistSource):
@@ -24,9 +25,8 @@ class TimeDist(TimeDistSource):
     self.rng = np.random.default_rng(seed)
     super().__init__(**kwargs)
     # normalize to specified mean
-    area = sum(self.mu)
-    self.nmu = self.mu * (sig_mean / area)
-    self.nmu.flags.writeable = False
+    self.nmu = self.shared(('nmu', sig_mean),
+                           lambda: readonly(self.mu * (sig_mean / sum(self.mu))))
 
   def alert(self, data):
     ngen = { 't_low': self.t, # immutable (from TimeDistSource)
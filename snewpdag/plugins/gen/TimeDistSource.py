@@ -18,59 +18,76 @@ output added to data:
   string all the output together into either a series or distribution.
 
 If update is called, the histogram is copied into the data dictionary.
+
+The histogram is read-only, and shared by all instances (in all burst DAGs)
+which read the same file.  Subclasses can share arrays derived from it
+through self.shared().
 """
 import sys
 import logging
-import csv
 import ast
 import numbers
 import numpy as np
 
-from snewpdag.dag import Node
-
-class TimeDistSource(Node):
+from snewpdag.dag import Node, shared, file_stamp
+from snewpdag.plugins.TimeDistFileInput import read_tn
 
-  def __init__(self, sig_filename, sig_filetype, **kwargs):
-    if sig_filetype == 'tn':
-      tt = []
-      nn = []
-      with open(sig_filename, newline='') as csvfile:
-        reader = csv.reader(csvfile, delimiter='\t')
-        for row in reader:
-          tt.append(float(row[0]))
-          nn.append(float(row[1]))
-      self.t = np.array(tt[:-1])
-      self.thi = tt[-1]
-      # use the last bin edge as the maximum.
-      # This amounts to cutting off the last n element.
-      self.mu = np.array(nn[:-1])
-    else:
-      with open(sig_filename, 'r') as f:
-        data = ast.literal_eval(f.read())
-      if 'sig_t_bins' in data and 'sig_t_low' in data and 'sig_t_high' in data:
-        nn = data['sig_t_bins']
-        self.mu = np.array(nn)
-        self.mu.flags.writeable = False
-        self.thi = data['sig_t_high']
-        tt = data['sig_t_low']
-        if isinstance(tt, numbers.Number):
-          dt = (data['sig_t_high'] - tt) / len(nn)
-          self.t = np.arange(tt, data['sig_t_high'] + dt, dt)
-          self.t.flags.writeable = False
-        elif isinstance(tt, (list, tuple)):
-          if len(tt) != len(nn):
-            logging.error('Lengths of sig_t_bins and sig_t_low do not match')
-            sys.exit(2)
-          self.t = np.array(tt)
-          self.t.flags.writeable = False
-        else:
-          logging.error('Unrecognized sig_t_low type')
+def read_hist(sig_filename, sig_filetype):
+  """
+  Read the histogram file.
+  Returns (t, thi, mu):  low edges of bins, high edge of last bin,
+  and contents of bins.  The arrays are read-only.
+  """
+  if sig_filetype == 'tn':
+    tt, nn = read_tn(sig_filename) # read-only, from the on-disk cache
+    t = tt[:-1]
+    thi = float(tt[-1])
+    # use the last bin edge as the maximum.
+    # This amounts to cutting off the last n element.
+    mu = nn[:-1]
+  else:
+    with open(sig_filename, 'r') as f:
+      data = ast.literal_eval(f.read())
+    if 'sig_t_bins' in data and 'sig_t_low' in data and 'sig_t_high' in data:
+      nn = data['sig_t_bins']
+      mu = np.array(nn)
+      thi = data['sig_t_high']
+      tt = data['sig_t_low']
+      if isinstance(tt, numbers.Number):
+        dt = (data['sig_t_high'] - tt) / len(nn)
+        t = np.arange(tt, data['sig_t_high'] + dt, dt)
+      elif isinstance(tt, (list, tuple)):
+        if len(tt) != len(nn):
+          logging.error('Lengths of sig_t_bins and sig_t_low do not match')
           sys.exit(2)
+        t = np.array(tt)
       else:
-        logger.error('Missing histogram fields')
+        logging.error('Unrecognized sig_t_low type')
         sys.exit(2)
+    else:
+      logging.error('Missing histogram fields')
+      sys.exit(2)
+  t.flags.writeable = False
+  mu.flags.writeable = False
+  return t, thi, mu
+
+class TimeDistSource(Node):
+
+  def __init__(self, sig_filename, sig_filetype, **kwargs):
+    # the histogram is read once per process, and shared by all instances
+    self.source_key = ('TimeDistSource', sig_filetype) + \
+                      file_stamp(sig_filename)
+    self.t, self.thi, self.mu = shared(self.source_key,
+                                 lambda: read_hist(sig_filename, sig_filetype))
     super().__init__(**kwargs)
 
+  def shared(self, name, loader):
+    """
+    Resource derived from the histogram (and possibly other configuration,
+    which has to be part of name), shared by all instances.
+    """
+    return shared(self.source_key + (name,), loader)
+
   def alert(self, data):
     ngen = { 'gen_sig_t_bins': self.mu, # immutable
              'gen_sig_t_low': self.t, # immutable
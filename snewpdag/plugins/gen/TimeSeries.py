@@ -11,34 +11,48 @@ output added to data:
   'times': times of individual events based on histogram.
            Use uniform distribution within a bin.
            Note that the array is not sorted.
+
+The events are drawn as by rng.choice(p=nmu), but with a precomputed
+cumulative distribution.  A batch of alerts (see Node.alert_batch) draws
+the same random numbers in the same order as one alert at a time,
+and converts them into times together (for small numbers of events).
 """
 import logging
 import numpy as np
 import matplotlib.pyplot as plt
+from snewpdag.dag import readonly
+from snewpdag.values.Hist1D import chunk_ranges
 from . import TimeDistSource
 
+def cdf(p):
+  # as in Generator.choice
+  c = p.cumsum()
+  c /= c[-1]
+  return c
+
 class TimeSeries(TimeDistSource):
 
   def __init__(self, seed, **kwargs):
     self.rng = np.random.default_rng(seed)
     super().__init__(**kwargs)
-    area = sum(self.mu)
+    area = self.shared('area', lambda: sum(self.mu))
     # Define mean (total number of signal events) as the integral of the lightcurve model
     #print(self.mu)
     self.mean = area # Factor of 10 needed to recover correct nevents after the generator
-    # normalize histogram to unit area
-    self.nmu = self.mu / area
-    self.nmu.flags.writeable = False
-    # append self.thi (high end) to t array
-    self.tedges = np.append(self.t, self.thi)
+    # normalize histogram to unit area, and
+    # append self.thi (high end) to t array (both shared between instances)
+    self.nmu = self.shared('nmu', lambda: readonly(self.mu / area))
+    self.tedges = self.shared('tedges',
+                              lambda: readonly(np.append(self.t, self.thi)))
+    self.cdf = self.shared('cdf', lambda: readonly(cdf(self.nmu)))
     #print('Trial:', len(self.mu), self.name)
     #exit()
 
   def alert(self, data):
     tdelay = data['sig_t_delay'] if 'sig_t_delay' in data else 0
     nev = self.rng.poisson(self.mean)
-    size = len(self.mu)
-    j = self.rng.choice(size, nev, p=self.nmu, replace=True, shuffle=False)
+    # same as self.rng.choice(len(self.mu), nev, p=self.nmu)
+    j = self.cdf.searchsorted(self.rng.random(nev), side='right')
     t0 = self.tedges[j]
     dt = self.tedges[j+1] - t0
     a = self.rng.random(nev) * dt + t0 + tdelay
@@ -61,3 +75,33 @@ class TimeSeries(TimeDistSource):
     #plt.show()
     return True
 
+  def alert_batch(self, datas):
+    # draw in the same order as alert() would
+    tdelays = []
+    us = []
+    rs = []
+    for data in datas:
+      tdelays.append(data['sig_t_delay'] if 'sig_t_delay' in data else 0)
+      nev = self.rng.poisson(self.mean)
+      us.append(self.rng.random(nev))
+      rs.append(self.rng.random(nev))
+    for i, j in chunk_ranges([ len(u) for u in us ]):
+      lens = [ len(u) for u in us[i:j] ]
+      u = np.concatenate(us[i:j]) if j - i > 1 else us[i]
+      r = np.concatenate(rs[i:j]) if j - i > 1 else rs[i]
+      jj = self.cdf.searchsorted(u, side='right')
+      t0 = self.tedges[jj]
+      dt = self.tedges[jj+1] - t0
+      td = np.repeat(np.array(tdelays[i:j], dtype=float), lens) \
+           if j - i > 1 else tdelays[i]
+      a = r * dt + t0 + td
+      a.flags.writeable = False
+      for k, ak in zip(range(i, j), np.split(a, np.cumsum(lens)[:-1])):
+        ngen = { 'times': ak, 'gen_t_delay': tdelays[k] }
+        if 'gen' in datas[k]:
+          datas[k]['gen'] += (ngen, )
+        else:
+          datas[k]['gen'] = (ngen, )
+    return [ True ] * len(datas)
+
+
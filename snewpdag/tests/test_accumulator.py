@@ -2,8 +2,11 @@
 Unit tests for Accumulator plugin
 """
 import unittest
+import json
+import logging
 import numpy as np
 from snewpdag.dag import Node
+from snewpdag.dag.app import configure
 from snewpdag.plugins import Accumulator
 
 class TestAccumulator(unittest.TestCase):
@@ -142,3 +145,63 @@ class TestAccumulator(unittest.TestCase):
     hh = h.summary()
     self.assertEqual(hh['series'], [])
 
+
+  def test_buffer(self):
+    h = Accumulator('Time diffs', 'dt', capacity=2, out_field='acc',
+                    name='acc0')
+    for x in (0.1, 0.3, 0.8, 2.1, -1.0):
+      h.update({ 'action': 'alert', 'dt': x })
+    h.update({ 'action': 'report' })
+    dd = h.last_data['acc']['series']
+    self.assertListEqual(dd.tolist(), [ 0.1, 0.3, 0.8, 2.1, -1.0 ])
+    self.assertFalse(dd.flags.writeable)
+    self.assertIs(dd.base, h.buf) # a view, not a copy
+    h.update({ 'action': 'alert', 'dt': 0.5 })
+    self.assertEqual(len(dd), 5) # earlier report unchanged
+
+  def test_rows(self):
+    h = Accumulator('Time diffs', 'dt', in_index=slice(1, 3),
+                    dtype='float32', out_field='acc', name='acc0')
+    for x in range(3):
+      h.update({ 'action': 'alert', 'dt': [ 0.0, x, 2 * x, 0.0 ] })
+    h.update({ 'action': 'report' })
+    dd = h.last_data['acc']['series']
+    self.assertEqual(dd.dtype, np.float32)
+    self.assertListEqual(dd.tolist(), [ [ 0, 0 ], [ 1, 2 ], [ 2, 4 ] ])
+
+  def test_rows_config(self):
+    spec = json.loads("""[
+      { "class": "Accumulator", "name": "Acc1",
+        "kwargs": { "title": "Rows", "in_field": "dt",
+                    "in_index": [ 1, [ 1, 3 ] ], "out_field": "acc" } }
+      ]""")
+    dag = configure(spec)
+    for x in range(3):
+      dag['Acc1'].update({ 'action': 'alert',
+                           'dt': [ [ 0, 0, 0, 0 ], [ 0, x, 2 * x, 0 ] ] })
+    dag['Acc1'].update({ 'action': 'report' })
+    dd = dag['Acc1'].last_data['acc']['series']
+    self.assertListEqual(dd.tolist(), [ [ 0, 0 ], [ 1, 2 ], [ 2, 4 ] ])
+
+  def test_bad_entry(self):
+    h = Accumulator('Time diffs', 'dt', name='acc0')
+    with self.assertLogs(level=logging.ERROR) as cm:
+      h.update({ 'action': 'alert', 'dt': 'abc' })
+    self.assertIn('Cannot convert', cm.output[0])
+    with self.assertLogs(level=logging.ERROR) as cm:
+      h.update({ 'action': 'alert', 'dt': 0.1 })
+      h.update({ 'action': 'alert', 'dt': [ 0.1, 0.2 ] })
+    self.assertIn('does not match', cm.output[0])
+    self.assertListEqual(h.summary()['series'].tolist(), [ 0.1 ])
+
+  def test_ring(self):
+    h = Accumulator('Time diffs', 'dt', capacity=3, ring=True,
+                    out_field='acc', name='acc0')
+    for x in range(5):
+      h.update({ 'action': 'alert', 'dt': x })
+    h.update({ 'action': 'report' })
+    self.assertListEqual(h.last_data['acc']['series'].tolist(),
+                         [ 2.0, 3.0, 4.0 ])
+    h.update({ 'action': 'reset' })
+    h.update({ 'action': 'report' })
+    self.assertEqual(len(h.last_data['acc']['series']), 0)
@@ -2,7 +2,11 @@
 Unit tests for app methods for configuration and injection.
 """
 import unittest
-from snewpdag.dag.app import configure, inject
+import io, os, tempfile
+import numpy as np
+from snewpdag.dag import Plan, BurstRegistry, LineDecoder, Frames
+from snewpdag.dag.app import configure, inject, retained_nbytes, read_config
+from snewpdag.plugins import Pass
 
 class TestApp(unittest.TestCase):
 
@@ -108,3 +112,337 @@ class TestApp(unittest.TestCase):
     self.assertEqual(nodes[0]['Diff3'].last_data['action'], 'alert')
     self.assertAlmostEqual(nodes[0]['Diff3'].last_data['dt'], -0.7)
 
+  def test_inject_multi_nth(self):
+    spec = [
+      { 'class': 'TimeSeriesInput', 'name': 'Input1' },
+      { 'class': 'TimeSeriesInput', 'name': 'Input2',
+        'kwargs': { 'stream': True } },
+      { 'class': 'NthTimeDiff',
+        'name': 'Diff',
+        'kwargs': { 'nth': [ 1, 3, 4 ] },
+        'observe': [ 'Input1', 'Input2' ] },
+      ]
+    data = [
+      { 'name': 'Input1', 'action': 'alert',
+        'times': [ 0.5, -0.1, 0.2, 0.1, 0.9 ] },
+      { 'name': 'Input2', 'action': 'alert', 'times': [ 0.3, -0.5 ] },
+      { 'name': 'Input2', 'action': 'alert', 'times': [ 1.0, 0.6, 0.7 ] },
+      ]
+    nodes = {}
+    nodes[0] = configure(spec)
+    inject(nodes, data, spec)
+    tdata = nodes[0]['Diff'].last_data
+    self.assertEqual(tdata['action'], 'alert')
+    self.assertListEqual(tdata['t0'].tolist(), [ -0.1, 0.2, 0.5 ])
+    self.assertListEqual(tdata['t1'].tolist(), [ -0.5, 0.6, 0.7 ])
+    self.assertTrue(np.allclose(tdata['dt'], [ 0.4, -0.4, -0.2 ]))
+
+  def test_inject_stream(self):
+    spec = [
+      { 'class': 'TimeSeriesInput', 'name': 'Input1',
+        'kwargs': { 'stream': True, 'capacity': 2 } },
+      { 'class': 'TimeSeriesInput', 'name': 'Input2',
+        'kwargs': { 'stream': True } },
+      { 'class': 'NthTimeDiff',
+        'name': 'Diff1',
+        'kwargs': { 'nth': 1 },
+        'observe': [ 'Input1', 'Input2' ] },
+      { 'class': 'NthTimeDiff',
+        'name': 'Diff3',
+        'kwargs': { 'nth': 3 },
+        'observe': [ 'Input1', 'Input2' ] },
+      { 'class': 'SeriesBinner',
+        'name': 'Bin1',
+        'kwargs': { 'in_field': 'times', 'nbins': 4,
+                    'xlow': -1.0, 'xhigh': 1.0,
+                    'out_xfield': 't', 'out_yfield': 'n' },
+        'observe': [ 'Input1' ] },
+      ]
+    nodes = {}
+    nodes[0] = configure(spec)
+
+    data = [
+      { 'name': 'Input1', 'action': 'alert', 'times': [ 0.5, 0.2 ] },
+      { 'name': 'Input2', 'action': 'alert',
+        'times': [ -0.5, 0.3, 0.6, 1.0 ] },
+      ]
+    inject(nodes, data, spec)
+    self.assertAlmostEqual(nodes[0]['Diff1'].last_data['dt'], 0.7)
+    self.assertFalse(nodes[0]['Diff3'].valid[0])
+    self.assertTrue(nodes[0]['Diff3'].valid[1])
+    self.assertListEqual(nodes[0]['Bin1'].last_data['n'].tolist(),
+                         [ 0, 0, 1, 1 ])
+
+    # next chunk of the same burst
+    data = [
+      { 'name': 'Input1', 'action': 'alert', 'times': [ -0.1, 0.1 ] },
+      ]
+    inject(nodes, data, spec)
+    tdata = nodes[0]['Input1'].last_data
+    self.assertListEqual(tdata['times'].tolist(), [ 0.5, 0.2, -0.1, 0.1 ])
+    self.assertEqual(tdata['chunk_start'], 2)
+    self.assertFalse(tdata['times'].flags.writeable)
+    self.assertAlmostEqual(nodes[0]['Diff1'].last_data['dt'], 0.4)
+    self.assertEqual(nodes[0]['Diff3'].last_data['action'], 'alert')
+    self.assertAlmostEqual(nodes[0]['Diff3'].last_data['dt'], -0.4)
+    self.assertListEqual(nodes[0]['Bin1'].last_data['n'].tolist(),
+                         [ 0, 1, 2, 1 ])
+    self.assertEqual(nodes[0]['Bin1'].last_data['count'], 4)
+    # same counts type as for a whole series
+    whole = configure(spec)
+    whole['Bin1'].update({ 'action': 'alert', 'times': tdata['times'] })
+    self.assertEqual(nodes[0]['Bin1'].last_data['n'].dtype,
+                     whole['Bin1'].last_data['n'].dtype)
+
+    # start over after a revocation
+    data = [
+      { 'name': 'Input1', 'action': 'revoke' },
+      { 'name': 'Input1', 'action': 'alert', 'times': [ 0.0 ] },
+      ]
+    inject(nodes, data, spec)
+    self.assertListEqual(nodes[0]['Input1'].last_data['times'].tolist(),
+                         [ 0.0 ])
+    self.assertEqual(nodes[0]['Input1'].last_data['chunk_start'], 0)
+    self.assertAlmostEqual(nodes[0]['Diff1'].last_data['dt'], 0.5)
+    self.assertFalse(nodes[0]['Diff3'].valid[0])
+    self.assertListEqual(nodes[0]['Bin1'].last_data['n'].tolist(),
+                         [ 0, 0, 1, 0 ])
+    self.assertEqual(nodes[0]['Bin1'].last_data['count'], 1)
+
+
+  def test_plan(self):
+    spec = [
+      { 'class': 'TimeSeriesInput', 'name': 'Input1' },
+      { 'class': 'TimeSeriesInput', 'name': 'Input2' },
+      { 'class': 'NthTimeDiff',
+        'name': 'Diff1',
+        'kwargs': { 'nth': 1 },
+        'observe': [ 'Input1', 'Input2' ] },
+      ]
+    data = [
+      { 'name': 'Input1', 'action': 'alert',
+        'times': [ -0.1, 0.1, 0.2, 0.5 ] },
+      { 'name': 'Input2', 'action': 'alert',
+        'times': [ -0.5, 0.3, 0.6, 1.0 ] },
+      ]
+
+    nodes = {}
+    inject(nodes, data, spec)
+    self.assertIsInstance(nodes[0], Plan)
+    self.assertEqual(nodes[0].order, [ 'Input1', 'Input2', 'Diff1' ])
+    self.assertEqual(nodes[0]['Diff1'].last_data['action'], 'alert')
+    self.assertAlmostEqual(nodes[0]['Diff1'].last_data['dt'], 0.4)
+    self.assertEqual(nodes[0]['Diff1'].last_data['history'].emit(),
+                     ( (('Input1', ), ('Input2', )), 'Diff1' ) )
+
+  def test_retention(self):
+    spec = [
+      { 'class': 'TimeSeriesInput', 'name': 'Input1' },
+      { 'class': 'TimeSeriesInput', 'name': 'Input2' },
+      { 'class': 'NthTimeDiff',
+        'name': 'Diff1',
+        'kwargs': { 'nth': 1, 'retain': 'last' },
+        'observe': [ 'Input1', 'Input2' ] },
+      ]
+    data = [
+      { 'name': 'Input1', 'action': 'alert', 'burst_id': 1,
+        'times': [ -0.1, 0.1, 0.2, 0.5 ] },
+      { 'name': 'Input2', 'action': 'alert', 'burst_id': 1,
+        'times': [ -0.5, 0.3, 0.6, 1.0 ] },
+      ]
+    nodes = {}
+    inject(nodes, data, spec, retain='none')
+    self.assertEqual(nodes[1]['Input1'].last_data, {})
+    self.assertEqual(nodes[1]['Input2'].last_data, {})
+    self.assertAlmostEqual(nodes[1]['Diff1'].last_data['dt'], 0.4)
+    nb = retained_nbytes(nodes)
+    self.assertEqual(list(nb.keys()), [ 1 ])
+    self.assertEqual(nb[1], nodes[1]['Diff1'].retained_nbytes())
+    self.assertGreater(nb[1], 0)
+
+  def test_registry(self):
+    spec = [
+      { 'class': 'TimeSeriesInput', 'name': 'Input1' },
+      { 'class': 'Pass', 'name': 'Pass1', 'observe': [ 'Input1' ] },
+      ]
+    clock = [ 0.0 ]
+    dags = BurstRegistry(lambda: configure(spec, plan=True),
+                         max_bursts=2, ttl=10.0, max_spares=1,
+                         clock=lambda: clock[0])
+    def alert(burst_id):
+      inject(dags, { 'name': 'Input1', 'action': 'alert',
+                     'burst_id': burst_id, 'times': [ burst_id ] }, spec)
+
+    alert(1)
+    alert(2)
+    alert(1)
+    self.assertEqual(dags.hits, 1)
+    self.assertEqual(dags.constructions, 2)
+    alert(3) # evicts burst 2 (least recently used) into the spare pool
+    self.assertEqual(list(dags.keys()), [ 1, 3 ])
+    self.assertEqual(dags.evictions, 1)
+    self.assertEqual(len(dags.spares), 1)
+    dag2 = dags.spares[0]
+    self.assertEqual(dag2['Input1'].last_data, {})
+    self.assertEqual(dag2['Pass1'].last_data, {})
+
+    clock[0] = 20.0 # bursts 1 and 3 expire
+    alert(4)
+    self.assertEqual(list(dags.keys()), [ 4 ])
+    self.assertEqual(dags.evictions, 3)
+    self.assertIs(dags[4], dag2) # recycled rather than constructed
+    self.assertEqual(dags.recycles, 1)
+    self.assertEqual(dags.constructions, 3)
+    self.assertEqual(dags[4]['Pass1'].last_data['times'], [ 4 ])
+
+  def test_shared(self):
+    spec = read_config('snewpdag/data/test-gen-config.py')
+    dag1 = configure(spec)
+    dag2 = configure(spec)
+    n1 = dag1['IceCube-ts']
+    n2 = dag2['IceCube-ts']
+    self.assertIsNot(n1, n2)
+    self.assertIs(n1.mu, n2.mu)
+    self.assertIs(n1.tedges, n2.tedges)
+    self.assertIs(n1.nmu, n2.nmu)
+    self.assertFalse(n1.tedges.flags.writeable)
+    self.assertIsNot(n1.rng, n2.rng)
+
+  def test_decode(self):
+    decode = LineDecoder()
+    d = decode('{"name": "Input1", "action": "alert", "t_low": [0, 0.5], '
+               '"t_bins": [3, 4], "t_high": 1.0, "times": [0.1]}')
+    self.assertTrue(decode.strict)
+    self.assertEqual(d['t_bins'].tolist(), [ 3, 4 ])
+    self.assertEqual(d['t_low'].tolist(), [ 0, 0.5 ])
+    self.assertFalse(d['t_bins'].flags.writeable)
+    self.assertEqual(d['times'], [ 0.1 ]) # not designated
+    self.assertEqual(d['t_high'], 1.0)
+
+    # python literal falls back to literal_eval
+    d = decode("{'name': 'Input1', 'action': 'alert', 't_bins': (3, 4),"
+               " 't_low': ['a', 'b']}")
+    self.assertFalse(decode.strict)
+    self.assertEqual(d['t_bins'], (3, 4)) # tuples left alone
+    self.assertEqual(d['t_low'], [ 'a', 'b' ]) # not numeric
+    d = decode('[{"name": "Input1", "t_bins": [1]}, {"name": "Input2"}]')
+    self.assertEqual(d[0]['t_bins'].tolist(), [ 1 ])
+
+    decode = LineDecoder('json', array_fields=())
+    self.assertEqual(decode('{"t_bins": [1]}'), { 't_bins': [ 1 ] })
+    with self.assertRaises(ValueError):
+      decode("{'t_bins': [1]}")
+
+  def test_frames(self):
+    data = [
+      { 'name': 'JUNO', 'action': 'alert', 't_high': 1.0,
+        't_low': np.array([ 0.0, 0.5 ]),
+        't_bins': np.array([ [ 1, 2 ], [ 3, 4 ] ], dtype='>i4') },
+      { 'name': 'JUNO', 'action': 'report' },
+      ]
+    f = io.BytesIO()
+    for d in data:
+      Frames.write_frame(f, d)
+    f.seek(0)
+    out = list(Frames.read_frames(f))
+    self.assertEqual(len(out), 2)
+    self.assertEqual(out[0]['name'], 'JUNO')
+    self.assertEqual(out[0]['t_high'], 1.0)
+    self.assertEqual(out[0]['t_low'].tolist(), [ 0.0, 0.5 ])
+    self.assertEqual(out[0]['t_bins'].tolist(), [ [ 1, 2 ], [ 3, 4 ] ])
+    self.assertEqual(out[0]['t_bins'].dtype.str, '<i4')
+    self.assertFalse(out[0]['t_low'].flags.writeable)
+    self.assertEqual(out[1], data[1])
+
+    with tempfile.TemporaryDirectory() as tmp:
+      fn = os.path.join(tmp, 'payload.npz')
+      Frames.write_npz(fn, data[0])
+      d = Frames.read_npz(fn)
+    self.assertEqual(d['name'], 'JUNO')
+    self.assertEqual(d['t_high'], 1.0)
+    self.assertEqual(d['t_bins'].tolist(), [ [ 1, 2 ], [ 3, 4 ] ])
+    self.assertFalse(d['t_low'].flags.writeable)
+
+  def test_batch(self):
+    spec = [
+      { 'class': 'TimeSeriesInput', 'name': 'Input1' },
+      { 'class': 'SeriesBinner', 'name': 'Bin1', 'observe': [ 'Input1' ],
+        'kwargs': { 'in_field': 'times', 'nbins': 10, 'xlow': 0.0,
+                    'xhigh': 1.0, 'out_xfield': 'x', 'out_yfield': 'y',
+                    'flags': [ 'overflow', 'stats' ] } },
+      { 'class': 'BinnedAccumulator', 'name': 'Acc1', 'observe': [ 'Input1' ],
+        'kwargs': { 'in_field': 'times', 'nbins': 10, 'xlow': 0.0,
+                    'xhigh': 1.0, 'out_xfield': 'x', 'out_yfield': 'y',
+                    'flags': [ 'overflow', 'stats' ] } },
+      { 'class': 'Histogram1D', 'name': 'Hist1', 'observe': [ 'Bin1' ],
+        'kwargs': { 'in_field': 'mean', 'nbins': 10, 'xlow': 0.0,
+                    'xhigh': 1.0 } },
+      { 'class': 'Pass', 'name': 'Join1', 'observe': [ 'Bin1', 'Acc1' ] },
+      ]
+    rng = np.random.default_rng(3)
+    data = [ { 'name': 'Input1', 'action': 'alert',
+               'times': rng.uniform(-0.1, 1.1, size=n) }
+             for n in (5, 100000, 7, 8, 70000, 1) ]
+    data.append({ 'name': 'Input1', 'action': 'report' })
+
+    dag1 = configure(spec, plan=True)
+    hist = []
+    dag1['Join1'].alert = lambda d: hist.append(
+        (d['history'].emit(), d.get('mean'))) or True
+    for d in data:
+      dag1.inject(dict(d))
+    dag2 = configure(spec, plan=True)
+    hist2 = []
+    dag2['Join1'].alert = lambda d: hist2.append(
+        (d['history'].emit(), d.get('mean'))) or True
+    dag2.inject_batch([ dict(d) for d in data[:-1] ])
+    dag2.inject_batch([ dict(data[-1]) ])
+
+    self.assertEqual(hist, hist2) # same sequence at the join
+    for name in ('Bin1', 'Acc1', 'Join1'):
+      d1 = dag1[name].last_data
+      d2 = dag2[name].last_data
+      self.assertEqual(d1.keys(), d2.keys())
+      for k in d1:
+        if k != 'history':
+          self.assertEqual(np.asarray(d1[k]).tolist(),
+                           np.asarray(d2[k]).tolist())
+    for k in ('bins', 'sum', 'sum2', 'count'):
+      self.assertEqual(np.asarray(getattr(dag1['Hist1'], k)).tolist(),
+                       np.asarray(getattr(dag2['Hist1'], k)).tolist())
+
+  def test_batch_notify(self):
+    # an alert_batch override which notifies directly, rather than
+    # returning values:  its outputs come in order, with the first payload
+    class NotifyBatch(Pass):
+      def alert_batch(self, datas):
+        for data in datas:
+          self.notify('alert', data)
+        return [ False ] * len(datas)
+    spec = [
+      { 'class': 'Pass', 'name': 'Input1' },
+      { 'class': 'Pass', 'name': 'Split1', 'observe': [ 'Input1' ] },
+      { 'class': 'Pass', 'name': 'Pass1', 'observe': [ 'Input1' ] },
+      { 'class': 'Pass', 'name': 'Join1', 'observe': [ 'Split1', 'Pass1' ] },
+      ]
+    data = [ { 'name': 'Input1', 'action': 'alert', 'n': n }
+             for n in range(4) ]
+    hists = []
+    for batch in (False, True):
+      dag = configure(spec, plan=True)
+      dag['Split1'].__class__ = NotifyBatch
+      hist = []
+      dag['Join1'].alert = lambda d: hist.append(
+          (d['history'].emit(), d['n'])) or True
+      if batch:
+        dag.inject_batch([ dict(d) for d in data ])
+      else:
+        for d in data:
+          dag.inject(dict(d))
+      hists.append(hist)
+    split = ('Input1', 'Split1')
+    pass1 = ('Input1', 'Pass1')
+    self.assertEqual(hists[0], [ (h, n) for n in range(4)
+                                 for h in (split, pass1) ])
+    self.assertEqual(hists[1], [ (split, n) for n in range(4) ] +
+                               [ (pass1, n) for n in range(4) ])
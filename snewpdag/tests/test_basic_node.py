@@ -2,7 +2,8 @@
 Basic tests of the Node class by itself.
 """
 import unittest
-from snewpdag.dag import Node
+import numpy as np
+from snewpdag.dag import Node, Plan
 
 class TestBasicNode(unittest.TestCase):
 
@@ -69,3 +70,74 @@ class TestBasicNode(unittest.TestCase):
     self.assertEqual(self.n4.last_data['history'].emit(), ('node1','node3', 'node4'))
     self.assertEqual(self.n4.last_data['k'], 'v')
 
+
+  def test_payload_isolation(self):
+    self.n1.attach(self.n2)
+    self.n1.attach(self.n3)
+    def alert(data):
+      data['k'] = 'w'
+      del data['j']
+      return True
+    self.n2.alert = alert
+    self.n1.update({ 'action': 'alert', 'k': 'v', 'j': 1 })
+    self.assertEqual(self.n1.last_data['k'], 'v')
+    self.assertEqual(self.n1.last_data['history'].emit(), ('node1',))
+    self.assertEqual(self.n2.last_data['k'], 'w')
+    self.assertNotIn('j', self.n2.last_data)
+    self.assertEqual(self.n3.last_data['k'], 'v')
+    self.assertEqual(self.n3.last_data['j'], 1)
+
+  def test_retention(self):
+    n0 = Node('none', retain='none')
+    n1 = Node('last')
+    n5 = Node('last5', retain='last-5')
+    nb = Node('budget', retain='last-5', retain_bytes=20000)
+    for n in [ n0, n1, n5, nb ]:
+      self.n1.attach(n)
+    for i in range(10):
+      self.n1.update({ 'action': 'alert', 'i': i, 'a': np.zeros(1000) })
+    self.assertEqual(n0.last_data, {})
+    self.assertEqual(n0.retained_nbytes(), 0)
+    self.assertEqual(n1.last_data['i'], 9)
+    self.assertEqual(len(n1.retained), 0)
+    self.assertEqual([ p['i'] for n, p in n5.retained ], [ 5, 6, 7, 8, 9 ])
+    self.assertEqual(n5.last_data['i'], 9)
+    # each payload holds a little over 8000 bytes
+    self.assertEqual([ p['i'] for n, p in nb.retained ], [ 8, 9 ])
+    self.assertLessEqual(nb.retained_bytes, 20000)
+    self.assertGreater(n5.retained_nbytes(), 5 * 8000)
+    # arrays shared between nodes are only counted once
+    seen = set()
+    total = n1.retained_nbytes(seen) + n5.retained_nbytes(seen)
+    self.assertLess(total - n5.retained_nbytes(), 1000)
+
+    with self.assertLogs() as cm:
+      n = Node('bad', retain='first')
+    self.assertEqual(cm.output, [
+        'ERROR:root:[bad] Unrecognized retention policy first, using last' ])
+    self.assertEqual(n.retain, 1)
+
+  def test_plan(self):
+    self.n1.attach(self.n3)
+    self.n1.attach(self.n2)
+    self.n3.attach(self.n4)
+    visits = []
+    for n in [ self.n1, self.n2, self.n3, self.n4 ]:
+      n.alert = lambda data, n=n: visits.append(n.name) or True
+    plan = Plan({ n.name: n for n in [ self.n4, self.n3, self.n2, self.n1 ] })
+    self.assertEqual(plan.order, [ 'node1', 'node3', 'node2', 'node4' ])
+    self.assertEqual(plan.dispatch['node1'], ( self.n2, self.n3 ))
+    plan.inject({ 'name': 'node1', 'action': 'alert', 'k': 'v' })
+    # same depth-first order as recursive notification
+    self.assertEqual(visits, [ 'node1', 'node3', 'node4', 'node2' ])
+    self.assertEqual(self.n2.last_data['history'].emit(), ('node1','node2'))
+    self.assertEqual(self.n4.last_data['history'].emit(), ('node1','node3', 'node4'))
+    self.assertEqual(self.n4.last_data['k'], 'v')
+    self.assertFalse(plan.running)
+    self.assertEqual(plan.stack, [])
+
+    # topology changes recompile the dispatch table
+    self.n2.attach(self.n4)
+    self.assertEqual(plan.dispatch['node2'], ( self.n4, ))
+    self.n1.update({ 'action': 'alert' })
+    self.assertEqual(self.n4.last_data['history'].emit(), ('node1','node2', 'node4'))
@@ -274,3 +274,90 @@ class TestCombineMaps(unittest.TestCase):
     td1 = d1 * hp.ud_grade(rv.cdf(d2), 4, order_in='NESTED', order_out='NESTED')
     self.assertListEqual(tdata['cl'].tolist(), td1.tolist())
 
+
+  def test_convert_cache(self):
+    spec = [ { 'class': 'CombineMaps', 'name': 'Node1',
+               'kwargs': { 'force_cl': True } } ]
+    nodes = {}
+    nodes[0] = configure(spec)
+    npix1 = hp.nside2npix(4)
+    npix2 = hp.nside2npix(2)
+    d1 = np.arange(npix1) / npix1
+    d2 = np.arange(npix2) * 2 / npix2
+    d3 = np.arange(npix2) * 3 / npix2
+    rv = chi2(2)
+    data = [ { 'name': 'Node1', 'action': 'alert',
+               'history': History(('Input1',)), 'cl': d1.tolist() },
+             { 'name': 'Node1', 'action': 'alert',
+               'history': History(('Input2',)), 'ndof': 2, 'chi2': d2.tolist() }
+           ]
+    inject(nodes, data, spec)
+    node = nodes[0]['Node1']
+    cached = { k: node.converted[k][2] for k in node.converted }
+    self.assertEqual(len(cached), 2)
+
+    # new map from Input2 only converts Input2 again
+    data = [ { 'name': 'Node1', 'action': 'alert',
+               'history': History(('Input2',)), 'ndof': 2, 'chi2': d3.tolist() } ]
+    inject(nodes, data, spec)
+    tdata = node.last_data
+    for k in cached:
+      if k == node.last_source:
+        self.assertIsNot(node.converted[k][2], cached[k])
+      else:
+        self.assertIs(node.converted[k][2], cached[k])
+    td = d1 * hp.ud_grade(rv.cdf(d3), 4, order_in='NESTED', order_out='NESTED')
+    self.assertListEqual(tdata['cl'].tolist(), td.tolist())
+
+  def test_log(self):
+    spec = [ { 'class': 'CombineMaps', 'name': 'Node1',
+               'kwargs': { 'force_cl': False, 'log': True } } ]
+    nodes = {}
+    nodes[0] = configure(spec)
+    npix1 = hp.nside2npix(4)
+    npix2 = hp.nside2npix(2)
+    d1 = (np.arange(npix1) + 1) / npix1
+    d2 = np.arange(npix2) * 2 / npix2
+    d3 = (np.arange(npix1) + 1) * 0.5 / npix1
+    rv = chi2(2)
+    data = [ { 'name': 'Node1', 'action': 'alert',
+               'history': History(('Input1',)), 'cl': d1.tolist() },
+             { 'name': 'Node1', 'action': 'alert',
+               'history': History(('Input2',)), 'ndof': 2, 'chi2': d2.tolist() },
+             { 'name': 'Node1', 'action': 'alert',
+               'history': History(('Input3',)), 'cl': d3.tolist() },
+           ]
+    inject(nodes, data, spec)
+    tdata = nodes[0]['Node1'].last_data
+    self.assertEqual(tdata['action'], 'alert')
+    self.assertEqual(tdata['history'].emit(),
+        ( (('Input1',), ('Input2',), ('Input3',)), 'Node1' ) )
+    self.assertEqual(tdata['logcl'].dtype, np.float32)
+    for k in ('cl', 'chi2', 'ndof'):
+      self.assertNotIn(k, tdata)
+    self.assertEqual(len(tdata['logcl']), npix1)
+    d2up = hp.ud_grade(rv.logcdf(d2), 4, order_in='NESTED', order_out='NESTED')
+    # pixel 0 of d2 has CL 0, so is floored
+    td1 = np.log(d1) + np.maximum(d2up, np.log(np.finfo(np.float32).tiny)) \
+          + np.log(d3)
+    self.assertTrue(np.allclose(tdata['logcl'], td1, rtol=1e-5))
+
+    # revoke 2nd input
+    data = [ { 'name': 'Node1', 'action': 'revoke',
+               'history': History(('Input2',)) } ]
+    inject(nodes, data, spec)
+    tdata = nodes[0]['Node1'].last_data
+    self.assertEqual(tdata['action'], 'alert')
+    self.assertEqual(tdata['history'].emit(),
+        ( (('Input1',), ('Input3',)), 'Node1' ) )
+    td2 = np.log(d1) + np.log(d3)
+    self.assertTrue(np.allclose(tdata['logcl'], td2, rtol=1e-5, atol=1e-4))
+
+    # update 1st input
+    data = [ { 'name': 'Node1', 'action': 'alert',
+               'history': History(('Input1',)), 'cl': d3.tolist() } ]
+    inject(nodes, data, spec)
+    tdata = nodes[0]['Node1'].last_data
+    self.assertNotIn('cl', tdata)
+    td3 = 2 * np.log(d3)
+    self.assertTrue(np.allclose(tdata['logcl'], td3, rtol=1e-5, atol=1e-4))
@@ -160,3 +160,39 @@ class TestHistogram1D(unittest.TestCase):
     self.assertEqual(hh['overflow'], 0.0)
     self.assertEqual(hh['bins'].tolist(), [ 0, 0, 0, 0, 0, 0, 0, 0, 0, 0 ])
 
+
+  def test_batch(self):
+    rng = np.random.default_rng(3)
+    x = rng.normal(0.0, 1.0, 2500).tolist() + [ float('nan'), -0.1, 1.9 ]
+    h1 = Histogram1D(10, -0.1, 1.9, 'dt', name='hist1', buffer=1)
+    h2 = Histogram1D(10, -0.1, 1.9, 'dt', name='hist2', buffer=100)
+    h3 = Histogram1D(10, -0.1, 1.9, 'dt', name='hist3')
+    for xi in x:
+      h1.update({ 'action': 'alert', 'dt': xi })
+      h2.update({ 'action': 'alert', 'dt': xi })
+    h3.update({ 'action': 'alert', 'dt': np.array(x) })
+    s1 = h1.summary()
+    for h in (h2, h3):
+      s = h.summary()
+      for k in ('underflow', 'overflow', 'sum', 'sum2', 'count'):
+        self.assertEqual(s[k], s1[k])
+      self.assertEqual(s['bins'].tolist(), s1['bins'].tolist())
+    self.assertEqual(s1['count'], 2502)
+
+  def test_alert_batch(self):
+    rng = np.random.default_rng(4)
+    x = rng.normal(0.0, 1.0, 500).tolist() + [ float('nan'), -0.1, 1.9 ]
+    h1 = Histogram1D(10, -0.1, 1.9, 'dt', name='hist1')
+    h2 = Histogram1D(10, -0.1, 1.9, 'dt', name='hist2')
+    fills = []
+    fill_array = h2.fill_array
+    h2.fill_array = lambda a: fills.append(len(a)) or fill_array(a)
+    for xi in x:
+      h1.update({ 'action': 'alert', 'dt': xi })
+    h2.alert_batch([ { 'dt': xi } for xi in x ])
+    self.assertEqual(fills, [ len(x) ]) # one vectorized fill, default buffer
+    s1 = h1.summary()
+    s2 = h2.summary()
+    for k in ('underflow', 'overflow', 'sum', 'sum2', 'count'):
+      self.assertEqual(s2[k], s1[k])
+    self.assertEqual(s2['bins'].tolist(), s1['bins'].tolist())
@@ -3,8 +3,10 @@ Unit tests for input classes.
 """
 import unittest
 import logging
-from snewpdag.dag import Node
+import os, tempfile
+from snewpdag.dag import Node, Shared
 from snewpdag.plugins import TimeSeriesInput, TimeDistFileInput
+from snewpdag.plugins.TimeDistFileInput import parse_tn
 
 class TestInputs(unittest.TestCase):
 
@@ -72,3 +74,56 @@ class TestInputs(unittest.TestCase):
     self.assertEqual(n2.last_data['t_low'][2500], 0.5)
     self.assertEqual(n2.last_data['t_bins'][2500], 1)
 
+
+  def test_timedistfile_cache(self):
+    fn = 'snewpdag/data/fluxparametrisation_22.5kT_0Hz_0.0msT0_1msbin.txt'
+    saved = Shared.cache_dir
+    with tempfile.TemporaryDirectory() as tmp:
+      Shared.cache_dir = tmp
+      try:
+        n1 = TimeDistFileInput(name='Input1')
+        t1, n = n1.read_tn(fn) # parsed, and written to cache
+        self.assertEqual(len(os.listdir(tmp)), 1)
+        Shared.clear() # as in a new process
+        t2, n = n1.read_tn(fn) # from cache
+        self.assertEqual(t1.tolist(), t2.tolist())
+        self.assertFalse(t2.flags.writeable)
+        self.assertFalse(t2.flags.owndata) # memory-mapped
+        self.assertEqual(n[2125], 7)
+      finally:
+        Shared.cache_dir = saved
+        Shared.clear()
+
+  def test_timedistfile_parsed_once(self):
+    fn = 'snewpdag/data/fluxparametrisation_22.5kT_0Hz_0.0msT0_1msbin.txt'
+    saved = Shared.cache_dir
+    calls = []
+    def loader(name):
+      calls.append(name)
+      return parse_tn(name)
+    Shared.cache_dir = '' # disk cache off
+    Shared.clear()
+    try:
+      a1 = Shared.npy_cache(fn, 'tn', loader)
+      a2 = Shared.npy_cache(fn, 'tn', loader)
+      self.assertEqual(len(calls), 1)
+      self.assertIs(a1['t'], a2['t'])
+      self.assertFalse(a2['t'].flags.writeable)
+    finally:
+      Shared.cache_dir = saved
+      Shared.clear()
+
+  def test_cache_dir_default(self):
+    saved = (Shared.cache_dir, os.environ.pop('SNEWPDAG_CACHE', None))
+    try:
+      Shared.cache_dir = None
+      self.assertIsNone(Shared.get_cache_dir()) # off by default
+      os.environ['SNEWPDAG_CACHE'] = '/tmp/snewpdag'
+      self.assertEqual(Shared.get_cache_dir(), '/tmp/snewpdag')
+      Shared.cache_dir = ''
+      self.assertIsNone(Shared.get_cache_dir())
+    finally:
+      Shared.cache_dir = saved[0]
+      os.environ.pop('SNEWPDAG_CACHE', None)
+      if saved[1] is not None:
+        os.environ['SNEWPDAG_CACHE'] = saved[1]
@@ -6,17 +6,38 @@ import numpy as np
 import healpy as hp
 from snewpdag.dag import Node
 from snewpdag.plugins import OutputMap
+from snewpdag.plugins.OutputMap import c
 
 class TestOutputMap(unittest.TestCase):
-    
+
     def test_(self):
         n1 = OutputMap(name='n1')
-        data = [{'action': 'alert','res': 128, 'r':np.array([[2.39459173, 0.63233279],[-1.81165176,  0.77405352]]), 'errs': np.array([[0.        , 0.01016553],[0.01016553, 0.        ]]), 'biases': np.array([[ 0.000e+00, -8.659e-05], [ 8.659e-05,  0.000e+00]]),'loc': np.array([-1.64759081, -0.50474922])}] #sk and dune
+        data = {'action': 'alert','res': 128, 'r':np.array([[2.39459173, 0.63233279],[-1.81165176,  0.77405352]]), 'errs': np.array([[0.        , 0.01016553],[0.01016553, 0.        ]]), 'biases': np.array([[ 0.000e+00, -8.659e-05], [ 8.659e-05,  0.000e+00]]),'loc': np.array([-1.64759081, -0.50474922])} #sk and dune
         n1.update(data)
-        
-        self.assertEqual(n1.last_data['m'][600],1)
-        self.assertEqual(n1.last_data['m'][1083],1)
-        self.assertEqual(n1.last_data['m'][200],2)
-        self.assertEqual(n1.last_data['m'][1200],2)
-        self.assertEqual(n1.last_data['m'][227],3)
-        self.assertEqual(n1.last_data['m'][11756],3)
+        chi2 = n1.last_data['chi2']
+        m = n1.last_data['m']
+        self.assertEqual(len(chi2), hp.nside2npix(128))
+        self.assertEqual(n1.last_data['ndof'], 2)
+
+        # chi2 at pixel centres, one at a time
+        det_r = [ n1.radius(r) for r in data['r'] ]
+        sn = data['loc']
+        n_sn = -1 * np.array((np.cos(sn[0]) * np.cos(sn[1]), np.sin(sn[0]) * np.cos(sn[1]), np.sin(sn[1])))
+        t_bf = np.dot(det_r[0] - det_r[1], n_sn)/c + data['biases'][0,1]
+        for pix in (0, 200, 600, 1083, 11756, 100000):
+            theta, phi = hp.pix2ang(128, pix)
+            ra, dec = phi - np.pi, np.pi/2 - theta
+            n = -1 * np.array((np.cos(ra) * np.cos(dec), np.sin(ra) * np.cos(dec), np.sin(dec)))
+            t = np.dot(det_r[0] - det_r[1], n)/c
+            self.assertAlmostEqual(chi2[pix], ((t_bf - t)/data['errs'][0,1])**2)
+
+        # the supernova is within the 1 sigma area
+        pix = hp.ang2pix(128, np.pi/2 - sn[1], sn[0] + np.pi)
+        self.assertEqual(m[pix], 3)
+        self.assertEqual(np.all(m[chi2 >= 11.83] == 0), True)
+        self.assertEqual(np.all(m[(chi2 >= 2.3) & (chi2 < 6.18)] == 2), True)
+
+        # same chi2 when computed in small chunks of pixels
+        n2 = OutputMap(name='n2', chunk=1000)
+        n2.update(dict(data))
+        self.assertEqual(n2.last_data['chi2'].tolist(), chi2.tolist())
@@ -4,9 +4,12 @@ Unit tests for input classes.
 import unittest
 import logging
 import json
+import math
+import numpy as np
 from snewpdag.dag import Node
 from snewpdag.plugins import ShapeComparison
 from snewpdag.plugins import BayesianBlocks
+from snewpdag.plugins import ShapeHistFunctions as SHF
 
 class TestShape(unittest.TestCase):
 
@@ -23,3 +26,108 @@ class TestShape(unittest.TestCase):
     bayes.update(data[0])
     bayes.update(data[1])
 
+  def test_functions(self):
+    # numpy implementations against the original python ones
+    rng = np.random.default_rng(5)
+    values1 = rng.normal(0.02, 0.1, 300).tolist() + [ -0.2, 0.3, 0.25 ]
+    values2 = rng.normal(0.0, 0.1, 300).tolist()
+    hist2 = SHF.fill_hist(500, -0.2, 0.3, values2, 0.0)
+    self.assertEqual(hist2.tolist(),
+                     SHF.fill_hist_py(500, -0.2, 0.3, values2, 0.0))
+    mlist = []
+    for i in range(160):
+      dt = -0.04 + i*0.0005
+      hist1 = SHF.fill_hist(500, -0.2, 0.3, values1, dt)
+      metric = SHF.diff_hist(hist1[1:-1], hist2[1:-1], 5.0)
+      if i % 10 == 0:
+        hist1_py = SHF.fill_hist_py(500, -0.2, 0.3, values1, dt)
+        self.assertEqual(hist1.tolist(), hist1_py)
+        self.assertEqual(metric, SHF.diff_hist_py(hist1_py[1:-1],
+                                                  hist2.tolist()[1:-1], 5.0))
+      mlist.append(metric)
+    for polyN in (2, 3, 4):
+      self.assertEqual(SHF.minimise(mlist, -0.04, 0.0005, 160, polyN, 0.01),
+                       SHF.minimise_py(mlist, -0.04, 0.0005, 160, polyN, 0.01))
+
+  def test_scan(self):
+    # scan over all offsets at once against one fill_hist per offset
+    shape = ShapeComparison(500, -0.2, 0.3, 5.0, -0.04, 0.0005, 160, 4, 0.01, name = 'Node1')
+    rng = np.random.default_rng(6)
+    values1 = np.round(rng.normal(0.02, 0.1, 2000), 3).tolist() + [ -0.2, 0.3 ]
+    values2 = rng.normal(0.0, 0.1, 2000).tolist()
+    hist2 = SHF.fill_hist(500, -0.2, 0.3, values2, 0.0)[1:-1]
+    mlist = [ SHF.diff_hist(SHF.fill_hist(500, -0.2, 0.3, values1,
+                                          -0.04 + i*0.0005)[1:-1],
+                            hist2, 5.0) for i in range(160) ]
+    self.assertEqual(shape.metric_list(values1, values2), mlist)
+    hists = SHF.scan_hist(500, -0.2, 0.3, values1, [ -0.04, 0.0, 0.0355 ])
+    for i, dt in enumerate([ -0.04, 0.0, 0.0355 ]):
+      self.assertEqual(hists[i].tolist(),
+                       SHF.fill_hist(500, -0.2, 0.3, values1, dt).tolist())
+
+  def test_scan_ties(self):
+    # quantised values, with many ties on bin edges
+    rng = np.random.default_rng(11)
+    values1 = np.round(rng.normal(0.0, 0.1, 20000), 2)
+    offsets = np.arange(-200, 200) * 0.001
+    hists = SHF.scan_hist(100, -0.5, 0.5, values1, offsets)
+    for i in range(0, len(offsets), 7):
+      h = SHF.fill_hist(100, -0.5, 0.5, values1, offsets[i])
+      self.assertListEqual(hists[i].tolist(), h.tolist())
+
+  def test_bayesian_block(self):
+    shape = ShapeComparison(500, -0.2, 0.3, 5.0, -0.04, 0.0005, 160, 4, 0.01, name = 'Node1')
+    bayes = BayesianBlocks(500, -0.2, 0.3, shape, 0.01, 0.0, name = 'Node2')
+    rng = np.random.default_rng(7)
+    values = np.concatenate([ rng.uniform(-0.3, 0.4, 100),
+                              rng.normal(0.1, 0.02, 200) ])
+    edges, contents = bayes.bayesian_block(values)
+    self.assertEqual(len(values), 300) # input not modified
+
+    # unpruned dynamic program, for comparison
+    inrange = values[(values >= -0.2) & (values < 0.3)]
+    s = np.sort(inrange[inrange > 0.0])
+    edge = [ 1.5*s[0] - 0.5*s[1] ] + list((s[1:] + s[:-1])/2) + \
+           [ 1.5*s[-1] - 0.5*s[-2] ]
+    best = [ 0.0 ]
+    last = [ 0 ]
+    for n in range(1, len(s) + 1):
+      like = [ best[j] + (n-j) * math.log((n-j)/(edge[n]-edge[j]))
+               for j in range(n) ]
+      j = int(np.argmax(like))
+      best.append(like[j] + math.log(0.01))
+      last.append(j)
+    block_edges = [ edge[-1] ]
+    n = len(s)
+    while n > 0:
+      n = last[n]
+      block_edges.insert(0, edge[n])
+    self.assertEqual(list(edges), block_edges)
+    self.assertAlmostEqual(sum(contents), len(s) / len(inrange))
+    self.assertEqual(len(bayes.hybrid_bin_value), len(inrange))
+
+  def test_block_hists(self):
+    shape = ShapeComparison(500, -0.2, 0.3, 5.0, -0.04, 0.0005, 160, 4, 0.01, name = 'Node1')
+    bayes = BayesianBlocks(100, -0.2, 0.3, shape, 0.01, 0.05, name = 'Node2')
+    rng = np.random.default_rng(8)
+    values = np.concatenate([ rng.uniform(-0.1, 0.2, 100),
+                              rng.normal(0.1, 0.02, 200) ])
+    p = bayes.partition(values)
+    self.assertIs(bayes.partition(values.copy()), p) # memoised by content
+    edges, contents, hv, n = p
+    self.assertEqual(n, 300)
+
+    hists = bayes.block_hists(p, [ 0.0, 0.0123 ])
+    self.assertAlmostEqual(np.sum(hists[0]), 1.0)
+    # overlap of each bin with each block, and the values below the division
+    dt = 0.0123
+    for i in range(100):
+      low = -0.2 + i*0.005 - dt
+      up = -0.2 + (i+1)*0.005 - dt
+      x = 0.0
+      for j in range(len(contents)):
+        overlap = min(up, edges[j+1]) - max(low, edges[j])
+        if overlap > 0:
+          x += contents[j] * overlap / (edges[j+1] - edges[j])
+      x += np.count_nonzero((hv > low) & (hv <= up)) / 300.0
+      self.assertAlmostEqual(hists[1][i], x)
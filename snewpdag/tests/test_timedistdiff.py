@@ -4,9 +4,10 @@ Unit tests for TimeDistDiff node
 import unittest
 import numpy as np
 import healpy as hp
-from snewpdag.dag import Node
+from snewpdag.dag import Node, Shared, Executor
 from snewpdag.dag.app import configure, inject
 from snewpdag.plugins import TimeDistFileInput, TimeDistDiff
+from snewpdag.plugins.TimeDistDiff import gettdelay, gettdelay_loop
 
 import os
 
@@ -88,3 +89,86 @@ class TestTimeDistDiff(unittest.TestCase):
       meancpp = float(np.mean(tdelaycpparr))
       rmscpp = float(np.std(tdelaycpparr))
       print("Det1-Det2 delay from cpp mean [ms], rms [ms]", meancpp, rmscpp)
+
+  def test_scan(self):
+    # vectorized scan against the one-delay-at-a-time loop
+    rng = np.random.default_rng(4)
+    for step, t0 in ((1e-3, 0.02), (1e-4, -0.035)):
+      t = -1.0 + np.arange(int(2.0/step)) * step
+      rate1 = 2.0 + 30.0 * np.exp(-t/0.05) * (t >= 0)
+      rate2 = 1.0 + 20.0 * np.exp(-(t-t0)/0.05) * (t >= t0)
+      n1 = rng.poisson(rate1 * step * 1000).astype(float)
+      n2 = rng.poisson(rate2 * step * 1000).astype(float)
+      tdelay, chi2 = gettdelay_loop(t, n1, t, n2)
+      result = gettdelay(t, n1, t, n2, curve=True)
+      self.assertEqual(result[:2], (tdelay, chi2))
+      self.assertEqual(len(result[2]), 2001)
+      self.assertEqual(np.nanmin(result[3]), chi2)
+      self.assertAlmostEqual(tdelay, -t0*1000, delta=10)
+
+  def test_pairs(self):
+    # only pairs involving the updated source are recomputed
+    OutputNode = Node(name='Output')
+    TimeDistDiffNode = TimeDistDiff(name='TimeDistDiffNode')
+    inputs = [ Node(name='Input{}'.format(i)) for i in range(3) ]
+    for n in inputs:
+      n.attach(TimeDistDiffNode)
+    TimeDistDiffNode.attach(OutputNode)
+
+    rng = np.random.default_rng(9)
+    t = -1.0 + np.arange(2000) * 1e-3
+    def alert(i):
+      rate = 2.0 + 30.0 * np.exp(-t/0.05) * (t >= 0)
+      inputs[i].update({ 'action': 'alert', 't_low': t,
+                         't_bins': rng.poisson(rate).astype(float) })
+
+    for i in range(3):
+      alert(i)
+    pairs = TimeDistDiffNode.pairs
+    self.assertEqual(len(pairs), 3)
+    ab = pairs[('Input0', 'Input1')]
+    alert(2)
+    self.assertIs(pairs[('Input0', 'Input1')], ab) # not recomputed
+    self.assertEqual(pairs[('Input0', 'Input2')][0], (1, 2))
+    self.assertEqual(len(OutputNode.last_data['tdelay']), 3)
+
+    inputs[1].update({ 'action': 'revoke' })
+    self.assertEqual(list(pairs), [ ('Input0', 'Input2') ])
+    self.assertEqual(list(OutputNode.last_data['tdelay']),
+                     [ ('Input0', 'Input2') ])
+
+  def test_executor(self):
+    # pairs computed in pools of threads or processes, as serially
+    rng = np.random.default_rng(10)
+    t = -1.0 + np.arange(2000) * 1e-3
+    bins = [ rng.poisson(2.0 + 30.0 * np.exp(-(t-0.01*i)/0.05) * (t >= 0.01*i)).astype(float)
+             for i in range(4) ]
+    results = {}
+    for executor in ('serial', 'thread', 'process'):
+      OutputNode = Node(name='Output')
+      TimeDistDiffNode = TimeDistDiff(name='TimeDistDiffNode',
+                                      executor=executor, workers=2)
+      inputs = [ Node(name='Input{}'.format(i)) for i in range(4) ]
+      for n in inputs:
+        n.attach(TimeDistDiffNode)
+      TimeDistDiffNode.attach(OutputNode)
+      for i in range(4):
+        TimeDistDiffNode.pairs.clear() # all pairs at once on the last alert
+        inputs[i].update({ 'action': 'alert', 't_low': t, 't_bins': bins[i] })
+      results[executor] = OutputNode.last_data['tdelay']
+      if executor == 'process':
+        self.assertEqual(len(TimeDistDiffNode.shm), 4)
+      TimeDistDiffNode.dispose()
+      self.assertEqual(TimeDistDiffNode.shm, {})
+    self.assertEqual(len(results['serial']), 6)
+    self.assertEqual(results['thread'], results['serial'])
+    self.assertEqual(results['process'], results['serial'])
+    # the pools this test used are shut down with the others
+    pools = [ Executor.get_executor(kind, 2) for kind in ('thread', 'process') ]
+    for pool in pools:
+      self.assertIn(pool, Executor.executors)
+    Executor.shutdown()
+    for pool in pools:
+      self.assertNotIn(pool, Executor.executors)
+      self.assertRaises(RuntimeError, pool.submit, abs, -1) # shut down
+    Shared.clear()
@@ -2,7 +2,10 @@
 Unit tests for value objects
 """
 import unittest
-from snewpdag.values import Hist1D
+import numpy as np
+import healpy as hp
+from snewpdag.values import Hist1D, History, Payload, LMap, MOCMap
+from snewpdag.values.Hist1D import uniform_edges, histogram_counts
 
 class TestHist1D(unittest.TestCase):
 
@@ -13,3 +16,154 @@ class TestHist1D(unittest.TestCase):
     self.assertEqual(h.xhigh, 3.0)
     self.assertEqual(h.xwidth, 2.0)
 
+
+  def test_fill_array(self):
+    rng = np.random.default_rng(7)
+    x = np.concatenate((rng.normal(0.0, 2.0, 1000),
+                        [ np.nan, np.inf, -1.0, 1.0, -1.05 ]))
+    w = rng.random(len(x))
+    h1 = Hist1D(20, -1.0, 1.0)
+    h2 = Hist1D(20, -1.0, 1.0)
+    for xi, wi in zip(x, w):
+      h1.fill(xi, wi)
+    h2.fill(x, w)
+    self.assertEqual(h1.underflow, h2.underflow)
+    self.assertEqual(h1.overflow, h2.overflow)
+    self.assertEqual(h1.sum, h2.sum)
+    self.assertEqual(h1.sum2, h2.sum2)
+    self.assertEqual(h1.count, h2.count)
+    np.testing.assert_allclose(h1.bins, h2.bins)
+
+  def test_histogram_counts(self):
+    rng = np.random.default_rng(5)
+    x = rng.uniform(-0.5, 1.5, size=1000)
+    x[[3, 7]] = np.nan
+    x[[4, 8]] = [ 0.0, 1.0 ] # edges are in range
+    edges = uniform_edges(20, 0.0, 1.0)
+    h, underflow, overflow = histogram_counts(x, 20, 0.0, 1.0, edges)
+    self.assertListEqual(h.tolist(),
+        np.histogram(x[~np.isnan(x)], 20, (0.0, 1.0))[0].tolist())
+    self.assertEqual(underflow, np.count_nonzero(x < 0.0))
+    self.assertEqual(overflow, np.count_nonzero(x > 1.0))
+    out = np.ones(20)
+    histogram_counts(x, 20, 0.0, 1.0, edges, out=out)
+    self.assertListEqual(out.tolist(), (h + 1).tolist())
+
+class TestHistory(unittest.TestCase):
+
+  def test_copy(self):
+    h1 = History(('a', 'b'))
+    h2 = h1.copy()
+    h2.append('c')
+    h1.append('d')
+    self.assertEqual(h1.emit(), ('a', 'b', 'd'))
+    self.assertEqual(h2.emit(), ('a', 'b', 'c'))
+    self.assertEqual(h2.last(), 'c')
+    h2.combine([ h1, History(('e',)) ])
+    self.assertEqual(h2.emit(), ((('a', 'b', 'd'), ('e',)),))
+    self.assertEqual(h1.emit(), ('a', 'b', 'd'))
+
+class TestLMap(unittest.TestCase):
+
+  def test_combine(self):
+    m = LMap(2)
+    m.combine(np.full(48, 0.5))
+    m.combine(np.full(192, 0.25)) # upgraded to nside 4
+    self.assertEqual(m.nside(), 4)
+    self.assertTrue(np.allclose(m.map, 0.125))
+
+  def test_log(self):
+    m = LMap(2, log=True)
+    self.assertEqual(m.map.dtype, np.float32)
+    self.assertEqual(m.map[0], 0.0)
+    a = np.log(np.arange(1, 49) / 48)
+    b = np.log(np.full(192, 0.25))
+    m.combine(a)
+    m.combine(b)
+    self.assertEqual(m.nside(), 4)
+    self.assertEqual(m.map.dtype, np.float32)
+    self.assertTrue(np.allclose(m.map[:4], a[0] + b[0]))
+    m.uncombine(b)
+    self.assertTrue(np.allclose(m.map[4:8], a[1]))
+    self.assertEqual(m.copy().log, True)
+
+class TestMOCMap(unittest.TestCase):
+
+  def test_dense(self):
+    a = np.full(hp.nside2npix(16), 0.01)
+    a[[100, 101, 2000]] = [0.5, 0.7, 0.9]
+    m = MOCMap.from_dense(a, 0.1)
+    # around each of 2 significant groups: 4 pixels at nside 16 and
+    # 3 siblings at each of 3 coarser orders, plus the other 10 base pixels
+    self.assertEqual(len(m), 2 * (4 + 3 * 3) + 10)
+    self.assertEqual(m.nside(), 16)
+    self.assertListEqual(m.to_dense().tolist(), a.tolist())
+    self.assertTrue(np.allclose(m.to_dense(8),
+        hp.ud_grade(a, 8, order_in='NESTED', order_out='NESTED')))
+    self.assertEqual(m.order[0], 1)
+    self.assertEqual(m.uniq()[0], 16)
+
+  def test_combine(self):
+    a = np.full(hp.nside2npix(8), 0.01)
+    a[10] = 0.5
+    b = np.full(hp.nside2npix(4), 0.02)
+    b[100] = 0.25
+    m = MOCMap.from_dense(a, 0.1)
+    m.combine(MOCMap.from_dense(b, 0.1))
+    bup = hp.ud_grade(b, 8, order_in='NESTED', order_out='NESTED')
+    self.assertTrue(np.allclose(m.to_dense(8), a * bup))
+    m.coarsen(0.001)
+    self.assertTrue(np.allclose(m.to_dense(8), a * bup))
+    self.assertEqual(len(m), (4 + 3 + 3) + (4 + 3) + 10)
+
+  def test_log(self):
+    a = np.log(np.full(hp.nside2npix(8), 0.01))
+    a[10] = np.log(0.5)
+    b = np.log(np.full(hp.nside2npix(8), 0.02))
+    b[600] = np.log(0.25)
+    m = MOCMap.from_dense(LMap(a, log=True), np.log(0.1))
+    self.assertEqual(m.value.dtype, np.float32)
+    mb = MOCMap.from_dense(b, np.log(0.1), log=True)
+    m.combine(mb)
+    self.assertTrue(np.allclose(m.to_dense(), a + b))
+    m.uncombine(mb)
+    self.assertTrue(np.allclose(m.to_lmap().map, a, atol=1e-5))
+
+class TestPayload(unittest.TestCase):
+
+  def test_layers(self):
+    base = { 'a': 1, 'b': 2 }
+    p1 = Payload(base)
+    p1['c'] = 3
+    del p1['a']
+    self.assertEqual(base, { 'a': 1, 'b': 2 })
+    self.assertEqual(p1, { 'b': 2, 'c': 3 })
+    self.assertNotIn('a', p1)
+    self.assertEqual(p1.get('a', 0), 0)
+    with self.assertRaises(KeyError):
+      p1['a']
+
+    p2 = p1.copy()
+    p2['b'] = 5
+    self.assertEqual(p2, { 'b': 5, 'c': 3 })
+    self.assertEqual(p1['b'], 2)
+
+    # writes to a payload after layering don't leak into the new layer
+    p1['d'] = 4
+    p1['c'] = 6
+    self.assertNotIn('d', p2)
+    self.assertEqual(p2['c'], 3)
+    self.assertEqual(p1, { 'b': 2, 'c': 6, 'd': 4 })
+
+  def test_depth(self):
+    p = Payload({ 'x': 0 })
+    for i in range(100):
+      p = Payload(p)
+      p['x'] = i
+      p['y{}'.format(i)] = i
+    self.assertLessEqual(len(p.parents), Payload.max_depth)
+    self.assertEqual(p['x'], 99)
+    self.assertEqual(len(p), 101)
+    self.assertEqual(Payload(p).flatten(), p.flatten())
+    self.assertEqual(dict(p), p.flatten())
+    self.assertEqual(sorted(p.keys()), sorted(p.flatten().keys()))
@@ -7,6 +7,10 @@ Parameters:  number of objects, mean, rms, field, injection name
 
 Generate 'alert' objects.
 Close off with a 'report' object.
+
+With --binary, emit binary frames (see snewpdag.dag.Frames) instead.
+This needs snewpdag to be importable, e.g., run from the root directory as
+  python -m snewpdag.trials.Normal --binary ...
 """
 import sys, argparse, json
 import numpy as np
@@ -19,8 +23,16 @@ def run():
   parser.add_argument('--rms', default=1.0, help='rms value')
   parser.add_argument('--field', default='x', help='field name to generate')
   parser.add_argument('--expt', default='Normal', help='experiment name')
+  parser.add_argument('--binary', action='store_true',
+                      help='emit binary frames instead of json lines')
   args = parser.parse_args()
 
+  if args.binary:
+    from snewpdag.dag import Frames
+    emit = lambda data: Frames.write_frame(sys.stdout.buffer, data)
+  else:
+    emit = lambda data: print(json.dumps(data))
+
   i = 0
   imax = int(args.number)
   mean = float(args.mean)
@@ -29,9 +41,9 @@ def run():
   while i < imax:
     data = { 'action': 'alert', 'name': args.name, 'id': i, 'expt': args.expt }
     data[args.field] = rng.normal(mean, rms)
-    print(json.dumps(data))
+    emit(data)
     i += 1
-  print(json.dumps({ 'action': 'report', 'name': args.name }))
+  emit({ 'action': 'report', 'name': args.name })
 
 if __name__ == '__main__':
   run()
@@ -7,6 +7,10 @@ Parameters:  number of objects, field, injection name
 
 Generate 'alert' objects.
 Close off with a 'report' object.
+
+With --binary, emit binary frames (see snewpdag.dag.Frames) instead.
+This needs snewpdag to be importable, e.g., run from the root directory as
+  python -m snewpdag.trials.Simple --binary ...
 """
 import sys, argparse, json
 
@@ -14,15 +18,23 @@ def run():
   parser = argparse.ArgumentParser()
   parser.add_argument('name', help='injection name')
   parser.add_argument('-n', '--number', default=1000, help='number of trials')
+  parser.add_argument('--binary', action='store_true',
+                      help='emit binary frames instead of json lines')
   args = parser.parse_args()
 
+  if args.binary:
+    from snewpdag.dag import Frames
+    emit = lambda data: Frames.write_frame(sys.stdout.buffer, data)
+  else:
+    emit = lambda data: print(json.dumps(data))
+
   i = 0
   imax = int(args.number)
   while i < imax:
-    print(json.dumps({ 'action': 'alert', 'id': i, 'name': args.name }))
-    print(json.dumps({ 'action': 'reset', 'id': i, 'name': args.name }))
+    emit({ 'action': 'alert', 'id': i, 'name': args.name })
+    emit({ 'action': 'reset', 'id': i, 'name': args.name })
     i += 1
-  print(json.dumps({ 'action': 'report', 'name': args.name }))
+  emit({ 'action': 'report', 'name': args.name })
 
 if __name__ == '__main__':
   run()
@@ -0,0 +1,41 @@
+"""
+Convert a JSON (or python literal) input file into binary frames.
+
+Numeric list fields (t_low and t_bins, or as given by --array-fields)
+are stored as arrays.  The frames are written to stdout, e.g.,
+  python -m snewpdag.trials.ToFrames snewpdag/data/test-flux-input.json \
+    > flux.frames
+  python -m snewpdag --binary --input flux.frames \
+    snewpdag/data/test-flux-config.json
+"""
+import sys, argparse
+
+from snewpdag.dag import Frames, LineDecoder
+
+def run():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('input', help='input data py/json file')
+  parser.add_argument('--jsonlines', action='store_true',
+                      help='each input line contains one JSON object')
+  parser.add_argument('--array-fields',
+                      help='comma-separated numeric list fields to store as arrays')
+  args = parser.parse_args()
+
+  array_fields = None
+  if args.array_fields is not None:
+    array_fields = [ f.strip() for f in args.array_fields.split(',')
+                     if f.strip() ]
+  decode = LineDecoder(array_fields=array_fields)
+
+  with open(args.input) as f:
+    if args.jsonlines:
+      data = [ decode(line) for line in f if line.strip() ]
+    else:
+      data = decode(f.read())
+  if type(data) is dict:
+    data = [ data ]
+  for d in data:
+    Frames.write_frame(sys.stdout.buffer, d)
+
+if __name__ == '__main__':
+  run()
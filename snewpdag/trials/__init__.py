@@ -1,4 +0,0 @@
-
-from .Normal import Normal
-from .Simple import Simple
-
@@ -1,9 +1,137 @@
 """
 Hist1D - a 1D histogram value with evenly-spaced bins
+
+fill() takes a single value (or an array of values).
+fill_array() bins an array of values in one vectorized pass,
+with the same results as filling them one at a time.
+
+uniform_edges() and histogram_index() bin values exactly as
+np.histogram(x, nbins, (xlow, xhigh)) does, so that several series
+can be binned in one pass (e.g., with np.bincount).
+histogram_counts() gives the bin contents with underflow and overflow
+from one np.bincount, optionally adding them into a given array.
 """
+import sys
 import logging
 import numpy as np
 
+def seq_sum(s, a):
+  """
+  s + a[0] + a[1] + ..., added in order (like repeated s += a[i]),
+  so the result is identical to the one-at-a-time sum.
+  """
+  if len(a) == 0:
+    return s
+  return np.cumsum(np.concatenate(([s], a)))[-1].item()
+
+def chunk_ranges(lens, block=65536):
+  """
+  Split a batch of series with lengths lens into ranges [i, j) of
+  consecutive series holding at most block values in all (a longer series
+  gets a range of its own).  Small series can then be binned together,
+  while large ones are better binned one at a time.
+  """
+  i = 0
+  n = len(lens)
+  while i < n:
+    j = i + 1
+    total = lens[i]
+    while j < n and total + lens[j] <= block:
+      total += lens[j]
+      j += 1
+    yield i, j
+    i = j
+
+def uniform_edges(nbins, xlow, xhigh):
+  """
+  Bin edges (nbins+1 of them) as np.histogram makes them.
+  """
+  return np.linspace(xlow, xhigh, nbins + 1, endpoint=True)
+
+def histogram_index(x, nbins, xlow, xhigh, edges):
+  """
+  Bin index of each value of x, as np.histogram assigns them
+  (the last bin includes the upper edge).
+  Values outside [xlow, xhigh], and nan, get -1.
+  edges:  from uniform_edges()
+  """
+  x = np.asarray(x, dtype=edges.dtype)
+  ix = np.full(x.shape, -1, dtype=np.intp)
+  keep = (x >= xlow) & (x <= xhigh)
+  ix[keep] = in_range_index(x[keep], nbins, xlow, xhigh, edges)
+  return ix
+
+def in_range_index(a, nbins, xlow, xhigh, edges):
+  """
+  Bin index of each value of a, which are all within [xlow, xhigh].
+  """
+  # same arithmetic as np.histogram, including the corrections
+  # for values within an ulp or so of the bin edges
+  f = (a - xlow) / (xhigh - xlow) * nbins
+  i = f.astype(np.intp)
+  i[i == nbins] -= 1
+  i[a < edges[i]] -= 1
+  i[(a >= edges[i + 1]) & (i != nbins - 1)] += 1
+  return i
+
+def histogram_counts(x, nbins, xlow, xhigh, edges, out=None):
+  """
+  Bin contents of x as np.histogram gives them, and the numbers of values
+  below xlow and above xhigh, all from a single np.bincount.
+  nan values aren't counted anywhere.
+  If out (an array of nbins) is given, the contents are added to it
+  in place.
+  Returns (bins, underflow, overflow).
+  """
+  x = np.asarray(x, dtype=edges.dtype).ravel()
+  # code 0 for underflow, 1 for nan, 2..nbins+1 for bins, nbins+2 overflow
+  code = np.ones(x.shape, dtype=np.intp)
+  below = x < xlow
+  above = x > xhigh
+  keep = (x >= xlow) & (x <= xhigh)
+  code[below] = 0
+  code[above] = nbins + 2
+  code[keep] = in_range_index(x[keep], nbins, xlow, xhigh, edges) + 2
+  c = np.bincount(code, minlength=nbins + 3)
+  if out is None:
+    out = c[2:nbins+2]
+  else:
+    out += c[2:nbins+2]
+  return out, int(c[0]), int(c[nbins+2])
+
+def fill_array(h, x, weight=1.0):
+  """
+  Fill histogram h with an array of values x (and weights).
+  h is anything with nbins, xlow, xhigh, bins, underflow, overflow,
+  sum, sum2 attributes (e.g., a Hist1D or a plugins.Histogram1D).
+  As in the one-at-a-time fill, a value is binned with int() of its
+  scaled position, and values which can't be binned (nan, inf) are skipped.
+  The caller updates the count.
+  Returns the weights of the values which were filled.
+  """
+  x = np.asarray(x, dtype=np.float64).ravel()
+  w = np.broadcast_to(np.asarray(weight, dtype=np.float64), x.shape)
+  with np.errstate(all='ignore'):
+    v = h.nbins * (x - h.xlow) / (h.xhigh - h.xlow)
+  ok = np.isfinite(v)
+  if not ok.all():
+    logging.info('Hist1D: {} values could not be binned'.format(
+                 len(x) - np.count_nonzero(ok)))
+    x = x[ok]
+    v = v[ok]
+    w = w[ok]
+  ix = np.trunc(v) # int() truncates towards zero
+  under = ix < 0
+  over = ix >= h.nbins
+  inside = ~(under | over)
+  h.underflow = seq_sum(h.underflow, w[under])
+  h.overflow = seq_sum(h.overflow, w[over])
+  h.bins += np.bincount(ix[inside].astype(np.intp), weights=w[inside],
+                        minlength=h.nbins)
+  h.sum = seq_sum(h.sum, x)
+  h.sum2 = seq_sum(h.sum2, x*x)
+  return w
+
 class Hist1D:
   def __init__(self, nbins, xlow, xhigh):
     self.nbins = nbins
@@ -40,6 +168,9 @@ class Hist1D:
       return False
 
   def fill(self, x, weight=1.0):
+    if np.ndim(x) > 0:
+      self.fill_array(x, weight)
+      return
     try:
       ix = int(self.nbins * (x - self.xlow) / self.xwidth)
     except:
@@ -55,6 +186,13 @@ class Hist1D:
     self.sum2 += x*x
     self.count += weight
 
+  def fill_array(self, x, weight=1.0):
+    """
+    Fill with an array of values (and weights, scalar or array).
+    """
+    w = fill_array(self, x, weight)
+    self.count = seq_sum(self.count, w)
+
   def mean(self):
     return self.sum / self.count
 
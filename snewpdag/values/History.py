@@ -1,27 +1,44 @@
 """
 History - a history object. Mostly for defining operations.
+
+The history is stored as a linked list of (item, previous) pairs,
+most recent item first, so copy() and append() are O(1) and copies
+share their common past.
 """
 import logging
 
 class History:
   def __init__(self, val = []):
-    self.val = list(val)
+    self.head = None
+    for item in val:
+      self.append(item)
 
   def copy(self):
     o = History()
-    o.val = self.val.copy()
+    o.head = self.head
     return o
 
   def clear(self):
-    self.val = []
+    self.head = None
 
   # append a string to the history
   def append(self, item):
-    self.val.append(item)
+    self.head = (item, self.head)
 
   # replace history with a single item which is a list of History objects
   def combine(self, hists):
-    self.val = [ tuple( h.emit() for h in hists ) ]
+    self.head = (tuple( h.emit() for h in hists ), None)
+
+  # items as a list, oldest first
+  @property
+  def val(self):
+    items = []
+    node = self.head
+    while node:
+      items.append(node[0])
+      node = node[1]
+    items.reverse()
+    return items
 
   # emit as a tuple
   def emit(self):
@@ -29,11 +46,10 @@ class History:
     return t
 
   def last(self):
-    if len(self.val) > 0:
-      return self.val[-1]
+    if self.head:
+      return self.head[0]
     else:
       return None
 
   def __str__(self):
     return str(self.emit())
-
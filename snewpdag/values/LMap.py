@@ -2,44 +2,84 @@
 LMap - a skymap of likelihoods.
 
 The map will stored in self.map, and is in nested order.
+
+With log=True, the map holds log-likelihoods as float32 values instead,
+and maps are combined by adding them (and can be uncombined by
+subtracting them), so the product of many maps doesn't underflow.
 """
 import logging
 import numbers
-import collections
+import collections.abc
 import numpy as np
 import healpy as hp
 
 class LMap:
-  def __init__(self, a=0):
+  def __init__(self, a=0, log=False):
+    self.log = log
     if isinstance(a, numbers.Number):
       if a == 0:
-        self.map = np.ones(hp.nside2npix(2)) # placeholder
+        self.map = self.blank(hp.nside2npix(2)) # placeholder
       else:
         # interpret as nside
-        self.map = np.ones(hp.nside2npix(a))
-    elif isinstance(a, (collections.Sequence, np.ndarray)):
-      self.map = np.array(a)
+        self.map = self.blank(hp.nside2npix(a))
+    elif isinstance(a, (collections.abc.Sequence, np.ndarray)):
+      self.map = np.array(a, dtype=np.float32) if log else np.array(a)
     else:
       logging.error('LMap.__init__: unrecognized type')
-      self.map = np.ones(hp.nside2npix(2)) # placeholder
+      self.map = self.blank(hp.nside2npix(2)) # placeholder
+
+  def blank(self, npix):
+    """
+    Map of likelihood 1 everywhere.
+    """
+    return np.zeros(npix, dtype=np.float32) if self.log else np.ones(npix)
 
   def clear(self):
-    self.map = np.ones(len(self.map))
+    self.map = self.blank(len(self.map))
 
   def copy(self):
-    return LMap(self.map.copy())
+    return LMap(self.map.copy(), self.log)
 
-  def combine(self, other):
+  def nside(self):
+    return hp.npix2nside(len(self.map))
+
+  def regrade(self, other):
+    """
+    Bring this map and other (an array) to the finer of the two
+    pixellations, and return other at that pixellation.
+    """
     if len(self.map) > len(other):
-      nside = hp.npix2nside(len(self.map))
-      ma = hp.ud_grade(np.array(other), nside,
-                       order_in='NESTED', outer_out='NESTED')
+      ma = hp.ud_grade(np.array(other), self.nside(),
+                       order_in='NESTED', order_out='NESTED')
     elif len(self.map) < len(other):
       nside = hp.npix2nside(len(other))
       self.map = hp.ud_grade(np.array(self.map), nside,
-                             order_in='NESTED', outer_out='NESTED')
-      ma = other
+                             order_in='NESTED', order_out='NESTED')
+      ma = np.array(other)
     else:
       ma = np.array(other)
-    self.map *= ma
+    if self.log:
+      self.map = self.map.astype(np.float32, copy=False)
+      ma = ma.astype(np.float32, copy=False)
+    return ma
+
+  def combine(self, other):
+    """
+    Multiply in the likelihoods of other (an array, in the same
+    representation as this map), i.e. add them if log.
+    """
+    ma = self.regrade(other)
+    if self.log:
+      self.map += ma
+    else:
+      self.map *= ma
+
+  def uncombine(self, other):
+    """
+    Undo combine(other) of a log map, by subtracting other.
+    """
+    if not self.log:
+      logging.error('LMap.uncombine: only supported for log maps')
+      return
+    self.map -= self.regrade(other)
 
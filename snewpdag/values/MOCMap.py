@@ -0,0 +1,187 @@
+"""
+MOCMap - a sparse, multi-order skymap of likelihoods.
+
+The sky is covered by healpix cells of different orders
+(order o has nside 2**o, and the cells are in nested order),
+like a MOC (multi-order coverage map): cells with likelihoods above a
+threshold are kept at the full resolution, and the rest are merged into
+coarser cells.  A cell's value applies to every point within it.
+
+The cells are stored as arrays self.order, self.ipix and self.value,
+sorted by position along the nested ordering, and together they always
+cover the whole sky.  Each cell is also a range [start, end) of pixel
+indices at MAX_ORDER, which is how two maps are lined up in combine().
+
+With log=True, values are float32 log-likelihoods, combined by addition,
+as in LMap.
+"""
+import logging
+import numpy as np
+import healpy as hp
+
+from .LMap import LMap
+
+MAX_ORDER = 29 # finest healpix order (nside 2**29)
+NRANGE = 12 << (2 * MAX_ORDER) # number of pixels at MAX_ORDER
+
+class MOCMap:
+  def __init__(self, order, ipix, value, log=False):
+    """
+    order, ipix, value: arrays of the cells, covering the whole sky
+    and sorted by position (as made by the other methods).
+    """
+    self.log = log
+    self.order = np.asarray(order, dtype=np.int8)
+    self.ipix = np.asarray(ipix, dtype=np.int64)
+    self.value = np.asarray(value, dtype=np.float32 if log else float)
+
+  @classmethod
+  def from_dense(cls, a, threshold, log=False, min_order=0):
+    """
+    Make a map from a dense nested array (or LMap), keeping cells with
+    value >= threshold at full resolution, and merging the others into
+    cells down to order min_order.  Merged cells take the mean value.
+    (For a log map, threshold is a log-likelihood.)
+    """
+    if isinstance(a, LMap):
+      log = a.log
+      a = a.map
+    a = np.asarray(a)
+    top = hp.nside2order(hp.npix2nside(len(a)))
+    # hold: cells which have a descendant at or above threshold,
+    # so are split (or kept, at the top order)
+    hold = a >= threshold
+    split = np.zeros(len(a), dtype=bool)
+    orders, ipixs, values = [], [], []
+    for o in range(top, min_order - 1, -1):
+      if o > min_order:
+        parent_hold = hold.reshape(-1, 4).any(axis=1)
+        emit = np.repeat(parent_hold, 4) & ~split
+      else:
+        emit = ~split
+      ipix = np.flatnonzero(emit)
+      orders.append(np.full(len(ipix), o))
+      ipixs.append(ipix)
+      values.append(a[ipix])
+      if o > min_order:
+        a = a.reshape(-1, 4).mean(axis=1)
+        hold = split = parent_hold
+    m = cls(np.concatenate(orders), np.concatenate(ipixs),
+            np.concatenate(values), log)
+    m.insert(slice(None), [], [], []) # sort
+    return m
+
+  def copy(self):
+    return MOCMap(self.order.copy(), self.ipix.copy(), self.value.copy(),
+                  self.log)
+
+  def __len__(self):
+    return len(self.value)
+
+  def max_order(self):
+    return int(self.order.max())
+
+  def nside(self):
+    return hp.order2nside(self.max_order())
+
+  def uniq(self):
+    """
+    NUNIQ index of each cell: 4 * nside**2 + ipix.
+    """
+    return (np.int64(4) << (2 * self.order.astype(np.int64))) + self.ipix
+
+  def ranges(self):
+    """
+    Start of each cell at MAX_ORDER (the end is the next start).
+    """
+    return self.ipix << (2 * (MAX_ORDER - self.order.astype(np.int64)))
+
+  def to_dense(self, nside=None):
+    """
+    Dense nested array at nside (default the finest order present).
+    Coarser cells are upgraded, finer ones averaged (as ud_grade does).
+    """
+    top = self.max_order() if nside is None else hp.nside2order(nside)
+    a = np.zeros(hp.nside2npix(hp.order2nside(top)), dtype=self.value.dtype)
+    for o in np.unique(self.order):
+      sel = self.order == o
+      d = 2 * abs(top - int(o))
+      if o <= top:
+        idx = (self.ipix[sel, np.newaxis] << d) + np.arange(1 << d)
+        a[idx] = self.value[sel, np.newaxis]
+      else:
+        np.add.at(a, self.ipix[sel] >> d, self.value[sel] / (1 << d))
+    return a
+
+  def to_lmap(self, nside=None):
+    return LMap(self.to_dense(nside), self.log)
+
+  def coarsen(self, threshold, min_order=0):
+    """
+    Merge each group of 4 sibling cells which are all below threshold
+    into their parent cell (with the mean value), down to min_order.
+    """
+    for o in range(self.max_order(), min_order, -1):
+      at = self.order == o
+      if not at.any():
+        continue
+      parent, inv, cnt = np.unique(self.ipix[at] >> 2, return_inverse=True,
+                                   return_counts=True)
+      below = (self.value[at] < threshold).astype(float)
+      nbelow = np.bincount(inv, weights=below)
+      merge = (cnt == 4) & (nbelow == 4)
+      if not merge.any():
+        continue
+      sums = np.bincount(inv, weights=self.value[at])
+      drop = np.zeros(len(at), dtype=bool)
+      drop[at] = merge[inv]
+      self.insert(~drop, np.full(merge.sum(), o - 1), parent[merge],
+                  sums[merge] / 4)
+
+  def insert(self, keep, order, ipix, value):
+    # keep the selected cells, add the new ones, and sort by position
+    self.order = np.concatenate((self.order[keep], order)).astype(np.int8)
+    self.ipix = np.concatenate((self.ipix[keep], ipix)).astype(np.int64)
+    self.value = np.concatenate((self.value[keep], value)).astype(
+                   self.value.dtype)
+    s = np.argsort(self.ranges(), kind='stable')
+    self.order = self.order[s]
+    self.ipix = self.ipix[s]
+    self.value = self.value[s]
+
+  def lineup(self, other):
+    """
+    Split the cells of this map and other (a MOCMap) into their common
+    refinement, i.e. the finer of the two cells everywhere.
+    Return the values of this map and of other on the new cells.
+    Since cells either nest or are disjoint, each new cell is a cell
+    of one of the two maps.
+    """
+    s1 = self.ranges()
+    s2 = other.ranges()
+    starts = np.union1d(s1, s2)
+    length = np.diff(np.append(starts, NRANGE))
+    d = np.round(np.log2(length)).astype(np.int64) # lengths are powers of 4
+    v1 = self.value[np.searchsorted(s1, starts, side='right') - 1]
+    v2 = other.value[np.searchsorted(s2, starts, side='right') - 1]
+    self.order = (MAX_ORDER - d // 2).astype(np.int8)
+    self.ipix = starts >> d
+    return v1, v2.astype(v1.dtype, copy=False)
+
+  def combine(self, other):
+    """
+    Multiply in the likelihoods of other (a MOCMap in the same
+    representation), i.e. add them if log.
+    """
+    v1, v2 = self.lineup(other)
+    self.value = v1 + v2 if self.log else v1 * v2
+
+  def uncombine(self, other):
+    """
+    Undo combine(other) of a log map, by subtracting other.
+    """
+    if not self.log:
+      logging.error('MOCMap.uncombine: only supported for log maps')
+      return
+    v1, v2 = self.lineup(other)
+    self.value = v1 - v2
@@ -0,0 +1,172 @@
+"""
+Payload - a layered, copy-on-write payload dictionary.
+
+A Payload is a dict holding only the fields written by the node which
+owns it, on top of a tuple of read-only parent layers (like
+collections.ChainMap).  Reads fall through to the parent layers.
+Layering a new Payload over an existing one snapshots only the top
+(locally written) layer of the old one and shares everything underneath
+by reference, so a node can take its "local copy" of an incoming payload
+without copying every field at every hop.
+
+Later writes to the old Payload are not seen by the new one.
+The stack of parent layers is flattened into a single dictionary when
+it gets deeper than max_depth, so the memory held by an in-flight
+payload doesn't grow with the depth of the DAG.
+
+As before, the objects stored in the payload are shared, not copied,
+so mutable values (lists, arrays, dicts) shouldn't be modified in place.
+"""
+import sys
+from collections.abc import Mapping
+import numpy as np
+
+class Payload(dict):
+  max_depth = 8 # number of parent layers before flattening
+
+  def __init__(self, data=None):
+    """
+    data: a Payload (to layer over), or any mapping (used as the base
+          layer, and never modified), or None for an empty payload.
+    """
+    # (no need for dict.__init__, since the layer starts empty)
+    if isinstance(data, Payload):
+      top = dict(dict.items(data))
+      parents = ((top,) if top else ()) + data.parents
+      if len(parents) > self.max_depth:
+        parents = (data.flatten(),)
+    elif data:
+      parents = (data,)
+    else:
+      parents = ()
+    self.parents = parents
+
+  def flatten(self):
+    """
+    Return the contents as a single plain dictionary.
+    """
+    d = {}
+    for m in reversed(self.parents):
+      d.update(m)
+    d.update(dict.items(self))
+    return d
+
+  def materialize(self):
+    """
+    Pull all the parent fields into this layer.
+    Needed before deleting fields.
+    """
+    if self.parents:
+      d = self.flatten()
+      dict.clear(self)
+      dict.update(self, d)
+      self.parents = ()
+
+  def copy(self):
+    return Payload(self)
+
+  def __missing__(self, key):
+    for m in self.parents:
+      if key in m:
+        return m[key]
+    raise KeyError(key)
+
+  def get(self, key, default=None):
+    if dict.__contains__(self, key):
+      return dict.__getitem__(self, key)
+    for m in self.parents:
+      if key in m:
+        return m[key]
+    return default
+
+  def __contains__(self, key):
+    if dict.__contains__(self, key):
+      return True
+    for m in self.parents:
+      if key in m:
+        return True
+    return False
+
+  def __delitem__(self, key):
+    self.materialize()
+    dict.__delitem__(self, key)
+
+  def pop(self, key, *default):
+    self.materialize()
+    return dict.pop(self, key, *default)
+
+  def popitem(self):
+    self.materialize()
+    return dict.popitem(self)
+
+  def setdefault(self, key, default=None):
+    if key in self:
+      return self[key]
+    self[key] = default
+    return default
+
+  def clear(self):
+    dict.clear(self)
+    self.parents = ()
+
+  def keys(self):
+    return self.flatten().keys()
+
+  def values(self):
+    return self.flatten().values()
+
+  def items(self):
+    return self.flatten().items()
+
+  def __iter__(self):
+    return iter(self.flatten())
+
+  def __len__(self):
+    return len(self.flatten())
+
+  def __eq__(self, other):
+    if isinstance(other, Payload):
+      other = other.flatten()
+    return self.flatten() == other
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __or__(self, other):
+    d = self.flatten()
+    d.update(other)
+    return d
+
+  def __repr__(self):
+    return 'Payload({})'.format(self.flatten())
+
+  def __reduce__(self):
+    return (Payload, (self.flatten(),))
+
+def payload_nbytes(data, seen=None):
+  """
+  Estimate the memory held by the values of a payload (in bytes).
+  numpy arrays count their data, containers and objects are followed.
+  seen: set of ids of objects already counted, which is updated,
+        so an object shared by several payloads is only counted once.
+  """
+  if seen is None:
+    seen = set()
+  return sum( _nbytes(v, seen) for v in data.values() )
+
+def _nbytes(v, seen):
+  if id(v) in seen:
+    return 0
+  seen.add(id(v))
+  if isinstance(v, np.ndarray):
+    # getsizeof includes the data if the array owns it;
+    # for a view, count the array it's a view of.
+    return sys.getsizeof(v) + \
+           (_nbytes(v.base, seen) if v.base is not None else 0)
+  if isinstance(v, Mapping):
+    return sys.getsizeof(v) + payload_nbytes(v, seen)
+  if isinstance(v, (list, tuple, set, frozenset)):
+    return sys.getsizeof(v) + sum( _nbytes(x, seen) for x in v )
+  if hasattr(v, '__dict__'):
+    return sys.getsizeof(v) + payload_nbytes(vars(v), seen)
+  return sys.getsizeof(v)
@@ -1,5 +1,7 @@
 
 from .History import History
+from .Payload import Payload
 from .Hist1D import Hist1D
 from .LMap import LMap
+from .MOCMap import MOCMap
 